@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from models import db, Attendance
+from database import BUCKET_FORMATS, date_bucket
+
+# strftime format of the keys date_bucket() returns; weeks are keyed by their Monday
+GRANULARITIES = {granularity: key_format for granularity, (_, key_format) in BUCKET_FORMATS.items()}
+GRANULARITIES['week'] = BUCKET_FORMATS['day'][1]
+
+# Most buckets one histogram may hold; every one is zero-filled in Python
+MAX_BUCKETS = 1000
+
+DEFAULT_LABELS = {
+    'hour': '%H:00',
+    'day': '%d %b',
+    'week': '%d %b',
+    'month': '%b %Y',
+}
+
+
+def bucket_start(moment, granularity):
+    """Truncate a datetime to the start of its bucket"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        # Weeks start on Monday
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    raise ValueError(f'Unknown granularity: {granularity}')
+
+
+def next_bucket(moment, granularity):
+    """Return the start of the bucket following the one starting at moment"""
+    if granularity == 'hour':
+        return moment + timedelta(hours=1)
+    if granularity == 'day':
+        return moment + timedelta(days=1)
+    if granularity == 'week':
+        return moment + timedelta(weeks=1)
+    if granularity == 'month':
+        if moment.month == 12:
+            return moment.replace(year=moment.year + 1, month=1)
+        return moment.replace(month=moment.month + 1)
+    raise ValueError(f'Unknown granularity: {granularity}')
+
+
+def bucket_count(start, end, granularity):
+    """Number of buckets attendance_histogram() returns for [start, end)"""
+    first = bucket_start(start, granularity)
+    if granularity == 'month':
+        months = (end.year - first.year) * 12 + end.month - first.month
+        # A range ending after the 1st reaches into one more month
+        return months + (end > bucket_start(end, 'month'))
+    size = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[granularity]
+    return max(0, -(-(end - first) // size))
+
+
+def check_bucket_count(start, end, granularity):
+    """Raise ValueError when [start, end) holds more than MAX_BUCKETS buckets"""
+    if bucket_count(start, end, granularity) > MAX_BUCKETS:
+        raise ValueError(f'Plage trop longue: au plus {MAX_BUCKETS} intervalles, choisissez une granularité plus large.')
+
+
+def bucket_expression(column, granularity):
+    """SQL expression mapping a datetime column to its bucket key"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity: {granularity}')
+    return date_bucket(column, granularity)
+
+
+def attendance_histogram(start, end, granularity='day', filters=()):
+    """Count check-ins per bucket in [start, end) with a single GROUP BY query.
+
+    Returns a list of (bucket_start, count) tuples covering every bucket in
+    the range, with missing buckets filled with zero. Ranges of more than
+    MAX_BUCKETS buckets raise ValueError.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity: {granularity}')
+    check_bucket_count(start, end, granularity)
+
+    bucket = bucket_expression(Attendance.check_in, granularity)
+    rows = db.session.query(bucket, func.count(Attendance.id)).filter(
+        Attendance.check_in >= start,
+        Attendance.check_in < end,
+        *filters
+    ).group_by(bucket).all()
+    counts = {key: count for key, count in rows}
+
+    histogram = []
+    current = bucket_start(start, granularity)
+    while current < end:
+        key = current.strftime(GRANULARITIES[granularity])
+        histogram.append((current, counts.get(key, 0)))
+        current = next_bucket(current, granularity)
+    return histogram
+
+
+def period_range(period, now=None):
+    """Return (start, end, granularity, label_format) for a named period"""
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if period == 'day':
+        return today, today + timedelta(days=1), 'hour', '%H:00'
+    if period == 'week':
+        return today - timedelta(days=6), today + timedelta(days=1), 'day', '%A'
+    if period == 'month':
+        start = today.replace(day=1)
+        return start, next_bucket(start, 'month'), 'day', '%d %b'
+    if period == 'year':
+        start = today.replace(month=1, day=1)
+        return start, start.replace(year=start.year + 1), 'month', '%b'
+    raise ValueError(f'Unknown period: {period}')
@@ -1,112 +1,213 @@
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, abort
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.utils import secure_filename
 import os
-from models import db, User, Employee, Attendance
-import qrcode
-from sqlalchemy import func, or_
+from models import db, User, Employee, Attendance, DailyAttendanceSummary, ScanEvent, FaceEncoding, AttendanceChange, Setting
+from migrations import upgrade_schema, check_schema
+from cache_stamp import ChangeStamp
+from database import database_uri, sqlite_path, engine_options, apply_sqlite_pragmas
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from qr_cache import QRCache
+from qr_images import QRImageCache, QR_FORMATS, qr_digest
+from dashboard_metrics import DashboardMetrics
+from employee_import import ImportFileError, read_rows, import_employees
+from badge_sheet import badge_sheet_pdf
+from attendance_feed import AttendanceFeed, attendance_record, record_change, last_change_id, prune_changes
+from config_service import ConfigService
+from backup_engine import BackupEngine, BackupError
+from reports import EXPORT_FORMATS, report_query, serialize_report_row, export_rows
+from pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, REPORT_PAGE_SIZE, MAX_REPORT_PAGE_SIZE,
+                        keyset_page, offset_page)
+from analytics import GRANULARITIES, DEFAULT_LABELS, attendance_histogram, check_bucket_count, period_range
+import hashlib
 import json
-import base64
-from io import BytesIO
-from PIL import Image
-# Make face recognition optional
-try:
-    import face_recognition
-    FACE_RECOGNITION_ENABLED = True
-except ImportError:
-    FACE_RECOGNITION_ENABLED = False
-    print("Face recognition is not available")
-import shutil
-import sqlite3
-from apscheduler.schedulers.background import BackgroundScheduler
+from face_service import (FACE_RECOGNITION_ENABLED, MATCH_TOLERANCE, AMBIGUITY_MARGIN, MAX_DIMENSION,
+                          DETECT_DIMENSION, FaceEncodingCache, encode_snapshot, face_distance)
+from face_pool import FaceWorkerPool, PoolSaturated, JobTimeout
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from scheduler_service import JobScheduler
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = '0667akk7'  # Change this to a secure secret key
 
-# Set up database path
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'attendance.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+# Set up database path; DATABASE_URL (e.g. postgresql://...) selects another backend
+DB_PATH = os.environ.get('DB_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'attendance.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(DB_PATH)
+# Backups, restores and the settings table work on the SQLite file directly
+USING_SQLITE = sqlite_path(app.config['SQLALCHEMY_DATABASE_URI']) is not None
+if USING_SQLITE:
+    DB_PATH = sqlite_path(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# WAL, pragmas and connection pooling; SQLITE_TUNING=0 restores the driver defaults
+app.config['SQLITE_TUNING'] = os.environ.get('SQLITE_TUNING', '1') != '0'
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'],
+                                                         tuned=app.config['SQLITE_TUNING'])
 app.config['UPLOAD_FOLDER'] = os.path.join(app.static_folder)
+app.config['QR_CACHE_SIZE'] = int(os.environ['QR_CACHE_SIZE']) if os.environ.get('QR_CACHE_SIZE') else None
+# Rendered QR images kept in memory per worker (all of them stay on disk)
+app.config['QR_IMAGE_CACHE_SIZE'] = int(os.environ.get('QR_IMAGE_CACHE_SIZE', 256))
+app.config['FACE_POOL_WORKERS'] = int(os.environ.get('FACE_POOL_WORKERS', 2))
+app.config['FACE_POOL_MAX_PENDING'] = int(os.environ.get('FACE_POOL_MAX_PENDING', 8))
+app.config['FACE_JOB_TIMEOUT'] = float(os.environ.get('FACE_JOB_TIMEOUT', 15))
+app.config['FACE_MAX_DIMENSION'] = int(os.environ.get('FACE_MAX_DIMENSION', MAX_DIMENSION))
+app.config['FACE_DETECT_DIMENSION'] = int(os.environ.get('FACE_DETECT_DIMENSION', DETECT_DIMENSION))
+# Processes hashing initial passwords during bulk imports (default: one per CPU)
+app.config['IMPORT_WORKERS'] = int(os.environ['IMPORT_WORKERS']) if os.environ.get('IMPORT_WORKERS') else None
+# Processes preparing badge sheet pages (default: one per CPU)
+app.config['BADGE_WORKERS'] = int(os.environ['BADGE_WORKERS']) if os.environ.get('BADGE_WORKERS') else None
+# Open /stream/attendance connections per worker; each one holds a server
+# thread, so keep this below gunicorn's --threads (16 in the Dockerfile)
+app.config['ATTENDANCE_FEED_MAX_STREAMS'] = int(os.environ.get('ATTENDANCE_FEED_MAX_STREAMS', 8))
+# Seconds a worker may serve its cached dashboard figures (scans refresh them sooner)
+app.config['DASHBOARD_CACHE_TTL'] = float(os.environ.get('DASHBOARD_CACHE_TTL', 10))
 
 # Ensure instance directory exists with proper permissions
 instance_path = os.path.dirname(DB_PATH)
 os.makedirs(instance_path, mode=0o777, exist_ok=True)
 
 # Touch the database file to ensure it exists with proper permissions
-if not os.path.exists(DB_PATH):
+if USING_SQLITE and not os.path.exists(DB_PATH):
     with open(DB_PATH, 'a') as f:
         pass
     os.chmod(DB_PATH, 0o666)
 
 # Initialize Flask extensions
 db.init_app(app)
+if app.config['SQLITE_TUNING']:
+    with app.app_context():
+        apply_sqlite_pragmas(db.engine)
 
 # Create backup directory if it doesn't exist
 BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backup')
 os.makedirs(BACKUP_DIR, mode=0o777, exist_ok=True)
-
-# Initialize scheduler
-scheduler = BackgroundScheduler()
-scheduler.start()
+backup_engine = BackupEngine(DB_PATH, BACKUP_DIR)
+
+# Cached config.json access, reloaded only when the file changes
+config = ConfigService(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'))
+
+# QR code -> employee lookup cache, shared by every request in this worker
+qr_cache = QRCache(maxsize=app.config['QR_CACHE_SIZE'],
+                   stamp_path=os.path.join(instance_path, 'qr_cache.stamp'))
+
+# QR code images, rendered on first request and cached by content hash
+qr_images = QRImageCache(os.path.join(instance_path, 'qr_images'), maxsize=app.config['QR_IMAGE_CACHE_SIZE'])
+
+# Face detection/encoding runs in worker processes, not in the request thread
+face_pool = FaceWorkerPool(max_workers=app.config['FACE_POOL_WORKERS'],
+                           max_pending=app.config['FACE_POOL_MAX_PENDING'],
+                           timeout=app.config['FACE_JOB_TIMEOUT'])
+
+# Profile face encodings, computed once per uploaded photo
+face_cache = FaceEncodingCache(app.config['UPLOAD_FOLDER'],
+                               stamp_path=os.path.join(instance_path, 'face_cache.stamp'),
+                               max_dimension=app.config['FACE_MAX_DIMENSION'],
+                               detect_dimension=app.config['FACE_DETECT_DIMENSION'],
+                               runner=face_pool.run)
+
+# Dashboard KPIs, recomputed at most every DASHBOARD_CACHE_TTL seconds per worker
+dashboard_metrics = DashboardMetrics(ttl=app.config['DASHBOARD_CACHE_TTL'],
+                                     stamp_path=os.path.join(instance_path, 'dashboard.stamp'))
+
+# Check-ins/check-outs pushed to /stream/attendance clients of this worker
+attendance_feed = AttendanceFeed(app, poll_interval=float(os.environ.get('ATTENDANCE_FEED_POLL', 1.0)),
+                                 max_subscribers=app.config['ATTENDANCE_FEED_MAX_STREAMS'])
+
+# Touched after a restore so every worker reopens its database connections
+db_generation = ChangeStamp(os.path.join(instance_path, 'db_generation.stamp'))
+
+@app.before_request
+def reopen_database_after_restore():
+    if db_generation.changed():
+        db.session.remove()
+        db.engine.dispose()
+        attendance_feed.reset()
+
+def backfill_daily_summary():
+    """Build the daily rollup of a database created (or backed up) before it existed"""
+    if not DailyAttendanceSummary.query.first() and Attendance.query.first():
+        return DailyAttendanceSummary.rebuild(in_time=config.in_time)
+    return 0
 
 # Initialize database
 with app.app_context():
-    db.create_all()
+    upgrade_schema(db.engine)
+    backfill_daily_summary()
+    qr_cache.warm()
+    face_cache.warm()
+
+def get_retention_days():
+    try:
+        with app.app_context():
+            return int(Setting.get('retention_period', 30))
+    except Exception:
+        return 30
 
-def create_backup_file():
+def create_backup_file(mode='auto'):
     """Create a backup of the database"""
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_filename = f'database_backup_{timestamp}.db'
-    backup_path = os.path.join(BACKUP_DIR, backup_filename)
-    
-    # Create backup by copying the database file
+    # Online backup API snapshot, compressed; incremental when a recent full exists
+    if not USING_SQLITE:
+        print("Backup skipped: only SQLite databases are backed up here, use pg_dump for other backends")
+        return None
     try:
-        shutil.copy2(DB_PATH, backup_path)
+        manifest = backup_engine.create(mode)
         cleanup_old_backups()
-        return backup_path
+        return os.path.join(BACKUP_DIR, manifest['data_file'])
     except Exception as e:
         print(f"Backup failed: {str(e)}")
         return None
 
 def cleanup_old_backups():
     """Remove backups older than retention period"""
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT value FROM settings WHERE key = "retention_period"')
-            result = cursor.fetchone()
-            retention_days = int(result[0]) if result else 30
-    except:
-        retention_days = 30
-
-    cutoff_date = datetime.now() - timedelta(days=retention_days)
-    
-    for filename in os.listdir(BACKUP_DIR):
-        if filename.startswith('database_backup_'):
-            file_path = os.path.join(BACKUP_DIR, filename)
-            # Parse the timestamp from filename (YYYYMMDD_HHMMSS)
-            timestamp_str = filename.replace('database_backup_', '').replace('.db', '')
-            file_date = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
-            if file_date < cutoff_date:
-                os.remove(file_path)
-
-def schedule_backup(frequency='daily'):
-    """Schedule automatic backups"""
-    # Remove existing backup jobs
-    for job in scheduler.get_jobs():
-        if job.id == 'backup_job':
-            scheduler.remove_job('backup_job')
-    
-    # Schedule new backup job
-    if frequency == 'daily':
-        scheduler.add_job(create_backup_file, 'interval', days=1, id='backup_job')
-    elif frequency == 'weekly':
-        scheduler.add_job(create_backup_file, 'interval', weeks=1, id='backup_job')
-    elif frequency == 'monthly':
-        scheduler.add_job(create_backup_file, 'interval', days=30, id='backup_job')
+    backup_engine.cleanup(get_retention_days())
+
+def run_cleanup():
+    """Daily housekeeping: expired backups and the live feed's change log"""
+    cleanup_old_backups()
+    with app.app_context():
+        prune_changes()
+
+def department_out_times():
+    """{department: out time} from config.json's optional departmentOutTimes"""
+    return {department: datetime.strptime(value, "%H:%M:%S").time()
+            for department, value in (config.get('departmentOutTimes') or {}).items()}
+
+def run_auto_close():
+    """Close the sessions of previous days that were never checked out"""
+    with app.app_context():
+        closed = Attendance.auto_close(config.in_time, config.out_time, department_out_times())
+        if closed:
+            print(f"Auto-closed {closed} open attendance sessions")
+
+def run_rollup():
+    """Recompute the last week of daily summaries, in case a write path missed them"""
+    with app.app_context():
+        DailyAttendanceSummary.rebuild(in_time=config.in_time, since=datetime.now().date() - timedelta(days=7))
+
+BACKUP_TRIGGERS = {
+    'daily': IntervalTrigger(days=1),
+    'weekly': IntervalTrigger(weeks=1),
+    'monthly': IntervalTrigger(days=30),
+}
+
+def scheduled_jobs():
+    """Jobs the scheduler leader should run, from the current settings"""
+    jobs = {
+        'cleanup': (run_cleanup, CronTrigger(hour=3, minute=0)),
+        'rollup': (run_rollup, CronTrigger(hour=2, minute=30)),
+        'auto_close': (run_auto_close, CronTrigger(hour=0, minute=15)),
+    }
+    frequency = Setting.get('backup_frequency', 'daily')
+    if frequency in BACKUP_TRIGGERS:
+        jobs['backup'] = (create_backup_file, BACKUP_TRIGGERS[frequency])
+    return jobs
+
+# One process among the workers runs the jobs. Started by the serving entry points
+# (main.py, wsgi.py, app.py) only, so scripts importing app don't compete for it
+job_scheduler = JobScheduler(app, lambda: db.engine, scheduled_jobs,
+                             lock_path=os.path.join(instance_path, 'scheduler.lock'))
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -188,47 +289,78 @@ def general():
         return redirect(url_for('profile'))
     
     if request.method == 'POST':
-        with open('config.json') as config_file:
-            config_data = json.load(config_file)
-        if request.get_json().get('face-recg', False):
-            config_data['face-recg'] = True
-        else:
-            config_data['face-recg'] = False
-
-        # print(request.get_json())
-        with open('config.json', 'w') as config_file:
-            json.dump(config_data, config_file, indent=4)
+        config_data = config.update({'face-recg': bool(request.get_json().get('face-recg', False))})
         
         return jsonify({"success":True, "face-recg":config_data['face-recg']}), 200
 
-    with open('config.json') as config_file:
-        config_data = json.load(config_file)
-    face_recg_enabled = config_data.get('face-recg', False)
+    face_recg_enabled = config.get('face-recg', False)
     print("Face Recognition:", face_recg_enabled)
-    attendance_data = []
+    # Rows are fetched page by page from /api/attendance as the table scrolls
+    return render_template('general.html', face_recg_enabled=face_recg_enabled,
+                           page_size=DEFAULT_PAGE_SIZE)
 
-    attendances = Attendance.query.all()
-    
-    for attendance in attendances:
-        employee = attendance.employee
-        if attendance.check_out:
-            total_hours = (attendance.check_out - attendance.check_in).total_seconds() / 3600
-            total_hours_str = f"{int(total_hours)}:{int((total_hours % 1) * 60):02d}"
-        else:
-            total_hours_str = None
-        
-        attendance_data.append({
-            "employee": employee.full_name,
-            "photo": employee.photo,
-            "id": employee.pluri_id,
-            "department": employee.department,
-            "check_in": attendance.check_in.strftime('%I:%M %p'),
-            "face_validation": True,  # Default to True since it's not in the table
-            "check_out": attendance.check_out.strftime('%I:%M %p') if attendance.check_out else None,
-            "total_hours": total_hours_str,
-            "status": "Terminé" if attendance.check_out else "En cours",
-        })
-    return render_template('general.html', face_recg_enabled=face_recg_enabled, attendance_data=attendance_data)
+
+def serialize_attendance(attendance):
+    employee = attendance.employee
+    if attendance.check_out:
+        total_hours = (attendance.check_out - attendance.check_in).total_seconds() / 3600
+        total_hours_str = f"{int(total_hours)}:{int((total_hours % 1) * 60):02d}"
+    else:
+        total_hours_str = None
+
+    return {
+        "employee": employee.full_name,
+        "photo": employee.photo,
+        "id": employee.pluri_id,
+        "department": employee.department,
+        "date": attendance.check_in.strftime('%d/%m/%Y'),
+        "check_in": attendance.check_in.strftime('%I:%M %p'),
+        "face_validation": True,  # Default to True since it's not in the table
+        "check_out": attendance.check_out.strftime('%I:%M %p') if attendance.check_out else None,
+        "total_hours": total_hours_str,
+        "status": "Terminé" if attendance.check_out else "En cours",
+        "auto_closed": attendance.auto_closed,
+    }
+
+@app.route('/api/attendance')
+@login_required
+def attendance_page():
+    """Attendance history, newest first, one keyset page at a time.
+
+    Query parameters: date_from / date_to (YYYY-MM-DD, inclusive), status
+    (open or closed), limit, and cursor (the next_cursor of the previous page).
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        # Employee comes in the same SELECT instead of one query per row
+        query = Attendance.query.options(db.joinedload(Attendance.employee))
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        if date_from:
+            query = query.filter(Attendance.check_in >= datetime.strptime(date_from, '%Y-%m-%d'))
+        if date_to:
+            query = query.filter(Attendance.check_in < datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+
+        status = request.args.get('status')
+        if status == 'open':
+            query = query.filter(Attendance.check_out.is_(None))
+        elif status == 'closed':
+            query = query.filter(Attendance.check_out.isnot(None))
+        elif status:
+            raise ValueError(f'Statut inconnu: {status}')
+
+        rows, next_cursor = keyset_page(query, [Attendance.check_in, Attendance.id],
+                                        cursor=request.args.get('cursor'), limit=limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    return jsonify({
+        'data': [serialize_attendance(attendance) for attendance in rows],
+        'next_cursor': next_cursor
+    })
 
 
 @app.route('/employees', methods=['GET', 'POST'])
@@ -296,7 +428,21 @@ def employees():
         
         db.session.add(employee)
         db.session.add(user)
+        db.session.flush()
+
+        # Encode the profile photo once, so face checks only encode the snapshot
+        try:
+            enrolled = face_cache.enroll(employee) is not None
+        except (PoolSaturated, JobTimeout) as e:
+            db.session.rollback()
+            if photo_path:
+                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], photo_path))
+            return face_job_failed(e)
         db.session.commit()
+        qr_cache.invalidate(employee.qr_data)
+        dashboard_metrics.invalidate()
+        if enrolled:
+            face_cache.invalidate(employee.id)
         
         print("Saved employee position:", employee.position)  # Debug print
         
@@ -309,6 +455,67 @@ def employees():
         print(f"Employee: {emp.full_name}, Position: {emp.position}")
     return render_template('employees.html', employees=employees_list)
 
+@app.route('/employees/import', methods=['POST'])
+@login_required
+def import_employees_file():
+    """Create employees from an uploaded CSV or XLSX file.
+
+    Form fields: file, dry_run (validate only) and skip_invalid (import the
+    valid rows even if others have errors). Returns the per-row report.
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'status': 'error', 'message': 'Aucun fichier fourni'}), 400
+    flags = ('1', 'true', 'yes', 'on')
+    try:
+        report = import_employees(
+            read_rows(upload.stream, upload.filename),
+            dry_run=request.form.get('dry_run', '').lower() in flags,
+            skip_invalid=request.form.get('skip_invalid', '').lower() in flags,
+            workers=app.config['IMPORT_WORKERS']
+        )
+    except ImportFileError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    if report['created']:
+        qr_cache.invalidate()
+        dashboard_metrics.invalidate()
+    status = 'error' if report['invalid'] and not report['created'] and not report['dry_run'] else 'success'
+    return jsonify({'status': status, **report}), 400 if status == 'error' else 200
+
+@app.route('/employees/badges.pdf')
+@login_required
+def badge_sheet():
+    """A4 sheets of printable badges, for one department (?department=) or everyone"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    department = request.args.get('department')
+    query = db.session.query(
+        Employee.pluri_id, Employee.first_name, Employee.last_name, Employee.department,
+        Employee.qr_data, Employee.photo
+    ).filter(Employee.qr_data.isnot(None))
+    if department:
+        query = query.filter(Employee.department == department)
+    badges = [
+        (pluri_id, f'{first_name} {last_name}', employee_department, qr_data,
+         os.path.join(app.config['UPLOAD_FOLDER'], photo) if photo else None)
+        for pluri_id, first_name, last_name, employee_department, qr_data, photo
+        in query.order_by(Employee.last_name, Employee.first_name)
+    ]
+    if not badges:
+        flash('Aucun employé à imprimer pour ce département.', 'warning')
+        return redirect(url_for('employees'))
+
+    filename = secure_filename(f"badges_{department or 'tous'}.pdf")
+    return Response(badge_sheet_pdf(badges, cache_dir=os.path.join(instance_path, 'badge_cache'),
+                                    workers=app.config['BADGE_WORKERS']),
+                    mimetype='application/pdf',
+                    headers={'Content-Disposition': f'inline; filename="{filename}"', 'X-Accel-Buffering': 'no'})
+
 @app.route('/employee/<int:employee_id>/update', methods=['GET', 'POST'])
 def update_employee(employee_id):
     employee = Employee.query.get_or_404(employee_id)
@@ -336,8 +543,17 @@ def update_employee(employee_id):
                 os.makedirs(upload_folder, exist_ok=True)
                 photo.save(os.path.join(upload_folder, new_filename))
                 photo_path = f"uploads/profiles/{new_filename}"
+                employee.photo = photo_path
+                try:
+                    face_cache.enroll(employee)
+                except (PoolSaturated, JobTimeout) as e:
+                    db.session.rollback()
+                    return face_job_failed(e)
 
         db.session.commit()
+        qr_cache.invalidate(employee.qr_data)
+        face_cache.invalidate(employee.id)
+        dashboard_metrics.invalidate()
         flash('Employee details updated successfully!', 'success')
         return redirect(url_for('employees'))
 
@@ -349,20 +565,30 @@ def delete_employee(employee_id):
 
     try:
         # First delete all attendance records for this employee
+        AttendanceChange.query.filter_by(employee_id=employee_id).delete()
         Attendance.query.filter_by(employee_id=employee_id).delete()
+        DailyAttendanceSummary.query.filter_by(employee_id=employee_id).delete()
+        ScanEvent.query.filter_by(employee_id=employee_id).delete()
+        FaceEncoding.query.filter_by(employee_id=employee_id).delete()
 
         # Then delete employee's files
         if employee.photo:
             photo_path = os.path.join(app.config['UPLOAD_FOLDER'], employee.photo)
             if os.path.exists(photo_path):
                 os.remove(photo_path)
-        qr_path = os.path.join('static', 'uploads', 'qrcodes', f'qr_{employee.pluri_id}')
+        # Pre-rendered by earlier versions
+        qr_path = os.path.join('static', 'uploads', 'qrcodes', f'qr_{employee.pluri_id}.png')
         if os.path.exists(qr_path):
             os.remove(qr_path)
 
         # Finally delete the employee
         db.session.delete(employee)
         db.session.commit()
+        qr_cache.invalidate(employee.qr_data)
+        if employee.qr_data:
+            qr_images.discard(employee.qr_data)
+        face_cache.invalidate(employee_id)
+        dashboard_metrics.invalidate()
         flash('Employé et tous les enregistrements associés supprimés avec succès!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -370,24 +596,32 @@ def delete_employee(employee_id):
 
     return redirect(url_for('employees'))
 
-def handle_attendance(employee):
-    now = datetime.now()
+def apply_scan(employee_id, now):
+    """Apply check-in/check-out semantics for a scan made at `now` (caller commits)"""
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
     
     # Check for existing attendance today
     attendance = Attendance.query.filter(
-        Attendance.employee_id == employee.id,
+        Attendance.employee_id == employee_id,
         Attendance.check_in >= today_start,
         Attendance.check_in <= today_end
     ).first()
     
     if attendance:
         if not attendance.check_out:
+            if now < attendance.check_in:
+                # Only possible when replaying scans recorded offline
+                return {
+                    'status': 'error',
+                    'message': 'Scan antérieur au check-in déjà enregistré.',
+                    'type': 'check_out'
+                }
             # Check out
             attendance.check_out = now
             attendance.total_hours = (attendance.check_out - attendance.check_in).total_seconds() / 3600
-            db.session.commit()
+            DailyAttendanceSummary.record_check_out(attendance)
+            record_change(attendance, 'check_out')
             return {
                 'status': 'success',
                 'message': f'Check-out effectué avec succès à {now.strftime("%I:%M %p")}',
@@ -402,17 +636,25 @@ def handle_attendance(employee):
     else:
         # Check in
         attendance = Attendance(
-            employee_id=employee.id,
+            employee_id=employee_id,
             check_in=now
         )
         db.session.add(attendance)
-        db.session.commit()
+        DailyAttendanceSummary.record_check_in(attendance, config.in_time)
+        record_change(attendance, 'check_in')
         return {
             'status': 'success',
             'message': f'Check-in effectué avec succès à  {now.strftime("%I:%M %p")}',
             'type': 'check_in'
         }
 
+def handle_attendance(employee_id):
+    response = apply_scan(employee_id, datetime.now())
+    db.session.commit()
+    if response['status'] == 'success':
+        dashboard_metrics.invalidate()
+    return response
+
 @app.route('/scan', methods=['GET', 'POST'])
 @login_required
 def scan():
@@ -421,30 +663,30 @@ def scan():
         
     if request.method == 'POST':
         try:
-            with open('config.json') as config_file:
-                config_data = json.load(config_file)
+            face_recg_enabled = config.get('face-recg', False)
             
             data = request.json
             qr_data = data.get('qr_data')
             
             # Find employee by QR data
-            employee = Employee.query.filter_by(qr_data=qr_data).first()
+            employee = qr_cache.get(qr_data)
             if not employee:
                 return jsonify({'status': 'error', 'message': 'Code QR Invalide'}), 400
+            employee_id, pluri_id = employee
             
-            if not config_data['face-recg']:
-                attendance_response = handle_attendance(employee)
+            if not face_recg_enabled:
+                attendance_response = handle_attendance(employee_id)
                 
                 return jsonify({
                     **attendance_response,
-                    'faceEnabled': config_data['face-recg'],
-                    'empId': employee.pluri_id
+                    'faceEnabled': face_recg_enabled,
+                    'empId': pluri_id
                 }), 200
             else:
                 return jsonify({
                     'status':'success',
-                    'faceEnabled': config_data['face-recg'],
-                    'empId': employee.pluri_id
+                    'faceEnabled': face_recg_enabled,
+                    'empId': pluri_id
                 }), 200
                 
         except Exception as e:
@@ -454,47 +696,191 @@ def scan():
     return render_template('thing.html')
 
 
+MAX_BATCH_EVENTS = 1000
+# Column sizes of ScanEvent.event_id and device_id
+MAX_EVENT_ID_LENGTH = 100
+MAX_DEVICE_ID_LENGTH = 100
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+def parse_scan_timestamp(value):
+    """Parse an ISO 8601 timestamp into a naive local datetime"""
+    timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+@app.route('/api/scans/batch', methods=['POST'])
+@login_required
+def scan_batch():
+    """Replay scans queued by door terminals while offline.
+
+    Expects {"events": [{"event_id", "qr_data", "timestamp", "device_id"}, ...]}.
+    Events already seen (by event_id, or device/code/timestamp when absent)
+    are reported as duplicates with their original result. The rest are applied
+    in timestamp order per employee and committed in a single transaction.
+    """
+    if not current_user.is_admin:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+
+    if config.get('face-recg', False):
+        return jsonify({'status': 'error', 'message': 'La reconnaissance faciale est activée: les scans hors ligne ne peuvent pas être validés.'}), 409
+
+    events = (request.get_json(silent=True) or {}).get('events')
+    if not isinstance(events, list):
+        return jsonify({'status': 'error', 'message': 'Le champ "events" doit être une liste.'}), 400
+    if len(events) > MAX_BATCH_EVENTS:
+        return jsonify({'status': 'error', 'message': f'Maximum {MAX_BATCH_EVENTS} événements par lot.'}), 413
+
+    results = [None] * len(events)
+    pending = []
+    seen = set()
+    latest_allowed = datetime.now() + MAX_CLOCK_SKEW
+
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            results[index] = {'status': 'error', 'message': 'Événement invalide.'}
+            continue
+        qr_data = event.get('qr_data')
+        device_id = event.get('device_id')
+        try:
+            timestamp = parse_scan_timestamp(event.get('timestamp'))
+        except ValueError:
+            results[index] = {'event_id': event.get('event_id'), 'status': 'error', 'message': 'Horodatage invalide.'}
+            continue
+        if event.get('event_id'):
+            event_id = str(event['event_id'])
+            if len(event_id) > MAX_EVENT_ID_LENGTH:
+                results[index] = {'event_id': event_id, 'status': 'error',
+                                  'message': f'event_id trop long (maximum {MAX_EVENT_ID_LENGTH} caractères).'}
+                continue
+        else:
+            event_id = f'{device_id}:{qr_data}:{timestamp.isoformat()}'
+            if len(event_id) > MAX_EVENT_ID_LENGTH:
+                event_id = 'sha256:' + hashlib.sha256(event_id.encode()).hexdigest()
+        if device_id is not None and len(str(device_id)) > MAX_DEVICE_ID_LENGTH:
+            results[index] = {'event_id': event_id, 'status': 'error',
+                              'message': f'device_id trop long (maximum {MAX_DEVICE_ID_LENGTH} caractères).'}
+            continue
+        # Longer than any stored code
+        if not qr_data or not isinstance(qr_data, str) or len(qr_data) > 200:
+            results[index] = {'event_id': event_id, 'status': 'error', 'message': 'Code QR Invalide'}
+            continue
+        if timestamp > latest_allowed:
+            results[index] = {'event_id': event_id, 'status': 'error', 'message': 'Horodatage dans le futur.'}
+            continue
+        if event_id in seen:
+            results[index] = {'event_id': event_id, 'status': 'duplicate', 'message': 'Événement en double dans le lot.'}
+            continue
+        seen.add(event_id)
+        pending.append((index, event_id, qr_data, device_id, timestamp))
+
+    # Idempotency: report events already applied by a previous batch
+    already_applied = {}
+    event_ids = [event_id for _, event_id, _, _, _ in pending]
+    for chunk_start in range(0, len(event_ids), 500):
+        chunk = event_ids[chunk_start:chunk_start + 500]
+        for scan_event in ScanEvent.query.filter(ScanEvent.event_id.in_(chunk)):
+            already_applied[scan_event.event_id] = scan_event
+
+    to_apply = []
+    for index, event_id, qr_data, device_id, timestamp in pending:
+        previous = already_applied.get(event_id)
+        if previous:
+            results[index] = {
+                'event_id': event_id,
+                'status': 'duplicate',
+                'result': previous.status,
+                'type': previous.type,
+                'message': previous.message
+            }
+            continue
+        employee = qr_cache.get(qr_data)
+        if not employee:
+            to_apply.append((None, timestamp, index, event_id, qr_data, device_id, None))
+            continue
+        to_apply.append((employee[0], timestamp, index, event_id, qr_data, device_id, employee[1]))
+
+    # Apply per employee in chronological order so check-in precedes check-out
+    to_apply.sort(key=lambda item: (item[0] or 0, item[1], item[2]))
+    applied = 0
+    try:
+        for employee_id, timestamp, index, event_id, qr_data, device_id, pluri_id in to_apply:
+            try:
+                # A concurrent retry of the same batch may record the event first;
+                # the savepoint then undoes this event's attendance change only
+                with db.session.begin_nested():
+                    if employee_id is None:
+                        response = {'status': 'error', 'message': 'Code QR Invalide', 'type': None}
+                    else:
+                        response = apply_scan(employee_id, timestamp)
+                    db.session.add(ScanEvent(event_id=event_id, device_id=device_id, qr_data=qr_data,
+                                             employee_id=employee_id, scanned_at=timestamp,
+                                             status=response['status'], type=response['type'],
+                                             message=response['message']))
+            except IntegrityError:
+                results[index] = {'event_id': event_id, 'status': 'duplicate',
+                                  'message': 'Événement déjà traité par un autre lot.'}
+                continue
+            if employee_id is None:
+                results[index] = {'event_id': event_id, 'status': 'error', 'message': 'Code QR Invalide'}
+            else:
+                results[index] = {'event_id': event_id, 'empId': pluri_id, **response}
+                applied += 1
+        db.session.commit()
+        if applied:
+            dashboard_metrics.invalidate()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error in scan batch: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Erreur du serveur.'}), 500
+
+    return jsonify({'status': 'success', 'results': results}), 200
+
+
+def face_job_failed(error):
+    """Response for a face job refused by a full pool (503) or past its timeout (504)"""
+    if isinstance(error, PoolSaturated):
+        response = jsonify({'status': 'error', 'message': 'Le service de reconnaissance faciale est occupé. Veuillez réessayer.'})
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 503
+    return jsonify({'status': 'error', 'message': 'La vérification faciale a pris trop de temps. Veuillez réessayer.'}), 504
+
 @app.route('/facial-recognition', methods=['POST'])
 def facial_recognition():
     if not FACE_RECOGNITION_ENABLED:
         flash('La reconnaissance faciale n\'est pas disponible.', 'error')
         return redirect(url_for('scan'))
 
-    if 'file' not in request.files:
-        flash('Aucune image n\'a été téléchargée.', 'error')
-        return redirect(url_for('scan'))
-    
-    data = request.json
+    data = request.get_json(silent=True) or {}
     image_data = data.get('image_data')
     emp_id = data.get('emp_id')
 
     if not image_data or not emp_id:
         return jsonify({'status': 'error', 'message': 'Les données fournies sont invalides.'}), 400
 
-    image = Image.open(BytesIO(base64.b64decode(image_data.split(',')[1])))
-    image.save(f'static/uploads/face_snapshots/{emp_id}_face.jpg')
-    profile_pic = None
-    for i in os.listdir("static/uploads/profiles/"):
-        if emp_id in i:
-            profile_pic = i
-            break
-    if not profile_pic:
+    employee = Employee.query.filter_by(pluri_id=emp_id).first()
+    if not employee:
+        return jsonify({'status': 'error', 'message': 'Code Qr Invalide'}), 400
+
+    try:
+        # Enrolls the profile photo through the pool on first use
+        known_encoding = face_cache.get(employee)
+    except (PoolSaturated, JobTimeout) as e:
+        return face_job_failed(e)
+    if known_encoding is None:
         return jsonify({'status': 'error', 'message': 'Veuillez fournir une image de profil valide.'}), 404
-    
-    known_image = face_recognition.load_image_file("static/uploads/profiles/" + profile_pic)
-    unknown_image = face_recognition.load_image_file(f'static/uploads/face_snapshots/{emp_id}_face.jpg')
-    biden_encoding = face_recognition.face_encodings(known_image)[0]
-    unknown_encoding = face_recognition.face_encodings(unknown_image)[0]
-    if len(biden_encoding) == 0 or len(unknown_encoding) == 0:
+
+    # Decode the snapshot in memory; only this image needs encoding per attempt
+    try:
+        unknown_encoding = face_pool.run(encode_snapshot, image_data, app.config['FACE_MAX_DIMENSION'],
+                                         app.config['FACE_DETECT_DIMENSION'])
+    except (PoolSaturated, JobTimeout) as e:
+        return face_job_failed(e)
+    if unknown_encoding is None:
         return jsonify({'status': 'error', 'message': 'Aucune face détectée dans une des images'}), 404
-    results = face_recognition.compare_faces([biden_encoding], unknown_encoding, tolerance=0.4)
-    if os.path.exists(f'static/uploads/face_snapshots/{emp_id}_face.jpg'):
-        os.remove(f'static/uploads/face_snapshots/{emp_id}_face.jpg')
-    if results[0]:
-        employee = Employee.query.filter_by(pluri_id=emp_id).first()
-        if not employee:
-                return jsonify({'status': 'error', 'message': 'Code Qr Invalide'}), 400
-        attendance_response = handle_attendance(employee)
+
+    if face_distance(known_encoding, unknown_encoding) <= MATCH_TOLERANCE:
+        attendance_response = handle_attendance(employee.id)
         
         return jsonify({
             **attendance_response,
@@ -503,40 +889,174 @@ def facial_recognition():
         return jsonify({'status': 'error', 'message': 'Les visages ne correspondent pas. Veuillez assurer la visibilité du visage'}), 400
 
 
+@app.route('/api/face/identify', methods=['POST'])
+@login_required
+def face_identify():
+    """Scan-free check-in: match a snapshot against every enrolled employee"""
+    if not current_user.is_admin:
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
+    if not FACE_RECOGNITION_ENABLED:
+        return jsonify({'status': 'error', 'message': 'La reconnaissance faciale n\'est pas disponible.'}), 503
+
+    data = request.get_json(silent=True) or {}
+    image_data = data.get('image_data')
+    if not image_data:
+        return jsonify({'status': 'error', 'message': 'Les données fournies sont invalides.'}), 400
+    try:
+        top_k = max(1, min(int(data.get('top_k', 3)), 20))
+        tolerance = min(float(data.get('tolerance', MATCH_TOLERANCE)), MATCH_TOLERANCE)
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Les données fournies sont invalides.'}), 400
+
+    try:
+        unknown_encoding = face_pool.run(encode_snapshot, image_data, app.config['FACE_MAX_DIMENSION'],
+                                         app.config['FACE_DETECT_DIMENSION'])
+    except (PoolSaturated, JobTimeout) as e:
+        return face_job_failed(e)
+    if unknown_encoding is None:
+        return jsonify({'status': 'error', 'message': 'Aucune face détectée dans l\'image'}), 404
+
+    matches = face_cache.identify(unknown_encoding, top_k=max(top_k, 2), tolerance=tolerance)
+    employees_by_id = {
+        employee.id: employee
+        for employee in Employee.query.filter(Employee.id.in_([employee_id for employee_id, _ in matches]))
+    }
+    matches = [(employee_id, distance) for employee_id, distance in matches if employee_id in employees_by_id]
+    candidates = [
+        {
+            'empId': employees_by_id[employee_id].pluri_id,
+            'employee_name': employees_by_id[employee_id].full_name,
+            'distance': round(distance, 4)
+        }
+        for employee_id, distance in matches
+    ]
+    if not candidates:
+        return jsonify({'status': 'error', 'message': 'Aucun employé reconnu.', 'candidates': []}), 404
+    if len(candidates) > 1 and candidates[1]['distance'] - candidates[0]['distance'] < AMBIGUITY_MARGIN:
+        return jsonify({'status': 'error', 'message': 'Correspondance ambiguë. Veuillez scanner votre code QR.',
+                        'candidates': candidates[:top_k]}), 409
+
+    best_id = matches[0][0]
+    if not data.get('record', True):
+        return jsonify({'status': 'success', 'candidates': candidates[:top_k]})
+    attendance_response = handle_attendance(best_id)
+    return jsonify({
+        **attendance_response,
+        'empId': candidates[0]['empId'],
+        'candidates': candidates[:top_k]
+    })
+
+
+@app.route('/api/face/metrics')
+@login_required
+def face_metrics():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(face_pool.metrics())
+
+@app.route('/api/qr_cache/stats')
+@login_required
+def qr_cache_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(qr_cache.stats())
+
+@app.template_global()
+def qr_url(employee, fmt='png'):
+    """URL of an employee's QR image, versioned by its content so browsers can keep it"""
+    return url_for('qr_image', pluri_id=employee.pluri_id, fmt=fmt, v=qr_digest(employee.qr_data, fmt)[:16])
+
+@app.route('/qr/<pluri_id>.<any(png, svg):fmt>')
+@login_required
+def qr_image(pluri_id, fmt):
+    """An employee's QR code as PNG or SVG (admins, or the employee themselves)"""
+    row = db.session.query(Employee.id, Employee.qr_data).filter_by(pluri_id=pluri_id).first()
+    if row is None or not row.qr_data:
+        abort(404)
+    if not current_user.is_admin and (current_user.employee is None or current_user.employee.id != row.id):
+        abort(403)
+
+    digest = qr_digest(row.qr_data, fmt)
+    # The image behind a versioned URL never changes; unversioned ones are revalidated
+    cache_control = 'private, max-age=31536000, immutable' if request.args.get('v') == digest[:16] \
+        else 'private, no-cache'
+    if digest in request.if_none_match:
+        response = Response(status=304)
+    else:
+        image, _ = qr_images.get(row.qr_data, fmt)
+        response = Response(image, mimetype=QR_FORMATS[fmt])
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@app.route('/api/qr_images/stats')
+@login_required
+def qr_images_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(qr_images.stats())
+
 @app.route('/today_attendance')
 @login_required
 def today_attendance():
     today = datetime.now()
     today_start = today.replace(hour=0, minute=0, second=0, microsecond=0)
     today_end = today.replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    # Get all attendance records for today
-    attendance_records = Attendance.query.filter(
+
+    # Read before the rows, so a client streaming from it replays anything committed since
+    last_event_id = last_change_id()
+
+    # Get all attendance records for today, with their employee in the same query
+    attendance_records = Attendance.query.options(db.joinedload(Attendance.employee)).filter(
         Attendance.check_in >= today_start,
         Attendance.check_in <= today_end
     ).order_by(Attendance.check_in.desc()).all()
-    
-    # Format the records for JSON response
-    records = []
-    for attendance in attendance_records:
-        # Calculate total hours if check_out exists
-        total_hours = None
-        if attendance.check_out:
-            duration = attendance.check_out - attendance.check_in
-            total_hours = duration.total_seconds() / 3600  # Convert to hours
-        
-        record = {
-            'pluri_id': attendance.employee.pluri_id,
-            'department': attendance.employee.department,
-            'position': attendance.employee.position,
-            'employee_name': attendance.employee.full_name,
-            'check_in': attendance.check_in.strftime('%I:%M %p'),
-            'check_out': attendance.check_out.strftime('%I:%M %p') if attendance.check_out else None,
-            'total_hours': round(total_hours, 2) if total_hours is not None else None
-        }
-        records.append(record)
-    
-    return jsonify(records)
+
+    records = [attendance_record(attendance, attendance.employee) for attendance in attendance_records]
+    response = jsonify(records)
+    response.headers['X-Last-Event-Id'] = str(last_event_id)
+    return response
+
+@app.route('/stream/attendance')
+@login_required
+def stream_attendance():
+    """Server-Sent Events feed of check-ins and check-outs.
+
+    Each event's data is a /today_attendance record plus its type and date.
+    Clients start from last_event_id (the X-Last-Event-Id header of
+    /today_attendance); on reconnect the browser's Last-Event-ID header takes
+    over, so nothing committed in between is missed.
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        after_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or last_change_id())
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'last_event_id invalide'}), 400
+    db.session.remove()
+
+    if not attendance_feed.subscribe():
+        response = jsonify({'status': 'error', 'message': 'Trop de flux en direct ouverts. Veuillez réessayer.'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    def events(after_id):
+        yield 'retry: 3000\n\n'
+        while True:
+            changes = attendance_feed.wait(after_id)
+            if not changes:
+                # Comment line, keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+            for change_id, payload in changes:
+                yield f'id: {change_id}\nevent: attendance\ndata: {json.dumps(payload)}\n\n'
+                after_id = change_id
+
+    response = Response(events(after_id), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also runs when the client leaves before the first event is sent
+    response.call_on_close(attendance_feed.unsubscribe)
+    return response
 
 @app.route('/report')
 @login_required
@@ -558,39 +1078,21 @@ def backup():
     if not current_user.is_admin:
         return redirect(url_for('profile'))
     
-    # Get list of backups
+    # Get list of backups, newest first
     backups = []
-    for filename in os.listdir(BACKUP_DIR):
-        if filename.startswith('database_backup_'):
-            file_path = os.path.join(BACKUP_DIR, filename)
-            file_stats = os.stat(file_path)
-            # Parse the timestamp from filename (YYYYMMDD_HHMMSS)
-            timestamp_str = filename.replace('database_backup_', '').replace('.db', '')
-            file_date = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
-            backups.append({
-                'id': filename,
-                'date': file_date,
-                'size': f"{file_stats.st_size / (1024*1024):.2f} MB"
-            })
-    
-    # Sort backups by date, newest first
-    backups.sort(key=lambda x: x['date'], reverse=True)
+    for manifest in backup_engine.list():
+        backups.append({
+            'id': manifest['id'],
+            'date': manifest['created_at'],
+            'type': manifest['type'],
+            'size': f"{manifest['size'] / (1024*1024):.2f} MB"
+        })
     
     # Get backup settings
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT value FROM settings WHERE key = "backup_frequency"')
-            frequency = cursor.fetchone()
-            cursor.execute('SELECT value FROM settings WHERE key = "retention_period"')
-            retention = cursor.fetchone()
-            
-            settings = {
-                'frequency': frequency[0] if frequency else 'daily',
-                'retention_period': retention[0] if retention else 30
-            }
-    except:
-        settings = {'frequency': 'daily', 'retention_period': 30}
+    settings = {
+        'frequency': Setting.get('backup_frequency', 'daily'),
+        'retention_period': Setting.get('retention_period', 30)
+    }
     
     return render_template('backup.html', backups=backups, settings=settings)
 
@@ -600,7 +1102,10 @@ def create_backup():
     if not current_user.is_admin:
         return redirect(url_for('profile'))
     
-    backup_path = create_backup_file()
+    mode = request.form.get('mode', 'full')
+    if mode not in ('auto', 'full', 'incremental'):
+        mode = 'full'
+    backup_path = create_backup_file(mode)
     if backup_path:
         flash('Sauvegarde créée avec succès', 'success')
     else:
@@ -618,24 +1123,70 @@ def update_backup_settings():
     retention_period = request.form.get('retention_period', '30')
     
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
-                         ('backup_frequency', frequency))
-            cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
-                         ('retention_period', retention_period))
-            conn.commit()
-            
-        # Update backup schedule
-        schedule_backup(frequency)
+        if frequency not in BACKUP_TRIGGERS:
+            raise ValueError(f'Fréquence inconnue: {frequency}')
+        Setting.set('backup_frequency', frequency)
+        Setting.set('retention_period', int(retention_period))
+        db.session.commit()
+
+        # The scheduler leader picks the new schedule up within its sync interval
+        job_scheduler.sync()
         cleanup_old_backups()
         
         flash('Paramètres de sauvegarde mis à jour', 'success')
     except Exception as e:
+        db.session.rollback()
         flash(f'Erreur lors de la mise à jour des paramètres: {str(e)}', 'error')
     
     return redirect(url_for('backup'))
 
+def prepare_restored_database(path):
+    """Reject backups that don't match the models, then add newer tables and indexes"""
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        problems = check_schema(engine)
+        if problems:
+            raise BackupError('Schéma incompatible: ' + ', '.join(problems[:5]))
+        upgrade_schema(engine)
+    finally:
+        engine.dispose()
+
+@app.route('/backup/restore/<backup_id>', methods=['POST'])
+@login_required
+def restore_backup(backup_id):
+    if not current_user.is_admin:
+        return redirect(url_for('profile'))
+
+    try:
+        if not USING_SQLITE:
+            raise BackupError('la restauration n\'est disponible qu\'avec SQLite')
+        backup_engine.get(backup_id)
+        safety_backups = []
+
+        def snapshot_current_state():
+            # Keep a way back: snapshot the current state before overwriting it
+            safety_backups.append(backup_engine.create('full'))
+            db.session.remove()
+
+        backup_engine.restore_live(backup_id, prepare=prepare_restored_database,
+                                   before_swap=snapshot_current_state)
+
+        # This worker reopens now, the others on their next request
+        db.engine.dispose()
+        backfill_daily_summary()
+        db_generation.touch()
+        qr_cache.invalidate()
+        face_cache.invalidate()
+        dashboard_metrics.invalidate()
+        attendance_feed.reset()
+        flash(f'Sauvegarde restaurée. État précédent conservé dans {safety_backups[0]["id"]}.', 'success')
+    except BackupError as e:
+        flash(f'Restauration impossible: {str(e)}', 'error')
+    except Exception as e:
+        flash(f'Erreur lors de la restauration: {str(e)}', 'error')
+
+    return redirect(url_for('backup'))
+
 @app.route('/backup/delete/<backup_id>', methods=['POST'])
 @login_required
 def delete_backup(backup_id):
@@ -643,12 +1194,10 @@ def delete_backup(backup_id):
         return redirect(url_for('profile'))
     
     try:
-        backup_path = os.path.join(BACKUP_DIR, backup_id)
-        if os.path.exists(backup_path):
-            os.remove(backup_path)
-            flash('Sauvegarde supprimée', 'success')
-        else:
-            flash('Sauvegarde non trouvée', 'error')
+        backup_engine.delete(backup_id)
+        flash('Sauvegarde supprimée', 'success')
+    except BackupError:
+        flash('Sauvegarde non trouvée', 'error')
     except Exception as e:
         flash(f'Erreur lors de la suppression: {str(e)}', 'error')
     
@@ -657,72 +1206,67 @@ def delete_backup(backup_id):
 @app.route('/api/report_data')
 @login_required
 def report_data():
+    """Report rows with the report page filters.
+
+    Without group_by, one row per employee and day. group_by (employee,
+    day, week or month) aggregates to that level instead, unless detail=true
+    asks for the daily rows along with their period totals; the report page
+    asks for group_by=employee.
+    With page (and optionally per_page) only that page is returned, along
+    with the total.
+    """
     if not current_user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    # Get filter parameters
-    employee_name = request.args.get('employee_name', '')
-    pluri_id = request.args.get('pluri_id', '')
-    department = request.args.get('department', '')
-    function = request.args.get('function', '')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
+    detail = 'group_by' not in request.args or request.args.get('detail', '').lower() in ('1', 'true', 'yes')
+    group_by = request.args.get('group_by', 'employee')
+    try:
+        query = report_query(request.args, group_by=group_by, detail=detail)
+        result = {}
+        if request.args.get('page'):
+            page = int(request.args['page'])
+            per_page = min(max(int(request.args.get('per_page', REPORT_PAGE_SIZE)), 1), MAX_REPORT_PAGE_SIZE)
+            rows, total = offset_page(query, page, per_page)
+            result.update({'page': page, 'per_page': per_page, 'total': total})
+        else:
+            rows = query.all()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
 
-    # Start with base query
-    query = db.session.query(
-        Employee.pluri_id,
-        Employee.first_name,
-        Employee.last_name,
-        Employee.department,
-        Employee.position,
-        func.sum(
-            func.coalesce(
-                (func.julianday(Attendance.check_out) - func.julianday(Attendance.check_in)) * 24 * 60 * 60,
-                0
-            )
-        ).label('total_seconds')
-    ).join(Attendance, Employee.id == Attendance.employee_id).group_by(
-        Employee.pluri_id,
-        Employee.first_name,
-        Employee.last_name,
-        Employee.department,
-        Employee.position
-    )
+    result['data'] = [serialize_report_row(row, group_by, detail) for row in rows]
+    return jsonify(result)
 
-    # Apply filters
-    if employee_name:
-        query = query.filter(
-            db.or_(
-                Employee.first_name.ilike(f'%{employee_name}%'),
-                Employee.last_name.ilike(f'%{employee_name}%')
-            )
-        )
-    if pluri_id:
-        query = query.filter(Employee.pluri_id == pluri_id)
-    if department:
-        query = query.filter(Employee.department == department)
-    if function:
-        query = query.filter(Employee.position == function)
-    if date_from:
-        date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
-        query = query.filter(Attendance.check_in >= date_from)
-    if date_to:
-        date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
-        query = query.filter(Attendance.check_in <= date_to)
-
-    # Execute query and format results
-    records = []
-    for record in query.all():
-        total_hours = round(record.total_seconds / 3600, 2)  # Convert seconds to hours
-        records.append({
-            'pluri_id': record.pluri_id,
-            'full_name': f'{record.first_name} {record.last_name}',
-            'department': record.department,
-            'function': record.position,
-            'total_hours': total_hours
-        })
+@app.route('/api/report_data/export')
+@login_required
+def export_report_data():
+    """Stream the report as a CSV, XLSX or Parquet file.
+
+    Takes the report_data filters, plus format (csv, xlsx or parquet) and
+    detail=true for one row per employee and day instead of totals.
+    """
+    if not current_user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'status': 'error', 'message': f'Format inconnu: {export_format}'}), 400
+    mimetype, extension, writer, available = EXPORT_FORMATS[export_format]
+    if not available:
+        return jsonify({'status': 'error', 'message': f'Export {export_format} non disponible sur ce serveur'}), 400
 
-    return jsonify({'data': records})
+    detail = request.args.get('detail', '').lower() in ('1', 'true', 'yes')
+    try:
+        columns, rows = export_rows(request.args, detail=detail)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    filename = f"rapport_presences{'_detail' if detail else ''}_{datetime.now().strftime('%Y%m%d')}.{extension}"
+    # Rows are read from the cursor as the response is sent, never all at once
+    return Response(
+        stream_with_context(writer(columns, rows)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 
 @app.route('/profile')
@@ -784,139 +1328,45 @@ def filter_attendance():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    with open('config.json') as config_file:
-        config_data = json.load(config_file)
-
-    # Convert inTime and outTime from config to time objects
-    in_time = datetime.strptime(config_data['inTime'], "%H:%M:%S").time()
-    out_time = datetime.strptime(config_data['outTime'], "%H:%M:%S").time()
-
-    total_employees = Employee.query.count()
-
-    present_employees = Attendance.query.filter(
-        Attendance.check_in >= datetime.now().replace(hour=0, minute=0, second=0)
-    ).count()
-
-    if config_data['lateComers']:
-        latecomers = Attendance.query.filter(
-            Attendance.check_in >= datetime.now().replace(hour=0, minute=0, second=0),
-            func.time(Attendance.check_in) > in_time
-        ).count()
-    else:
-        latecomers = 0
-
-    # Logic for employees on leave
-    employees_on_leave = Employee.query.filter(
-        ~Employee.id.in_(
-            db.session.query(Attendance.employee_id).filter(
-                or_(
-                    func.time(Attendance.check_in).between(in_time, out_time),
-                    func.time(Attendance.check_out).between(in_time, out_time)
-                ),
-                Attendance.check_in >= datetime.now().replace(hour=0, minute=0, second=0)
-            )
-        )
-    ).count()
-
-    male_employees = Employee.query.filter_by(gender='male').count()
-    female_employees = Employee.query.filter_by(gender='female').count()
-
-    # Weekly activity data
-    activity_labels = []
-    activity_data = []
-    for i in range(7):
-        day = datetime.now().date() - timedelta(days=i)
-        activity_labels.append(day.strftime('%A'))
-        activity_data.append(
-            Attendance.query.filter(
-                Attendance.check_in >= day,
-                Attendance.check_in < day + timedelta(days=1)
-            ).count()
-        )
-    
-    today_start = datetime.now().replace(hour=0, minute=0, second=0)
-    today_attendance = Attendance.query.filter(Attendance.check_in >= today_start).all()
-
-    return render_template(
-        'dashboard.html',
-        total_employees=total_employees,
-        present_employees=present_employees,
-        latecomers=latecomers,
-        employees_on_leave=employees_on_leave,
-        male_employees=male_employees,
-        female_employees=female_employees,
-        activity_labels=activity_labels[::-1],
-        activity_data=activity_data[::-1],
-        today_attendance=today_attendance
-    )
+    # Served from the per-worker snapshot; scans and employee changes refresh it
+    return render_template('dashboard.html', **dashboard_metrics.get(config))
 
 @app.route('/activity-data', methods=['GET'])
+@login_required
 def activity_data():
     # Get the period parameter (day, week, month, year)
     period = request.args.get('period', 'week').lower()
-    
-    activity_labels = []
-    activity_data = []
-    
-    if period == 'day':
-        # Group data by hour for the current day
-        current_date = datetime.now().date()
-        for hour in range(24):
-            start_time = datetime.combine(current_date, datetime.min.time()) + timedelta(hours=hour)
-            end_time = start_time + timedelta(hours=1)
-            activity_labels.append(f"{hour}:00")
-            activity_data.append(
-                Attendance.query.filter(
-                    Attendance.check_in >= start_time,
-                    Attendance.check_in < end_time
-                ).count()
-            )
-    elif period == 'week':
-        # Group data by last 7 days
-        for i in range(7):
-            day = datetime.now().date() - timedelta(days=i)
-            activity_labels.insert(0, day.strftime('%A'))  # Add to the start for correct order
-            activity_data.insert(0, 
-                Attendance.query.filter(
-                    Attendance.check_in >= day,
-                    Attendance.check_in < day + timedelta(days=1)
-                ).count()
-            )
-    elif period == 'month':
-        # Group data by days in the current month
-        current_date = datetime.now()
-        start_of_month = datetime(current_date.year, current_date.month, 1)
-        num_days = (datetime(current_date.year, current_date.month + 1, 1) - start_of_month).days
-        for day in range(num_days):
-            start_time = start_of_month + timedelta(days=day)
-            end_time = start_time + timedelta(days=1)
-            activity_labels.append(start_time.strftime('%d %b'))
-            activity_data.append(
-                Attendance.query.filter(
-                    Attendance.check_in >= start_time,
-                    Attendance.check_in < end_time
-                ).count()
-            )
-    elif period == 'year':
-        # Group data by months in the current year
-        current_year = datetime.now().year
-        for month in range(1, 13):
-            start_time = datetime(current_year, month, 1)
-            if month == 12:
-                end_time = datetime(current_year + 1, 1, 1)
-            else:
-                end_time = datetime(current_year, month + 1, 1)
-            activity_labels.append(start_time.strftime('%b'))
-            activity_data.append(
-                Attendance.query.filter(
-                    Attendance.check_in >= start_time,
-                    Attendance.check_in < end_time
-                ).count()
-            )
-    
+
+    # Optional explicit range: start/end (YYYY-MM-DD, end inclusive) and granularity
+    start_param = request.args.get('start')
+    end_param = request.args.get('end')
+    granularity = request.args.get('granularity', '').lower()
+
+    try:
+        start, end, default_granularity, label_format = period_range(period)
+        if start_param or end_param:
+            if start_param:
+                start = datetime.strptime(start_param, '%Y-%m-%d')
+            if end_param:
+                end = datetime.strptime(end_param, '%Y-%m-%d') + timedelta(days=1)
+            label_format = None
+        if granularity and granularity != default_granularity:
+            label_format = None
+        granularity = granularity or default_granularity
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'Unknown granularity: {granularity}')
+        if end <= start:
+            raise ValueError('La date de fin doit être postérieure à la date de début.')
+        check_bucket_count(start, end, granularity)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    label_format = label_format or DEFAULT_LABELS[granularity]
+    histogram = attendance_histogram(start, end, granularity)
+
     return jsonify({
-        "labels": activity_labels,
-        "data": activity_data
+        "labels": [bucket.strftime(label_format) for bucket, _ in histogram],
+        "data": [count for _, count in histogram]
     })
 
 
@@ -941,6 +1391,7 @@ def change_password():
     return redirect(url_for('profile'))
 
 if __name__ == '__main__':
+    job_scheduler.start()
     app.run(debug=True, port=os.getenv("PORT", default=5000))
 else:
     # This is the entry point Gunicorn will use
@@ -0,0 +1,175 @@
+from collections import deque
+from datetime import datetime, timedelta
+from models import db, Employee, Attendance, AttendanceChange
+import threading
+import time
+
+# pg_advisory_xact_lock key serializing change log writers
+CHANGE_LOG_LOCK = 0x5347500
+
+
+def attendance_record(attendance, employee):
+    """JSON shape of one attendance row, as listed by /today_attendance"""
+    total_hours = None
+    if attendance.check_out:
+        total_hours = (attendance.check_out - attendance.check_in).total_seconds() / 3600
+    return {
+        'pluri_id': employee.pluri_id,
+        'department': employee.department,
+        'position': employee.position,
+        'employee_name': f'{employee.first_name} {employee.last_name}',
+        'check_in': attendance.check_in.strftime('%I:%M %p'),
+        'check_out': attendance.check_out.strftime('%I:%M %p') if attendance.check_out else None,
+        'total_hours': round(total_hours, 2) if total_hours is not None else None
+    }
+
+
+def record_change(attendance, change_type):
+    """Append a check-in or check-out to the change log (caller commits).
+
+    The feed reads ids greater than the last one it saw, so ids must become
+    visible in increasing order. SQLite has a single writer; on PostgreSQL
+    the sequence hands out ids before commit, so writers take a transaction
+    lock here and commit one after the other.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': CHANGE_LOG_LOCK})
+    db.session.add(AttendanceChange(attendance=attendance, employee_id=attendance.employee_id, type=change_type))
+
+
+def load_changes(after_id, limit=None):
+    """(event id, payload) of the logged changes after after_id, oldest first"""
+    query = db.session.query(
+        AttendanceChange.id, AttendanceChange.type, Attendance, Employee
+    ).join(Attendance, Attendance.id == AttendanceChange.attendance_id).join(
+        Employee, Employee.id == AttendanceChange.employee_id
+    ).filter(AttendanceChange.id > after_id).order_by(AttendanceChange.id)
+    if limit:
+        query = query.limit(limit)
+    return [
+        (change_id, {
+            'type': change_type,
+            'date': attendance.check_in.strftime('%Y-%m-%d'),
+            **attendance_record(attendance, employee)
+        })
+        for change_id, change_type, attendance, employee in query
+    ]
+
+
+def last_change_id():
+    return db.session.query(db.func.max(AttendanceChange.id)).scalar() or 0
+
+
+def prune_changes(days=2):
+    """Drop change log entries older than days; reconnects that far back reload the list"""
+    deleted = AttendanceChange.query.filter(
+        AttendanceChange.created_at < datetime.now() - timedelta(days=days)
+    ).delete()
+    db.session.commit()
+    return deleted
+
+
+class AttendanceFeed:
+    """Per-worker fan-out of the attendance change log to SSE clients.
+
+    Scans may be handled by any gunicorn worker, so they are published
+    through the attendance_change table. While at least one client is
+    connected, one thread per worker reads the new rows every poll_interval
+    seconds and wakes the clients of that worker; the database sees one
+    indexed query per worker per interval, however many clients listen.
+    The last `backlog` events stay in memory for clients catching up.
+    Each client holds a server thread for as long as it stays connected, so
+    at most max_subscribers connect at once per worker.
+    """
+
+    def __init__(self, app, poll_interval=1.0, backlog=1000, max_subscribers=None):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self._events = deque(maxlen=backlog)
+        self._last_id = None
+        self._subscribers = 0
+        self._poller = None
+        self._condition = threading.Condition()
+
+    def _poll(self):
+        with self.app.app_context():
+            try:
+                changes = load_changes(self._last_id)
+            finally:
+                db.session.remove()
+        if changes:
+            with self._condition:
+                self._events.extend(changes)
+                self._last_id = changes[-1][0]
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._subscribers == 0:
+                    self._poller = None
+                    return
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"Attendance feed poll failed: {str(e)}")
+            time.sleep(self.poll_interval)
+
+    def subscribe(self):
+        """Register a client; False when max_subscribers are already connected"""
+        with self._condition:
+            if self.max_subscribers is not None and self._subscribers >= self.max_subscribers:
+                return False
+            if self._last_id is None:
+                # Start from the current end of the log; older events come from the database
+                with self.app.app_context():
+                    try:
+                        self._last_id = last_change_id()
+                    finally:
+                        db.session.remove()
+            self._subscribers += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._run, name='attendance-feed', daemon=True)
+                self._poller.start()
+            return True
+
+    def reset(self):
+        """Forget buffered events, e.g. after a restore rewound the change log"""
+        with self._condition:
+            self._events.clear()
+            with self.app.app_context():
+                try:
+                    self._last_id = last_change_id()
+                finally:
+                    db.session.remove()
+
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def wait(self, after_id, timeout=15):
+        """Events newer than after_id, waiting up to timeout seconds for some.
+
+        Clients further behind than the in-memory backlog are served from
+        the database directly. Call between subscribe() and unsubscribe().
+        """
+        with self._condition:
+            first_kept = self._events[0][0] - 1 if self._events else self._last_id
+        if after_id < first_kept:
+            with self.app.app_context():
+                try:
+                    events = load_changes(after_id, limit=self._events.maxlen)
+                finally:
+                    db.session.remove()
+            if events:
+                return events
+
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = [event for event in self._events if event[0] > after_id]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(remaining)
@@ -0,0 +1,366 @@
+from datetime import datetime, timedelta
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+# zstd compresses faster and smaller than gzip; fall back when it isn't installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BACKUP_PREFIX = 'database_backup_'
+MANIFEST_SUFFIX = '.manifest.json'
+BACKUP_ID_PATTERN = re.compile(r'^database_backup_\d{8}_\d{6}(_\d+)?(\.db)?$')
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    pass
+
+
+def _compressed_writer(path, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    return gzip.open(path, 'wb', compresslevel=6)
+
+
+def _compressed_reader(path, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    if codec == 'gzip':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _read_exact(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def integrity_check(path):
+    """Run PRAGMA integrity_check on a database file; return the problems found"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    return [] if rows == ['ok'] else rows
+
+
+class BackupEngine:
+    """Online, compressed, optionally incremental backups of the SQLite database.
+
+    Snapshots are taken with the SQLite backup API in small page steps so the
+    live database is never locked for long. A full backup stores the whole
+    snapshot compressed, plus a digest of every page; an incremental backup
+    stores only the pages whose digest differs from the last full backup.
+    Every backup has a JSON manifest with the page geometry and the SHA-256
+    of the database it restores to.
+    """
+
+    def __init__(self, db_path, backup_dir, pages_per_step=256, step_sleep=0.005,
+                 full_interval=timedelta(days=7), codec=None):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.full_interval = full_interval
+        self.codec = codec or ('zstd' if zstandard else 'gzip')
+        os.makedirs(backup_dir, exist_ok=True)
+
+    # Paths
+
+    def _path(self, backup_id, suffix):
+        if not BACKUP_ID_PATTERN.match(backup_id):
+            raise BackupError(f'Invalid backup id: {backup_id}')
+        return os.path.join(self.backup_dir, backup_id + suffix)
+
+    def _new_id(self, now):
+        backup_id = f"{BACKUP_PREFIX}{now.strftime('%Y%m%d_%H%M%S')}"
+        candidate, n = backup_id, 1
+        while os.path.exists(self._path(candidate, MANIFEST_SUFFIX)):
+            n += 1
+            candidate = f'{backup_id}_{n}'
+        return candidate
+
+    # Snapshots
+
+    def snapshot(self, dest_path):
+        """Copy the live database into dest_path with the online backup API"""
+        source = sqlite3.connect(self.db_path)
+        dest = sqlite3.connect(dest_path)
+        try:
+            source.backup(dest, pages=self.pages_per_step, sleep=self.step_sleep)
+            # Store snapshots as self-contained rollback-journal databases
+            dest.execute('PRAGMA journal_mode=DELETE')
+            page_size = dest.execute('PRAGMA page_size').fetchone()[0]
+            page_count = dest.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            dest.close()
+            source.close()
+        return page_size, page_count
+
+    def _page_digests(self, path, page_size):
+        digests = []
+        with open(path, 'rb') as f:
+            for page in iter(lambda: f.read(page_size), b''):
+                digests.append(hashlib.blake2b(page, digest_size=16).digest())
+        return digests
+
+    def _write_manifest(self, manifest):
+        path = self._path(manifest['id'], MANIFEST_SUFFIX)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def create(self, mode='auto'):
+        """Take a backup; mode is 'full', 'incremental' or 'auto'.
+
+        'auto' takes an incremental backup when a full backup younger than
+        full_interval exists, a full one otherwise. Returns the manifest.
+        """
+        now = datetime.now()
+        base = None
+        if mode in ('auto', 'incremental'):
+            base = self.latest_full()
+            if base and mode == 'auto' and now - base['created_at'] > self.full_interval:
+                base = None
+            if mode == 'incremental' and base is None:
+                raise BackupError('No full backup to base an incremental backup on')
+
+        backup_id = self._new_id(now)
+        fd, snapshot_path = tempfile.mkstemp(dir=self.backup_dir, prefix='.snapshot-', suffix='.db')
+        os.close(fd)
+        try:
+            page_size, page_count = self.snapshot(snapshot_path)
+            problems = integrity_check(snapshot_path)
+            if problems:
+                raise BackupError('Snapshot failed integrity check: ' + '; '.join(problems[:5]))
+            if base and base['page_size'] != page_size:
+                base = None
+
+            manifest = {
+                'id': backup_id,
+                'created': now.isoformat(timespec='seconds'),
+                'page_size': page_size,
+                'page_count': page_count,
+                'codec': self.codec,
+                'sha256': _sha256(snapshot_path),
+            }
+            digests = self._page_digests(snapshot_path, page_size)
+            if base:
+                manifest.update(self._write_incremental(backup_id, snapshot_path, page_size, digests, base))
+            else:
+                manifest.update(self._write_full(backup_id, snapshot_path, digests))
+            self._write_manifest(manifest)
+        finally:
+            for path in (snapshot_path, snapshot_path + '-journal'):
+                if os.path.exists(path):
+                    os.remove(path)
+        return self._load_manifest(backup_id)
+
+    def _write_full(self, backup_id, snapshot_path, digests):
+        data_path = self._path(backup_id, f'.db.{self.codec}')
+        with open(snapshot_path, 'rb') as source, _compressed_writer(data_path, self.codec) as out:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                out.write(chunk)
+        with open(self._path(backup_id, '.digests'), 'wb') as f:
+            f.write(b''.join(digests))
+        return {'type': 'full', 'data_file': os.path.basename(data_path)}
+
+    def _write_incremental(self, backup_id, snapshot_path, page_size, digests, base):
+        with open(self._path(base['id'], '.digests'), 'rb') as f:
+            base_digests = f.read()
+
+        data_path = self._path(backup_id, f'.pages.{self.codec}')
+        changed = 0
+        with open(snapshot_path, 'rb') as source, _compressed_writer(data_path, self.codec) as out:
+            for page_number, digest in enumerate(digests):
+                if base_digests[page_number * 16:(page_number + 1) * 16] == digest:
+                    continue
+                source.seek(page_number * page_size)
+                out.write(page_number.to_bytes(8, 'big'))
+                out.write(source.read(page_size))
+                changed += 1
+        return {
+            'type': 'incremental',
+            'base': base['id'],
+            'changed_pages': changed,
+            'data_file': os.path.basename(data_path),
+        }
+
+    # Catalogue
+
+    def _load_manifest(self, backup_id):
+        with open(self._path(backup_id, MANIFEST_SUFFIX)) as f:
+            manifest = json.load(f)
+        manifest['created_at'] = datetime.fromisoformat(manifest['created'])
+        manifest['size'] = sum(
+            os.path.getsize(os.path.join(self.backup_dir, name))
+            for name in (manifest['data_file'], backup_id + MANIFEST_SUFFIX)
+            if os.path.exists(os.path.join(self.backup_dir, name))
+        )
+        return manifest
+
+    def list(self):
+        """All backups, newest first, including legacy plain .db copies"""
+        backups = []
+        for filename in os.listdir(self.backup_dir):
+            if not filename.startswith(BACKUP_PREFIX):
+                continue
+            if filename.endswith(MANIFEST_SUFFIX):
+                backups.append(self._load_manifest(filename[:-len(MANIFEST_SUFFIX)]))
+            elif filename.endswith('.db') and BACKUP_ID_PATTERN.match(filename):
+                # Uncompressed copy made before manifests existed
+                timestamp_str = filename.replace(BACKUP_PREFIX, '').replace('.db', '')
+                backups.append({
+                    'id': filename,
+                    'type': 'full',
+                    'legacy': True,
+                    'codec': None,
+                    'data_file': filename,
+                    'created_at': datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S'),
+                    'size': os.path.getsize(os.path.join(self.backup_dir, filename)),
+                })
+        backups.sort(key=lambda backup: backup['created_at'], reverse=True)
+        return backups
+
+    def get(self, backup_id):
+        for backup in self.list():
+            if backup['id'] == backup_id:
+                return backup
+        raise BackupError(f'Backup not found: {backup_id}')
+
+    def latest_full(self):
+        for backup in self.list():
+            if backup['type'] == 'full' and not backup.get('legacy'):
+                return backup
+        return None
+
+    def delete(self, backup_id):
+        """Delete a backup and, for a full backup, the incrementals built on it"""
+        backup = self.get(backup_id)
+        removed = []
+        if backup['type'] == 'full':
+            for dependent in self.list():
+                if dependent.get('base') == backup_id:
+                    removed.extend(self.delete(dependent['id']))
+        for name in (backup['data_file'], backup_id + MANIFEST_SUFFIX, backup_id + '.digests'):
+            path = os.path.join(self.backup_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(backup_id)
+        return removed
+
+    def cleanup(self, retention_days):
+        """Remove backups older than the retention period.
+
+        A full backup is kept as long as one of its incrementals is kept.
+        """
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        backups = self.list()
+        needed_bases = {b.get('base') for b in backups if b['created_at'] >= cutoff}
+        removed = []
+        for backup in backups:
+            if backup['created_at'] < cutoff and backup['id'] not in needed_bases and backup['id'] not in removed:
+                removed.extend(self.delete(backup['id']))
+        return removed
+
+    # Restore
+
+    def restore_to(self, backup_id, dest_path):
+        """Rebuild a backup into dest_path and verify it; returns the manifest"""
+        backup = self.get(backup_id)
+        if backup.get('legacy'):
+            with open(os.path.join(self.backup_dir, backup['data_file']), 'rb') as source, \
+                    open(dest_path, 'wb') as out:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+        else:
+            full = self.get(backup['base']) if backup['type'] == 'incremental' else backup
+            with _compressed_reader(os.path.join(self.backup_dir, full['data_file']), full['codec']) as source, \
+                    open(dest_path, 'wb') as out:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+
+            if backup['type'] == 'incremental':
+                page_size = backup['page_size']
+                with _compressed_reader(os.path.join(self.backup_dir, backup['data_file']), backup['codec']) as pages, \
+                        open(dest_path, 'r+b') as out:
+                    while True:
+                        header = _read_exact(pages, 8)
+                        if not header:
+                            break
+                        page = _read_exact(pages, page_size)
+                        if len(header) != 8 or len(page) != page_size:
+                            raise BackupError(f'Truncated page data in {backup_id}')
+                        out.seek(int.from_bytes(header, 'big') * page_size)
+                        out.write(page)
+                    out.truncate(backup['page_count'] * page_size)
+
+            if _sha256(dest_path) != backup['sha256']:
+                raise BackupError(f'Checksum mismatch restoring {backup_id}')
+
+        problems = integrity_check(dest_path)
+        if problems:
+            raise BackupError('Restored database failed integrity check: ' + '; '.join(problems[:5]))
+        return backup
+
+    def restore_live(self, backup_id, prepare=None, before_swap=None):
+        """Replace the live database's content with a verified backup.
+
+        The backup is rebuilt into a temporary file next to the database,
+        verified, passed to prepare(path) (schema checks and upgrades), and then,
+        after before_swap() (e.g. a safety backup of the current state), copied
+        over the live database with the backup API in one transaction.
+        Going through SQLite rather than renaming files keeps the swap atomic
+        for open connections and safe with a WAL file present.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.db_path), prefix='.restore-', suffix='.db')
+        os.close(fd)
+        try:
+            backup = self.restore_to(backup_id, tmp_path)
+            if prepare:
+                prepare(tmp_path)
+            if before_swap:
+                before_swap()
+            source = sqlite3.connect(tmp_path)
+            dest = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                source.backup(dest)
+            finally:
+                dest.close()
+                source.close()
+            return backup
+        finally:
+            for path in (tmp_path, tmp_path + '-journal', tmp_path + '-wal', tmp_path + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def verify(self, backup_id):
+        """Restore into a temporary file to prove the backup is usable"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.backup_dir, prefix='.verify-', suffix='.db')
+        os.close(fd)
+        try:
+            self.restore_to(backup_id, tmp_path)
+            return True
+        finally:
+            os.remove(tmp_path)
@@ -0,0 +1,306 @@
+"""Printable badge sheets: employee badges on A4 pages, as a streamed PDF.
+
+Each page holds a grid of ID-card sized badges (photo, name, PluriId,
+department and the employee's QR code). Badges are prepared in a process
+pool, a page at a time, while the pages already done are sent; only the
+pages in flight are ever held in memory. The pool is started on the first
+sheet of more than one page and kept for the life of the process; a
+single page is prepared inline. The cropped photos and QR code
+paths are kept in a cache directory, so reprinting a department only
+lays out the pages.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from PIL import Image, ImageOps
+from qr_images import qr_matrix, QR_RENDER_VERSION
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import zlib
+
+# Points (1/72 inch)
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89
+# ID-1 card size, 85.6 x 54 mm
+BADGE_WIDTH, BADGE_HEIGHT = 242.65, 153.07
+BADGE_COLUMNS, BADGE_ROWS = 2, 5
+BADGES_PER_PAGE = BADGE_COLUMNS * BADGE_ROWS
+PADDING = 10
+PHOTO_WIDTH, PHOTO_HEIGHT = 64, 80
+# Side of the QR code square, quiet zone included
+QR_SIZE = BADGE_HEIGHT - 2 * PADDING
+# Photo resolution, about 180 dpi
+PHOTO_PIXELS = (160, 200)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _truncate(text, size, width):
+    """Cut text to fit width at a font size, from Helvetica's average glyph width"""
+    max_chars = int(width / (size * 0.55))
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '…'
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _cached(cache_dir, key, build):
+    """build() computed once per key and kept as a file in cache_dir; None is not kept"""
+    if cache_dir is None:
+        return build()
+    path = os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest())
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    data = build()
+    if data is not None:
+        # Write then rename, so other processes never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return data
+
+
+def _qr_path(qr_data):
+    """PDF path of the dark modules in a unit square, one rectangle per horizontal run"""
+    matrix = qr_matrix(qr_data)
+    size = len(matrix)
+    ops = []
+    for row, modules in enumerate(matrix):
+        y = size - 1 - row
+        column = 0
+        while column < size:
+            if not modules[column]:
+                column += 1
+                continue
+            start = column
+            while column < size and modules[column]:
+                column += 1
+            ops.append(f'{start} {y} {column - start} 1 re')
+    # Module count first, for scaling the path to the badge
+    return f'{size}\n'.encode() + ' '.join(ops).encode()
+
+
+def _photo_jpeg(path):
+    """JPEG bytes of the photo cropped to the badge frame, or None if unreadable"""
+    size = PHOTO_PIXELS
+    try:
+        with Image.open(path) as image:
+            # Decode JPEGs at a reduced scale directly; profile photos are often full camera size
+            image.draft('RGB', (size[0] * 2, size[1] * 2))
+            image = ImageOps.fit(ImageOps.exif_transpose(image).convert('RGB'), size)
+    except (OSError, ValueError):
+        return None
+    output = BytesIO()
+    image.save(output, format='JPEG', quality=85)
+    return output.getvalue()
+
+
+def _cached_photo(cache_dir, path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    # A replaced photo has a new size or mtime, hence a new key
+    key = f'photo:{PHOTO_PIXELS}:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return _cached(cache_dir, key, lambda: _photo_jpeg(path))
+
+
+def prepare_badges(badges, cache_dir=None):
+    """QR path and photo of each badge of one page (runs in a worker process).
+
+    badges are (pluri_id, full_name, department, qr_data, photo_path)
+    tuples; photo_path may be None.
+    """
+    prepared = []
+    for pluri_id, full_name, department, qr_data, photo_path in badges:
+        modules, path = _cached(cache_dir, f'qr:{QR_RENDER_VERSION}:{qr_data}',
+                                lambda: _qr_path(qr_data)).split(b'\n', 1)
+        prepared.append({
+            'pluri_id': pluri_id,
+            'full_name': full_name,
+            'department': department or '',
+            'qr': (int(modules), path),
+            'photo': _cached_photo(cache_dir, photo_path) if photo_path else None,
+        })
+    return prepared
+
+
+def _page_content(badges):
+    """Content stream and photo images of one page"""
+    ops = [b'0.5 w 0.75 G']
+    photos = []
+    text_width = BADGE_WIDTH - QR_SIZE - 2 * PADDING
+    left = (PAGE_WIDTH - BADGE_COLUMNS * BADGE_WIDTH) / 2
+    top = PAGE_HEIGHT - (PAGE_HEIGHT - BADGE_ROWS * BADGE_HEIGHT) / 2
+    for index, badge in enumerate(badges):
+        x = left + (index % BADGE_COLUMNS) * BADGE_WIDTH
+        y = top - (index // BADGE_COLUMNS + 1) * BADGE_HEIGHT
+        # Cut guide
+        ops.append(f'{x:.2f} {y:.2f} {BADGE_WIDTH} {BADGE_HEIGHT} re S'.encode())
+
+        photo_x, photo_y = x + PADDING, y + BADGE_HEIGHT - PADDING - PHOTO_HEIGHT
+        if badge['photo']:
+            ops.append(f'q {PHOTO_WIDTH} 0 0 {PHOTO_HEIGHT} {photo_x:.2f} {photo_y:.2f} cm '
+                       f'/Im{len(photos)} Do Q'.encode())
+            photos.append(badge['photo'])
+        else:
+            ops.append(f'q 0.9 g {photo_x:.2f} {photo_y:.2f} {PHOTO_WIDTH} {PHOTO_HEIGHT} re f Q'.encode())
+
+        lines = [('F2', 8.5, name) for name in badge['full_name'].split(' ', 1)]
+        lines += [('F2', 11, badge['pluri_id']), ('F1', 6.5, badge['department'])]
+        text_y = photo_y - 4
+        for font, size, text in lines:
+            text_y -= size + 2
+            ops.append(b'BT /%s %.1f Tf %.2f %.2f Td %s Tj ET' % (
+                font.encode(), size, photo_x, text_y, _pdf_string(_truncate(text, size, text_width))))
+
+        modules, path = badge['qr']
+        scale = QR_SIZE / modules
+        ops.append(b'q 0 g %.4f 0 0 %.4f %.2f %.2f cm %s f Q' % (
+            scale, scale, x + BADGE_WIDTH - PADDING - QR_SIZE, y + PADDING, path))
+    return b'\n'.join(ops), photos
+
+
+class PDFStream:
+    """Minimal PDF writer emitting each object as soon as it is complete.
+
+    Only the byte offsets of the objects are kept until the cross-reference
+    table at the end; the page tree object is reserved first and written
+    last, once all its pages are known.
+    """
+
+    CATALOG, PAGES, FONT, FONT_BOLD = 1, 2, 3, 4
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.pages = []
+
+    def _emit(self, data):
+        self.position += len(data)
+        return data
+
+    def _object(self, number, body, stream=None):
+        self.offsets[number] = self.position
+        data = b'%d 0 obj\n%s\n' % (number, body)
+        if stream is not None:
+            data += b'stream\n' + stream + b'\nendstream\n'
+        return self._emit(data + b'endobj\n')
+
+    def _next_number(self):
+        return max(self.offsets, default=self.FONT_BOLD) + 1
+
+    def start(self):
+        data = self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        data += self._object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        for number, font in ((self.FONT, b'Helvetica'), (self.FONT_BOLD, b'Helvetica-Bold')):
+            data += self._object(number, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s '
+                                         b'/Encoding /WinAnsiEncoding >>' % font)
+        return data
+
+    def page(self, content, images, image_size):
+        """One page from its content stream and its JPEG images /Im0, /Im1..., all image_size pixels"""
+        width, height = image_size
+        data = b''
+        xobjects = []
+        for index, jpeg in enumerate(images):
+            number = self._next_number()
+            data += self._object(number, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d '
+                                         b'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode '
+                                         b'/Length %d >>' % (width, height, len(jpeg)), jpeg)
+            xobjects.append(b'/Im%d %d 0 R' % (index, number))
+
+        compressed = zlib.compress(content)
+        content_number = self._next_number()
+        data += self._object(content_number, b'<< /Filter /FlateDecode /Length %d >>' % len(compressed),
+                             compressed)
+        page_number = self._next_number()
+        data += self._object(page_number, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << %s >> >> >>'
+        ) % (self.PAGES, PAGE_WIDTH, PAGE_HEIGHT, content_number, self.FONT, self.FONT_BOLD,
+             b' '.join(xobjects)))
+        self.pages.append(page_number)
+        return data
+
+    def finish(self):
+        kids = b' '.join(b'%d 0 R' % number for number in self.pages)
+        data = self._object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        xref_position = self.position
+        size = max(self.offsets) + 1
+        data += b'xref\n0 %d\n0000000000 65535 f \n' % size
+        data += b''.join(b'%010d 00000 n \n' % self.offsets[number] for number in range(1, size))
+        data += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            size, self.CATALOG, xref_position)
+        return data
+
+
+def _shared_pool(workers):
+    """The process pool preparing pages, started once per process"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: never fork a process holding SQLite connections and threads
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def badge_sheet_pdf(badges, cache_dir=None, workers=None):
+    """Yield the PDF for badges, the tuples taken by prepare_badges, page by page.
+
+    Pages are prepared by the shared process pool; at most two pages per
+    worker are in flight at once for this sheet.
+    """
+    workers = workers or os.cpu_count() or 1
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    pdf = PDFStream()
+    yield pdf.start()
+    pages = [badges[start:start + BADGES_PER_PAGE] for start in range(0, len(badges), BADGES_PER_PAGE)]
+    if len(pages) <= 1:
+        for page in pages:
+            yield pdf.page(*_page_content(prepare_badges(page, cache_dir)), PHOTO_PIXELS)
+        yield pdf.finish()
+        return
+
+    pool = _shared_pool(workers)
+    in_flight = deque()
+    try:
+        queued = iter(pages)
+        for page in queued:
+            in_flight.append(pool.submit(prepare_badges, page, cache_dir))
+            if len(in_flight) >= 2 * workers:
+                break
+        while in_flight:
+            prepared = in_flight.popleft().result()
+            page = next(queued, None)
+            if page is not None:
+                in_flight.append(pool.submit(prepare_badges, page, cache_dir))
+            yield pdf.page(*_page_content(prepared), PHOTO_PIXELS)
+        yield pdf.finish()
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); the next sheet starts a new pool
+        _discard_pool(pool)
+        raise
+    finally:
+        # Left over when the client disconnects mid-download
+        for future in in_flight:
+            future.cancel()
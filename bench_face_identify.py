@@ -0,0 +1,48 @@
+"""Benchmark 1:N face identification against a synthetic enrolled population.
+
+Usage: python bench_face_identify.py [enrolled] [queries] [target_ms]
+Exits non-zero when the p99 search latency exceeds the target.
+"""
+from face_service import FaceIndex, MATCH_TOLERANCE
+import numpy as np
+import sys
+import time
+
+
+def run(enrolled=5000, queries=1000, target_ms=5.0, seed=0):
+    rng = np.random.default_rng(seed)
+    # face_recognition encodings are roughly unit-norm 128-d vectors
+    encodings = rng.normal(size=(enrolled, 128))
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    index = FaceIndex(range(1, enrolled + 1), encodings)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    targets = rng.integers(0, enrolled, size=queries)
+    probes = encodings[targets] + rng.normal(scale=0.01, size=(queries, 128))
+
+    latencies = []
+    correct = 0
+    for target, probe in zip(targets, probes):
+        start = time.perf_counter()
+        matches = index.search(probe, top_k=3, tolerance=MATCH_TOLERANCE)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if matches and matches[0][0] == target + 1:
+            correct += 1
+
+    latencies = np.array(latencies)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"Enrolled faces:  {enrolled}")
+    print(f"Index build:     {build_ms:.1f} ms")
+    print(f"Search p50/p99:  {p50:.3f} / {p99:.3f} ms (target {target_ms} ms)")
+    print(f"Top-1 accuracy:  {correct / queries:.1%}")
+    return p99 <= target_ms
+
+
+if __name__ == '__main__':
+    args = [float(arg) for arg in sys.argv[1:]]
+    enrolled = int(args[0]) if len(args) > 0 else 5000
+    queries = int(args[1]) if len(args) > 1 else 1000
+    target_ms = args[2] if len(args) > 2 else 5.0
+    sys.exit(0 if run(enrolled, queries, target_ms) else 1)
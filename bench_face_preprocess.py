@@ -0,0 +1,90 @@
+"""Compare the legacy full-size face encoding path with the preprocessing pipeline.
+
+Usage: python bench_face_preprocess.py [image_dir] [max_dimension] [detect_dimension]
+
+For every image the legacy path (full-size decode + face_encodings with its own
+detection) and the new path (draft decode, downscale, HOG pass on a reduced
+copy, crop, encode at a known location) are timed. Accuracy is reported as how
+often both paths find a face and agree within MATCH_TOLERANCE. Without
+face_recognition installed only the decode/downscale stage is measured.
+"""
+from face_service import (FACE_RECOGNITION_ENABLED, MATCH_TOLERANCE, MAX_DIMENSION, DETECT_DIMENSION,
+                          prepare_image, compute_encoding, face_distance)
+from PIL import Image
+import numpy as np
+import os
+import sys
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def legacy_encoding(path):
+    import face_recognition
+    image = np.array(Image.open(path).convert('RGB'))
+    encodings = face_recognition.face_encodings(image)
+    return encodings[0] if encodings else None
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def run(image_dir, max_dimension=MAX_DIMENSION, detect_dimension=DETECT_DIMENSION):
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print(f"No images found in {image_dir}")
+        return
+
+    decode_full, decode_small, legacy_ms, pipeline_ms, distances = [], [], [], [], []
+    both_found = agree = only_legacy = only_pipeline = 0
+
+    for path in paths:
+        _, elapsed = timed(lambda: np.array(Image.open(path).convert('RGB')))
+        decode_full.append(elapsed)
+        image, elapsed = timed(prepare_image, path, max_dimension)
+        decode_small.append(elapsed)
+
+        if not FACE_RECOGNITION_ENABLED:
+            continue
+        legacy, elapsed = timed(legacy_encoding, path)
+        legacy_ms.append(elapsed)
+        start = time.perf_counter()
+        pipeline = compute_encoding(prepare_image(path, max_dimension), detect_dimension)
+        pipeline_ms.append((time.perf_counter() - start) * 1000)
+
+        if legacy is not None and pipeline is not None:
+            both_found += 1
+            distance = face_distance(legacy, pipeline)
+            distances.append(distance)
+            agree += distance <= MATCH_TOLERANCE
+        elif legacy is not None:
+            only_legacy += 1
+        elif pipeline is not None:
+            only_pipeline += 1
+
+    print(f"Images: {len(paths)}  max_dimension={max_dimension}  detect_dimension={detect_dimension}")
+    print(f"Decode full size:      {np.mean(decode_full):8.1f} ms/image")
+    print(f"Decode + downscale:    {np.mean(decode_small):8.1f} ms/image")
+    if not FACE_RECOGNITION_ENABLED:
+        print("face_recognition is not installed: encoding latency and accuracy skipped")
+        return
+    print(f"Legacy encode:         {np.mean(legacy_ms):8.1f} ms/image (p95 {np.percentile(legacy_ms, 95):.1f})")
+    print(f"Pipeline encode:       {np.mean(pipeline_ms):8.1f} ms/image (p95 {np.percentile(pipeline_ms, 95):.1f})")
+    print(f"Speed-up:              {np.mean(legacy_ms) / np.mean(pipeline_ms):8.2f}x")
+    print(f"Faces found by both:   {both_found}  (legacy only: {only_legacy}, pipeline only: {only_pipeline})")
+    if distances:
+        print(f"Same-face agreement:   {agree / both_found:.1%} within tolerance {MATCH_TOLERANCE}, "
+              f"mean distance {np.mean(distances):.3f}")
+
+
+if __name__ == '__main__':
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join('static', 'uploads', 'profiles')
+    max_dimension = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_DIMENSION
+    detect_dimension = int(sys.argv[3]) if len(sys.argv) > 3 else DETECT_DIMENSION
+    run(image_dir, max_dimension, detect_dimension)
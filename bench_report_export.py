@@ -0,0 +1,91 @@
+"""Benchmark the streaming report export on a synthetic attendance history.
+
+Usage: python bench_report_export.py [employees] [days] [--baseline]
+
+Builds employees x days Attendance rows (1000 x 1000 = one million by
+default) in a scratch SQLite file, rolls them up, then downloads the
+per-day detail export in each available format through the app while
+tracking peak memory. --baseline also loads the same rows with .all() to
+show what materializing them costs.
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp()
+os.environ['DB_PATH'] = os.path.join(TMP_DIR, 'attendance.db')
+os.environ.pop('DATABASE_URL', None)
+
+from app import app, config
+from models import db, User, DailyAttendanceSummary
+from reports import EXPORT_FORMATS, detail_query
+from sqlalchemy import text
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def populate(employees, days):
+    with app.app_context():
+        admin = User(username='bench-admin', is_admin=True)
+        admin.set_password('bench-password')
+        db.session.add(admin)
+        db.session.execute(text("""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :employees)
+            INSERT INTO employee (pluri_id, first_name, last_name, email, department, position, hire_date, dob)
+            SELECT printf('B%06d', i), 'Bench', i, 'bench' || i || '@example.com',
+                   'Dept ' || (i % 5), 'Position', '2020-01-01', '1990-01-01'
+            FROM n
+        """), {'employees': employees})
+        db.session.execute(text("""
+            WITH RECURSIVE d(day) AS (SELECT 0 UNION ALL SELECT day + 1 FROM d WHERE day < :days - 1),
+            sessions AS (
+                SELECT e.id AS employee_id,
+                       datetime('2021-01-01 07:30:00', '+' || d.day || ' days',
+                                '+' || ((e.id * 7919 + d.day * 104729) % 5400) || ' seconds') AS check_in
+                FROM employee e CROSS JOIN d
+            )
+            INSERT INTO attendance (employee_id, check_in, check_out, total_hours)
+            SELECT employee_id, check_in, datetime(check_in, '+8 hours'), 8 FROM sessions
+        """), {'days': days})
+        db.session.commit()
+        DailyAttendanceSummary.rebuild(in_time=config.in_time)
+
+
+def run(employees=1000, days=1000, baseline=False):
+    start = time.perf_counter()
+    populate(employees, days)
+    print(f"Synthetic history: {employees * days} attendance rows in {time.perf_counter() - start:.1f} s")
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'bench-admin', 'password': 'bench-password'})
+    for export_format, (_, _, _, available) in EXPORT_FORMATS.items():
+        if not available:
+            print(f"{export_format}: not installed, skipped")
+            continue
+        before = peak_rss_mb()
+        start = time.perf_counter()
+        response = client.get(f'/api/report_data/export?format={export_format}&detail=true', buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        elapsed = time.perf_counter() - start
+        print(f"{export_format}: {size / 1e6:.1f} MB in {elapsed:.1f} s "
+              f"({employees * days / elapsed:,.0f} rows/s), peak RSS {peak_rss_mb():.0f} MB "
+              f"(+{peak_rss_mb() - before:.0f} MB)")
+
+    if baseline:
+        before = peak_rss_mb()
+        with app.app_context():
+            rows = detail_query({}).all()
+        print(f"baseline .all(): {len(rows)} rows, peak RSS {peak_rss_mb():.0f} MB (+{peak_rss_mb() - before:.0f} MB)")
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:] if not arg.startswith('--')]
+    run(employees=args[0] if len(args) > 0 else 1000,
+        days=args[1] if len(args) > 1 else 1000,
+        baseline='--baseline' in sys.argv)
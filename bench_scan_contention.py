@@ -0,0 +1,109 @@
+"""Write-contention benchmark: concurrent /scan requests against one SQLite file.
+
+Usage: python bench_scan_contention.py [workers] [threads] [employees] [--compare]
+
+Each worker is a separate process importing the app, like a gunicorn worker,
+and runs `threads` clients that check employees in and out through /scan.
+The database is a fresh file in a temporary directory. With --compare the
+run is repeated with SQLITE_TUNING=0 (rollback journal, no pragmas or pooling).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ADMIN_USERNAME = 'bench-admin'
+ADMIN_PASSWORD = 'bench-password'
+
+
+def setup_database(employees):
+    from datetime import date
+    from app import app
+    from models import db, User, Employee
+
+    with app.app_context():
+        admin = User(username=ADMIN_USERNAME, is_admin=True)
+        admin.set_password(ADMIN_PASSWORD)
+        db.session.add(admin)
+        for i in range(employees):
+            db.session.add(Employee(
+                pluri_id=f'BENCH{i:05d}', first_name='Bench', last_name=str(i),
+                email=f'bench{i}@example.com', hire_date=date(2020, 1, 1),
+                dob=date(1990, 1, 1), qr_data=f'bench-qr-{i}'
+            ))
+        db.session.commit()
+
+
+def run_worker(worker, workers, threads, employees, results):
+    from app import app
+
+    def client_loop(thread):
+        client = app.test_client()
+        client.post('/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+        latencies, errors = [], 0
+        # Each client owns a disjoint slice of employees: one check-in and one check-out each
+        slot = worker * threads + thread
+        owned = range(slot, employees, workers * threads)
+        for _ in range(2):
+            for i in owned:
+                start = time.perf_counter()
+                response = client.post('/scan', json={'qr_data': f'bench-qr-{i}'})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200 or response.get_json().get('status') != 'success':
+                    errors += 1
+        return latencies, errors
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = list(executor.map(client_loop, range(threads)))
+    latencies = [latency for outcome in outcomes for latency in outcome[0]]
+    results.put((latencies, sum(outcome[1] for outcome in outcomes), started, time.time()))
+
+
+def run(workers=4, threads=4, employees=400, tuned=True):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DB_PATH'] = os.path.join(tmp, 'attendance.db')
+        os.environ['SQLITE_TUNING'] = '1' if tuned else '0'
+
+        setup = context.Process(target=setup_database, args=(employees,))
+        setup.start()
+        setup.join()
+
+        results = context.Queue()
+        processes = [
+            context.Process(target=run_worker, args=(worker, workers, threads, employees, results))
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        # Wall time from the first worker starting its clients to the last finishing
+        elapsed = max(outcome[3] for outcome in outcomes) - min(outcome[2] for outcome in outcomes)
+
+    latencies = sorted(latency for outcome in outcomes for latency in outcome[0])
+    errors = sum(outcome[1] for outcome in outcomes)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{'Tuned (WAL)' if tuned else 'Driver defaults'}:")
+    print(f"  Scans:           {len(latencies)} from {workers} workers x {threads} threads")
+    print(f"  Errors:          {errors}")
+    print(f"  Throughput:      {len(latencies) / elapsed:.0f} scans/s")
+    print(f"  Latency p50/p99: {p50:.1f} / {p99:.1f} ms")
+    return errors
+
+
+if __name__ == '__main__':
+    compare = '--compare' in sys.argv
+    args = [int(arg) for arg in sys.argv[1:] if not arg.startswith('--')]
+    workers = args[0] if len(args) > 0 else 4
+    threads = args[1] if len(args) > 1 else 4
+    employees = args[2] if len(args) > 2 else 400
+    errors = run(workers, threads, employees, tuned=True)
+    if compare:
+        run(workers, threads, employees, tuned=False)
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,36 @@
+import os
+
+
+class ChangeStamp:
+    """Shared file whose mtime tells other workers that a cache is stale.
+
+    The writer calls touch() after changing rows; readers call changed() on
+    each lookup, which costs one stat() and no database query.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.seen = self.read()
+
+    def read(self):
+        if not self.path:
+            return None
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def changed(self):
+        current = self.read()
+        if current != self.seen:
+            self.seen = current
+            return True
+        return False
+
+    def touch(self):
+        if not self.path:
+            return
+        with open(self.path, 'a'):
+            pass
+        os.utime(self.path)
+        self.seen = self.read()
@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import os
+import tempfile
+import threading
+# File locks are POSIX only; fall back to the in-process lock elsewhere
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class ConfigService:
+    """Cached access to config.json shared by every route of a worker.
+
+    The file is parsed once and re-read only when its mtime changes (another
+    worker saved it) or after invalidate(). Writes take an exclusive lock and
+    replace the file atomically so readers never see a half-written file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._data = {}
+        self._in_time = None
+        self._out_time = None
+
+    def _load(self):
+        stat = os.stat(self.path)
+        # Atomic replaces give the file a new inode, so this also catches
+        # writes landing within the same mtime tick
+        mtime = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if mtime == self._mtime:
+            return
+        with open(self.path) as config_file:
+            data = json.load(config_file)
+        self._data = data
+        self._in_time = datetime.strptime(data['inTime'], "%H:%M:%S").time()
+        self._out_time = datetime.strptime(data['outTime'], "%H:%M:%S").time()
+        self._mtime = mtime
+
+    def get(self, key=None, default=None):
+        """Return the whole config (a copy) or a single key"""
+        with self._lock:
+            self._load()
+            if key is None:
+                return dict(self._data)
+            return self._data.get(key, default)
+
+    @property
+    def in_time(self):
+        with self._lock:
+            self._load()
+            return self._in_time
+
+    @property
+    def out_time(self):
+        with self._lock:
+            self._load()
+            return self._out_time
+
+    def invalidate(self):
+        with self._lock:
+            self._mtime = None
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, changes):
+        """Merge changes into config.json and write it atomically"""
+        with self._lock, self._file_lock():
+            # Re-read under the lock so concurrent writers don't drop each other's keys
+            self._mtime = None
+            self._load()
+            data = {**self._data, **changes}
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.config-', suffix='.json')
+            try:
+                os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777)
+                with os.fdopen(fd, 'w') as tmp_file:
+                    json.dump(data, tmp_file, indent=4)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self._mtime = None
+            self._load()
+            return dict(self._data)
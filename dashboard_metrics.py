@@ -0,0 +1,106 @@
+from datetime import datetime
+from cache_stamp import ChangeStamp
+from models import db, Employee, Attendance, DailyAttendanceSummary
+from database import time_of_day
+from analytics import attendance_histogram, period_range
+import threading
+import time
+
+
+class DashboardMetrics:
+    """Dashboard KPIs, computed in a handful of grouped queries and cached.
+
+    Each worker keeps the last snapshot for ttl seconds. Scans and employee
+    changes call invalidate(), which drops it here and touches a stamp file
+    so that the other workers recompute on their next dashboard load. The
+    snapshot is also keyed by the day and the schedule settings, so it never
+    outlives a change of either.
+    """
+
+    def __init__(self, ttl=10, stamp_path=None):
+        self.ttl = ttl
+        self.stamp = ChangeStamp(stamp_path)
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = None
+        self._key = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def get(self, config):
+        """Return the snapshot dict for today (requires an app context)"""
+        key = (datetime.now().date(), config.in_time, config.out_time, bool(config.get('lateComers')))
+        with self._lock:
+            if self.stamp.changed():
+                self._snapshot = None
+            if self._snapshot is not None and self._key == key and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+
+        snapshot = self.compute(*key)
+        with self._lock:
+            self._snapshot, self._key = snapshot, key
+            self._expires = time.monotonic() + self.ttl
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+            self.stamp.touch()
+
+    @staticmethod
+    def compute(today, in_time, out_time, count_latecomers=True):
+        today_start = datetime.combine(today, datetime.min.time())
+
+        # Employees who scanned during working hours today; the others are on leave
+        present_in_hours = db.session.query(Attendance.employee_id).filter(
+            db.or_(
+                time_of_day(Attendance.check_in).between(in_time, out_time),
+                time_of_day(Attendance.check_out).between(in_time, out_time)
+            ),
+            Attendance.check_in >= today_start
+        ).distinct().subquery()
+        present_today = db.session.query(db.func.count(DailyAttendanceSummary.id)).filter(
+            DailyAttendanceSummary.date == today
+        ).scalar_subquery()
+        late_today = db.session.query(db.func.count(DailyAttendanceSummary.id)).filter(
+            DailyAttendanceSummary.date == today,
+            DailyAttendanceSummary.is_late.is_(True)
+        ).scalar_subquery()
+
+        counts = db.session.query(
+            db.func.count(Employee.id).label('total'),
+            db.func.sum(db.case((Employee.gender == 'male', 1), else_=0)).label('male'),
+            db.func.sum(db.case((Employee.gender == 'female', 1), else_=0)).label('female'),
+            db.func.count(present_in_hours.c.employee_id).label('working'),
+            present_today.label('present'),
+            late_today.label('late'),
+        ).outerjoin(present_in_hours, present_in_hours.c.employee_id == Employee.id).one()
+
+        start, end, granularity, label_format = period_range('week')
+        histogram = attendance_histogram(start, end, granularity)
+
+        # Plain rows rather than ORM objects, so the snapshot can outlive the session
+        today_attendance = db.session.query(
+            Employee.pluri_id,
+            (Employee.first_name + ' ' + Employee.last_name).label('full_name'),
+            Employee.department,
+            Attendance.check_in,
+            Attendance.check_out,
+            Attendance.total_hours,
+        ).join(Employee, Employee.id == Attendance.employee_id).filter(
+            Attendance.check_in >= today_start
+        ).order_by(Attendance.check_in).all()
+
+        return {
+            'total_employees': counts.total,
+            'present_employees': counts.present,
+            'latecomers': counts.late if count_latecomers else 0,
+            'employees_on_leave': counts.total - counts.working,
+            'male_employees': int(counts.male or 0),
+            'female_employees': int(counts.female or 0),
+            'activity_labels': [day.strftime(label_format) for day, _ in histogram],
+            'activity_data': [count for _, count in histogram],
+            'today_attendance': today_attendance,
+        }
@@ -0,0 +1,186 @@
+from sqlalchemy import event, Date, DateTime, Float, String, Time
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.functions import FunctionElement
+import os
+
+# Applied to every new SQLite connection. WAL lets readers and the single
+# writer proceed concurrently across gunicorn workers, and synchronous=NORMAL
+# only fsyncs at checkpoints instead of on every commit (still durable
+# against application crashes, may lose the last commits on power loss).
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -20000),       # negative = KiB, i.e. ~20 MB per connection
+    ('mmap_size', 134217728),     # 128 MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+)
+
+
+def database_uri(default_path):
+    """DATABASE_URL from the environment, or the SQLite file at default_path"""
+    uri = os.environ.get('DATABASE_URL')
+    if not uri:
+        return f'sqlite:///{default_path}'
+    # Hosting providers still hand out the scheme SQLAlchemy 1.4 dropped
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def sqlite_path(uri):
+    """Filesystem path of a SQLite database URI, or None for other backends"""
+    return make_url(uri).database if is_sqlite_file(uri) else None
+
+
+def is_sqlite_file(uri):
+    return uri.startswith('sqlite') and uri not in ('sqlite://', 'sqlite:///:memory:')
+
+
+def engine_options(uri, tuned=True):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database"""
+    if not uri.startswith('sqlite'):
+        # Server databases: replace connections the server dropped while idle
+        return {'pool_size': 5, 'max_overflow': 10, 'pool_pre_ping': True, 'pool_recycle': 1800}
+    if not is_sqlite_file(uri):
+        return {}
+    options = {
+        # Wait on a locked database instead of failing with "database is locked"
+        'connect_args': {'timeout': 30, 'check_same_thread': False},
+    }
+    if tuned:
+        # Keep connections (and their page cache / mmap) open between requests
+        options.update(poolclass=QueuePool, pool_size=5, max_overflow=10, pool_timeout=30)
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas=SQLITE_PRAGMAS):
+    """Run the pragmas on each connection the engine opens"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+# Portable date arithmetic. Each expression compiles to standard SQL
+# (PostgreSQL) by default and to SQLite's date functions on SQLite.
+
+class date_of(FunctionElement):
+    """Calendar date of a datetime column"""
+    type = Date()
+    name = 'date_of'
+    inherit_cache = True
+
+
+@compiles(date_of)
+def _date_of(element, compiler, **kw):
+    return 'CAST(%s AS DATE)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(date_of, 'sqlite')
+def _date_of_sqlite(element, compiler, **kw):
+    return 'date(%s)' % compiler.process(element.clauses, **kw)
+
+
+class time_of_day(FunctionElement):
+    """Time-of-day part of a datetime column, comparable with datetime.time values"""
+    type = Time()
+    name = 'time_of_day'
+    inherit_cache = True
+
+
+@compiles(time_of_day)
+def _time_of_day(element, compiler, **kw):
+    return 'CAST(%s AS TIME)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(time_of_day, 'sqlite')
+def _time_of_day_sqlite(element, compiler, **kw):
+    return 'time(%s)' % compiler.process(element.clauses, **kw)
+
+
+class at_time(FunctionElement):
+    """at_time(column, 'HH:MM:SS'): the given time of day on the date of a datetime column"""
+    type = DateTime()
+    name = 'at_time'
+    inherit_cache = True
+
+
+@compiles(at_time)
+def _at_time(element, compiler, **kw):
+    column, time_text = list(element.clauses)
+    return '(CAST(%s AS DATE) + CAST(%s AS TIME))' % (compiler.process(column, **kw), compiler.process(time_text, **kw))
+
+
+@compiles(at_time, 'sqlite')
+def _at_time_sqlite(element, compiler, **kw):
+    column, time_text = list(element.clauses)
+    return "datetime(date(%s) || ' ' || %s)" % (compiler.process(column, **kw), compiler.process(time_text, **kw))
+
+
+class seconds_between(FunctionElement):
+    """seconds_between(start, end): duration in seconds, NULL if either is NULL"""
+    type = Float()
+    name = 'seconds_between'
+    inherit_cache = True
+
+
+@compiles(seconds_between)
+def _seconds_between(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return 'EXTRACT(EPOCH FROM (%s - %s))' % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+@compiles(seconds_between, 'sqlite')
+def _seconds_between_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return '((julianday(%s) - julianday(%s)) * 86400.0)' % (compiler.process(end, **kw), compiler.process(start, **kw))
+
+
+# Bucket keys are text so that Python can build the same key with strftime
+BUCKET_FORMATS = {
+    'hour': ('YYYY-MM-DD HH24:00', '%Y-%m-%d %H:00'),
+    'day': ('YYYY-MM-DD', '%Y-%m-%d'),
+    'month': ('YYYY-MM', '%Y-%m'),
+}
+
+
+class date_bucket(FunctionElement):
+    """Text key of the hour/day/week/month bucket holding a datetime column.
+
+    Weeks start on Monday and are keyed by that Monday's date.
+    """
+    type = String()
+    name = 'date_bucket'
+    # The granularity is a plain attribute, not part of the cache key
+    inherit_cache = False
+
+    def __init__(self, column, granularity):
+        if granularity not in BUCKET_FORMATS and granularity != 'week':
+            raise ValueError(f'Unknown granularity: {granularity}')
+        self.granularity = granularity
+        super().__init__(column)
+
+
+@compiles(date_bucket)
+def _date_bucket(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    if element.granularity == 'week':
+        return "to_char(date_trunc('week', %s), 'YYYY-MM-DD')" % column
+    return "to_char(%s, '%s')" % (column, BUCKET_FORMATS[element.granularity][0])
+
+
+@compiles(date_bucket, 'sqlite')
+def _date_bucket_sqlite(element, compiler, **kw):
+    column = compiler.process(element.clauses, **kw)
+    if element.granularity == 'week':
+        # 'weekday 0' moves forward to Sunday, then back to that week's Monday
+        return "date(%s, 'weekday 0', '-6 days')" % column
+    return "strftime('%s', %s)" % (BUCKET_FORMATS[element.granularity][1], column)
@@ -0,0 +1,281 @@
+"""Bulk employee import from a CSV or XLSX spreadsheet.
+
+Usage: python employee_import.py <file.csv|file.xlsx> [--dry-run] [--skip-invalid] [--workers N]
+
+The first row holds the column names, as in the employee form: full_name
+(or first_name and last_name), email, phone, gender, dob, department, role
+(or position) and hire_date. Dates are YYYY-MM-DD or DD/MM/YYYY.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from io import StringIO
+from models import db, Employee, User, new_pluri_id, new_qr_data
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+import csv
+import json
+import multiprocessing
+import os
+import sys
+# XLSX files need openpyxl
+try:
+    from openpyxl import load_workbook
+    XLSX_AVAILABLE = True
+except ImportError:
+    XLSX_AVAILABLE = False
+
+REQUIRED_FIELDS = ('email', 'dob', 'hire_date')
+GENDERS = ('male', 'female')
+# Rows per bulk insert
+IMPORT_BATCH_SIZE = 500
+COLUMN_ALIASES = {'position': 'role', 'nom_complet': 'full_name', 'nom': 'full_name'}
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def read_rows(stream, filename):
+    """Spreadsheet rows as dicts keyed by normalized column name"""
+    extension = os.path.splitext(filename.lower())[1]
+    if extension == '.csv':
+        text = stream.read()
+        if isinstance(text, bytes):
+            text = text.decode('utf-8-sig')
+        try:
+            # Spreadsheets saved in French locales use ';'
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        table = list(csv.reader(StringIO(text), dialect))
+    elif extension == '.xlsx':
+        if not XLSX_AVAILABLE:
+            raise ImportFileError('Import XLSX non disponible sur ce serveur (openpyxl manquant)')
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        table = [list(row) for row in workbook.active.iter_rows(values_only=True)]
+        workbook.close()
+    else:
+        raise ImportFileError('Format de fichier non pris en charge (CSV ou XLSX attendu)')
+
+    if not table:
+        raise ImportFileError('Fichier vide')
+    header = [str(name or '').strip().lower().replace(' ', '_') for name in table[0]]
+    header = [COLUMN_ALIASES.get(name, name) for name in header]
+    rows = []
+    for values in table[1:]:
+        if all(value in (None, '') for value in values):
+            continue
+        rows.append({name: value for name, value in zip(header, values) if name})
+    return rows
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _text(value)
+    for date_format in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(text)
+
+
+def validate_rows(rows, existing_emails):
+    """(line, employee fields or None, error messages) for every row.
+
+    line is the spreadsheet line number (the header is line 1). Emails
+    must be unique across the file and existing_emails.
+    """
+    seen_emails = {}
+    results = []
+    for line, row in enumerate(rows, start=2):
+        errors = []
+        fields = {}
+        first_name, last_name = _text(row.get('first_name')), _text(row.get('last_name'))
+        if not first_name:
+            names = _text(row.get('full_name')).split(' ', 1)
+            first_name = names[0]
+            last_name = names[1] if len(names) > 1 else ''
+        if not first_name:
+            errors.append('nom manquant')
+        fields.update(first_name=first_name, last_name=last_name)
+
+        for field in REQUIRED_FIELDS:
+            if not _text(row.get(field)):
+                errors.append(f'{field} manquant')
+
+        email = _text(row.get('email')).lower()
+        if email:
+            if '@' not in email:
+                errors.append(f'email invalide: {email}')
+            elif email in existing_emails:
+                errors.append(f'email déjà utilisé: {email}')
+            elif email in seen_emails:
+                errors.append(f'email en double avec la ligne {seen_emails[email]}')
+            seen_emails.setdefault(email, line)
+        fields['email'] = email
+
+        for field in ('dob', 'hire_date'):
+            if _text(row.get(field)):
+                try:
+                    fields[field] = _date(row[field])
+                except ValueError:
+                    errors.append(f'{field} invalide: {_text(row[field])}')
+
+        gender = _text(row.get('gender')).lower()
+        if gender and gender not in GENDERS:
+            errors.append(f'genre invalide: {gender}')
+        fields.update(
+            gender=gender or None,
+            phone=_text(row.get('phone')) or None,
+            department=_text(row.get('department')) or None,
+            position=_text(row.get('role')) or None,
+        )
+        results.append((line, None if errors else fields, errors))
+    return results
+
+
+def initial_password_hash(pluri_id):
+    """Hash of the initial password, the PluriId (runs in a worker process)"""
+    return generate_password_hash(pluri_id, method='pbkdf2:sha256')
+
+
+def import_employees(rows, dry_run=False, skip_invalid=False, workers=None, batch_size=IMPORT_BATCH_SIZE):
+    """Validate spreadsheet rows and create their employees and user accounts.
+
+    PluriIds are drawn in memory against the ids and usernames already in
+    use, fetched once. Password hashes, the slow part, are computed in a
+    process pool; employees and users then go in with
+    batched bulk inserts and a single commit. Nothing is written on
+    dry_run, nor when any row is invalid unless skip_invalid is set. Rows
+    that another import claimed in the meantime are reported as errors and
+    the file is not imported.
+    Requires an app context. Returns the report: counts plus one entry per
+    row, with its pluri_id or its errors.
+    """
+    existing_emails = {email.lower() for email, in db.session.query(Employee.email)}
+    taken = {pluri_id for pluri_id, in db.session.query(Employee.pluri_id)}
+    taken |= {username[len('user_'):] for username, in
+              db.session.query(User.username).filter(User.username.like('user\\_%', escape='\\'))}
+
+    report_rows = []
+    valid = []
+    for line, fields, errors in validate_rows(rows, existing_emails):
+        if errors:
+            report_rows.append({'row': line, 'status': 'error', 'errors': errors})
+            continue
+        pluri_id = new_pluri_id(taken)
+        taken.add(pluri_id)
+        fields.update(pluri_id=pluri_id, qr_data=new_qr_data(pluri_id))
+        valid.append(fields)
+        report_rows.append({'row': line, 'status': 'ok', 'pluri_id': pluri_id,
+                            'name': f"{fields['first_name']} {fields['last_name']}".strip()})
+
+    invalid = len(report_rows) - len(valid)
+    report = {'dry_run': dry_run, 'total': len(report_rows), 'valid': len(valid), 'invalid': invalid,
+              'created': 0, 'rows': report_rows}
+    if dry_run or not valid or (invalid and not skip_invalid):
+        return report
+
+    pluri_ids = [fields['pluri_id'] for fields in valid]
+    try:
+        # spawn: never fork a process holding SQLite connections and threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            password_hashes = list(pool.map(initial_password_hash, pluri_ids,
+                                            chunksize=max(1, len(pluri_ids) // 32)))
+
+        for start in range(0, len(valid), batch_size):
+            batch = valid[start:start + batch_size]
+            db.session.bulk_save_objects([
+                User(username=f"user_{fields['pluri_id']}", password_hash=password_hash, is_admin=False)
+                for fields, password_hash in zip(batch, password_hashes[start:start + batch_size])
+            ])
+            user_ids = dict(db.session.query(User.username, User.id).filter(
+                User.username.in_([f"user_{fields['pluri_id']}" for fields in batch])
+            ))
+            db.session.bulk_save_objects([
+                Employee(user_id=user_ids[f"user_{fields['pluri_id']}"], **fields) for fields in batch
+            ])
+        db.session.commit()
+    except IntegrityError:
+        # Another import or the employee form took some of these since they were checked
+        db.session.rollback()
+        conflicts = _conflicts(valid)
+        if not conflicts:
+            raise
+        for row in report_rows:
+            if row.get('pluri_id') in conflicts:
+                row.update(status='error', errors=conflicts[row.pop('pluri_id')])
+                row.pop('name')
+        report['valid'] = len(valid) - len(conflicts)
+        report['invalid'] = invalid + len(conflicts)
+        return report
+    except Exception:
+        db.session.rollback()
+        raise
+
+    report['created'] = len(valid)
+    return report
+
+
+def _conflicts(valid):
+    """pluri_id -> errors for the rows whose email, PluriId or code is now taken"""
+    emails = {email for email, in db.session.query(Employee.email).filter(
+        Employee.email.in_([fields['email'] for fields in valid]))}
+    pluri_ids = {pluri_id for pluri_id, in db.session.query(Employee.pluri_id).filter(
+        Employee.pluri_id.in_([fields['pluri_id'] for fields in valid]))}
+    pluri_ids |= {username[len('user_'):] for username, in db.session.query(User.username).filter(
+        User.username.in_([f"user_{fields['pluri_id']}" for fields in valid]))}
+    qr_data = {code for code, in db.session.query(Employee.qr_data).filter(
+        Employee.qr_data.in_([fields['qr_data'] for fields in valid]))}
+
+    conflicts = {}
+    for fields in valid:
+        errors = []
+        if fields['email'] in emails:
+            errors.append(f"email déjà utilisé: {fields['email']}")
+        if fields['pluri_id'] in pluri_ids or fields['qr_data'] in qr_data:
+            errors.append('PluriId attribué entre-temps, relancez l\'import')
+        if errors:
+            conflicts[fields['pluri_id']] = errors
+    return conflicts
+
+
+if __name__ == '__main__':
+    args, workers = [], None
+    argv = iter(sys.argv[1:])
+    for arg in argv:
+        if arg == '--workers':
+            workers = int(next(argv))
+        elif not arg.startswith('--'):
+            args.append(arg)
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    from app import app, qr_cache, dashboard_metrics
+    with open(args[0], 'rb') as spreadsheet, app.app_context():
+        try:
+            result = import_employees(read_rows(spreadsheet, args[0]),
+                                      dry_run='--dry-run' in sys.argv,
+                                      skip_invalid='--skip-invalid' in sys.argv, workers=workers)
+        except ImportFileError as e:
+            print(f"Import aborted: {e}")
+            sys.exit(1)
+    if result['created']:
+        qr_cache.invalidate()
+        dashboard_metrics.invalidate()
+
+    for row in result['rows']:
+        if row['status'] == 'error':
+            print(f"Line {row['row']}: {'; '.join(row['errors'])}")
+    print(json.dumps({key: value for key, value in result.items() if key != 'rows'}))
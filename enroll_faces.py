@@ -0,0 +1,15 @@
+from app import app, face_cache
+from face_service import FACE_RECOGNITION_ENABLED
+import sys
+
+def enroll_faces():
+    """Encode the profile photos uploaded before encodings were stored"""
+    if not FACE_RECOGNITION_ENABLED:
+        print("Face recognition is not available")
+        sys.exit(1)
+    with app.app_context():
+        enrolled, skipped = face_cache.backfill()
+        print(f"Enrolled {enrolled} profile photos ({skipped} without a usable face)")
+
+if __name__ == '__main__':
+    enroll_faces()
@@ -0,0 +1,128 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import time
+
+
+class PoolSaturated(Exception):
+    """Raised when the queue is full; callers answer 503 with Retry-After"""
+
+    def __init__(self, retry_after):
+        super().__init__('Face verification queue is full')
+        self.retry_after = retry_after
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class FaceWorkerPool:
+    """Bounded process pool running face detection/encoding off the request thread.
+
+    At most max_pending jobs may be queued or running; further submissions are
+    rejected immediately rather than piling up behind a busy CPU. A slot is
+    only released when its job really finishes, so a timed-out job still
+    counts against the bound until the worker process is done with it.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, timeout=15, latency_window=200):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a process holding SQLite connections and threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def retry_after(self):
+        """Seconds a rejected client should wait, from recent job latency"""
+        with self._lock:
+            latencies = list(self._latencies)
+        average = sum(latencies) / len(latencies) if latencies else 1.0
+        return max(1, int(round(average * self.max_pending / self.max_workers)))
+
+    def run(self, fn, *args):
+        """Run fn(*args) in a worker process and wait for its result"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated(self.retry_after())
+
+        with self._lock:
+            self.pending += 1
+        started = time.perf_counter()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise JobTimeout(f'Face job exceeded {self.timeout}s')
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+                if isinstance(e, BrokenProcessPool):
+                    # A worker died (e.g. OOM); start a fresh pool on the next job
+                    self._executor = None
+            raise
+
+        with self._lock:
+            self.completed += 1
+            self._latencies.append(time.perf_counter() - started)
+        return result
+
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'queue_depth': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'failed': self.failed,
+            }
+        if latencies:
+            metrics['latency_ms'] = {
+                'avg': round(sum(latencies) / len(latencies) * 1000, 1),
+                'p50': round(latencies[len(latencies) // 2] * 1000, 1),
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                'max': round(latencies[-1] * 1000, 1),
+            }
+        return metrics
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,287 @@
+from datetime import datetime
+from io import BytesIO
+from models import db, Employee, FaceEncoding
+from cache_stamp import ChangeStamp
+from PIL import Image, ImageOps
+import numpy as np
+import base64
+import os
+import threading
+# Make face recognition optional
+try:
+    import face_recognition
+    FACE_RECOGNITION_ENABLED = True
+except ImportError:
+    FACE_RECOGNITION_ENABLED = False
+    print("Face recognition is not available")
+
+# Maximum euclidean distance between two encodings of the same person
+MATCH_TOLERANCE = 0.4
+# In 1:N identification, refuse a match when the runner-up is this close to it
+AMBIGUITY_MARGIN = 0.05
+
+
+# Frames are downscaled to this size before encoding; detection cost scales with pixels
+MAX_DIMENSION = 640
+# Size of the cheap HOG detection pass used to crop to the face (0 disables cropping)
+DETECT_DIMENSION = 320
+# Extra context kept around the detected face box, as a fraction of its size
+CROP_MARGIN = 0.25
+
+
+def decode_base64(image_data):
+    """Raw bytes of a base64 image, optionally given as a data: URL"""
+    if ',' in image_data:
+        image_data = image_data.split(',', 1)[1]
+    return base64.b64decode(image_data)
+
+
+def open_image(source):
+    """Lazy PIL image from a file path or raw bytes, decoded in memory"""
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    return Image.open(source)
+
+
+def prepare_image(source, max_dimension=MAX_DIMENSION):
+    """Decode in memory and downscale so the longest side is at most max_dimension.
+
+    Returns the RGB uint8 array face_recognition expects.
+    """
+    image = open_image(source)
+    # draft() lets JPEG decode straight at a reduced scale; it must run before
+    # anything (like exif_transpose) forces a full-size decode
+    if max_dimension:
+        image.draft('RGB', (max_dimension, max_dimension))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def locate_face(image, detect_dimension=DETECT_DIMENSION, margin=CROP_MARGIN):
+    """Find the largest face with a HOG pass on a reduced copy.
+
+    Returns (crop, location) where location is the face box inside crop in
+    face_recognition's (top, right, bottom, left) order, or (image, None) when
+    no face is found.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, detect_dimension / max(height, width))
+    small = image
+    if scale < 1.0:
+        small = np.asarray(Image.fromarray(image).resize(
+            (max(1, int(width * scale)), max(1, int(height * scale))), Image.BILINEAR
+        ))
+    locations = face_recognition.face_locations(small, number_of_times_to_upsample=1, model='hog')
+    if not locations:
+        return image, None
+
+    top, right, bottom, left = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    top, right, bottom, left = (int(round(value / scale)) for value in (top, right, bottom, left))
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    crop_top, crop_left = max(0, top - pad_y), max(0, left - pad_x)
+    crop_bottom, crop_right = min(height, bottom + pad_y), min(width, right + pad_x)
+
+    crop = np.ascontiguousarray(image[crop_top:crop_bottom, crop_left:crop_right])
+    location = (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)
+    return crop, location
+
+
+def compute_encoding(image, detect_dimension=DETECT_DIMENSION):
+    """128-d encoding of the main face in an RGB array, or None"""
+    location = None
+    if detect_dimension:
+        image, location = locate_face(image, detect_dimension)
+    # A known location skips the detector during the full-size encoding; faces
+    # too small for the reduced pass are still searched for at full size
+    encodings = face_recognition.face_encodings(image, known_face_locations=[location] if location else None)
+    return encodings[0] if encodings else None
+
+
+def encode_image(source, max_dimension=MAX_DIMENSION, detect_dimension=DETECT_DIMENSION):
+    """Worker-process job: preprocess an image (path or bytes) and encode its face"""
+    return compute_encoding(prepare_image(source, max_dimension), detect_dimension)
+
+
+def encode_snapshot(image_data, max_dimension=MAX_DIMENSION, detect_dimension=DETECT_DIMENSION):
+    """Worker-process job: decode a base64 snapshot and encode its face"""
+    return encode_image(decode_base64(image_data), max_dimension, detect_dimension)
+
+
+def encoding_to_blob(encoding):
+    return np.asarray(encoding, dtype=np.float64).tobytes()
+
+
+def blob_to_encoding(blob):
+    return np.frombuffer(blob, dtype=np.float64)
+
+
+def face_distance(known, unknown):
+    return float(np.linalg.norm(known - unknown))
+
+
+class FaceIndex:
+    """All enrolled encodings in one contiguous matrix for 1:N search"""
+
+    def __init__(self, employee_ids, encodings):
+        self.employee_ids = np.asarray(employee_ids, dtype=np.int64)
+        if len(encodings):
+            self.matrix = np.ascontiguousarray(np.vstack(encodings), dtype=np.float64)
+        else:
+            self.matrix = np.empty((0, 128), dtype=np.float64)
+        # Squared norms are reused by every query: |a-b|^2 = |a|^2 - 2ab + |b|^2
+        self.squared_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def __len__(self):
+        return len(self.employee_ids)
+
+    def search(self, encoding, top_k=3, tolerance=MATCH_TOLERANCE):
+        """Return up to top_k (employee_id, distance) within tolerance, closest first"""
+        if not len(self):
+            return []
+        encoding = np.asarray(encoding, dtype=np.float64)
+        squared = self.squared_norms - 2 * (self.matrix @ encoding) + encoding @ encoding
+        distances = np.sqrt(np.maximum(squared, 0))
+
+        top_k = min(top_k, len(distances))
+        candidates = np.argpartition(distances, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(distances[candidates])]
+        return [
+            (int(self.employee_ids[i]), float(distances[i]))
+            for i in candidates if distances[i] <= tolerance
+        ]
+
+
+class FaceEncodingCache:
+    """Profile encodings by employee id, computed once per photo.
+
+    Encodings are persisted in the face_encoding table so that other workers
+    and restarts reuse them; the stamp file makes every worker drop its copy
+    when a photo changes. Photos are encoded through runner(fn, *args), e.g.
+    FaceWorkerPool.run, or in the calling thread when it is None.
+    """
+
+    def __init__(self, upload_folder, stamp_path=None, max_dimension=MAX_DIMENSION,
+                 detect_dimension=DETECT_DIMENSION, runner=None):
+        self.upload_folder = upload_folder
+        self.runner = runner
+        self.max_dimension = max_dimension
+        self.detect_dimension = detect_dimension
+        self.stamp = ChangeStamp(stamp_path)
+        self._encodings = {}
+        self._index = None
+        self._lock = threading.Lock()
+
+    def warm(self):
+        rows = FaceEncoding.query.with_entities(FaceEncoding.employee_id, FaceEncoding.encoding).all()
+        # An empty blob records a photo without a usable face
+        encodings = {employee_id: blob_to_encoding(blob) for employee_id, blob in rows if blob}
+        with self._lock:
+            self.stamp.changed()
+            self._encodings = encodings
+            self._index = FaceIndex(list(encodings), list(encodings.values()))
+        return len(encodings)
+
+    def index(self):
+        """FaceIndex over every enrolled employee, rebuilt after any change"""
+        with self._lock:
+            if self.stamp.changed():
+                self._encodings.clear()
+                self._index = None
+            index = self._index
+        if index is None:
+            self.warm()
+            index = self._index
+        return index
+
+    def enroll(self, employee):
+        """Encode the employee's profile photo and store it.
+
+        The caller commits and then calls invalidate(employee.id) so that every
+        worker picks up the new row. Returns the encoding, or None when there
+        is no usable face; that outcome is stored too (an empty encoding), so
+        the photo is not encoded again on every face check. Raises whatever the runner raises (PoolSaturated,
+        JobTimeout) before touching the session.
+        """
+        if not FACE_RECOGNITION_ENABLED or not employee.photo:
+            return None
+        photo_path = os.path.join(self.upload_folder, employee.photo)
+        if not os.path.exists(photo_path):
+            return None
+        if self.runner:
+            encoding = self.runner(encode_image, photo_path, self.max_dimension, self.detect_dimension)
+        else:
+            encoding = encode_image(photo_path, self.max_dimension, self.detect_dimension)
+
+        row = FaceEncoding.query.filter_by(employee_id=employee.id).first()
+        if not row:
+            row = FaceEncoding(employee_id=employee.id)
+            db.session.add(row)
+        row.encoding = b'' if encoding is None else encoding_to_blob(encoding)
+        row.photo = employee.photo
+        row.updated_at = datetime.now()
+        return encoding
+
+    def get(self, employee):
+        """Encoding of the employee's profile photo, enrolling it on first use"""
+        with self._lock:
+            if self.stamp.changed():
+                self._encodings.clear()
+                self._index = None
+            encoding = self._encodings.get(employee.id)
+        if encoding is not None:
+            return encoding
+
+        row = FaceEncoding.query.filter_by(employee_id=employee.id).first()
+        if row and row.photo == employee.photo:
+            if not row.encoding:
+                return None
+            encoding = blob_to_encoding(row.encoding)
+            with self._lock:
+                self._encodings[employee.id] = encoding
+            return encoding
+
+        # Photo uploaded before encodings were stored, or replaced since
+        indexed = bool(row and row.encoding)
+        encoding = self.enroll(employee)
+        db.session.commit()
+        if encoding is not None or indexed:
+            # Other workers rebuild their index with (or without) this employee
+            self.invalidate(employee.id)
+        if encoding is not None:
+            with self._lock:
+                self._encodings[employee.id] = encoding
+        return encoding
+
+    def backfill(self):
+        """Enroll every photo that has no stored encoding, e.g. uploaded before they existed.
+
+        Commits after each employee. Returns (enrolled, without a usable face).
+        """
+        employees = Employee.query.outerjoin(FaceEncoding, FaceEncoding.employee_id == Employee.id).filter(
+            Employee.photo.isnot(None),
+            db.or_(FaceEncoding.id.is_(None), FaceEncoding.photo != Employee.photo)
+        ).all()
+        enrolled = 0
+        for employee in employees:
+            if self.enroll(employee) is not None:
+                enrolled += 1
+            db.session.commit()
+        if employees:
+            self.invalidate()
+        return enrolled, len(employees) - enrolled
+
+    def identify(self, encoding, top_k=3, tolerance=MATCH_TOLERANCE):
+        """1:N search of a snapshot encoding against every enrolled employee"""
+        return self.index().search(encoding, top_k=top_k, tolerance=tolerance)
+
+    def invalidate(self, employee_id=None):
+        with self._lock:
+            if employee_id is None:
+                self._encodings.clear()
+            else:
+                self._encodings.pop(employee_id, None)
+            self._index = None
+            self.stamp.touch()
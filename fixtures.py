@@ -0,0 +1,119 @@
+"""Test data for the unittest suites.
+
+The app binds its database when app.py is imported, so test modules call
+use_test_database() before importing it; all of them then share one
+throwaway SQLite file instead of instance/attendance.db.
+"""
+from datetime import date, datetime, time, timedelta
+import os
+import tempfile
+import unittest
+
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(), 'attendance.db')
+
+
+def use_test_database():
+    """Point the app at the scratch database; must run before `import app`"""
+    os.environ['DB_PATH'] = TEST_DB_PATH
+    os.environ.pop('DATABASE_URL', None)
+
+
+def is_test_database(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'] == f'sqlite:///{TEST_DB_PATH}'
+
+
+def reset_database():
+    """Drop and recreate every table (inside an app context)"""
+    from models import db
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+def create_admin(username='admin', password='admin123'):
+    from models import db, User
+    admin = User(username=username, is_admin=True)
+    admin.set_password(password)
+    db.session.add(admin)
+    db.session.commit()
+    return admin
+
+
+class AppTestCase(unittest.TestCase):
+    """Runs each test on freshly created tables, with self.client logged in as admin.
+
+    Subclasses add their rows in create_data(), which runs inside an app
+    context; those that log in themselves set admin_logged_in to False.
+    """
+    admin_logged_in = True
+
+    def setUp(self):
+        from app import app
+        if not is_test_database(app):
+            self.skipTest('app was already imported with another database')
+        app.config['TESTING'] = True
+        with app.app_context():
+            reset_database()
+            create_admin('admin', 'admin123')
+            self.create_data()
+        self.client = app.test_client()
+        if self.admin_logged_in:
+            self.login('admin', 'admin123')
+
+    def tearDown(self):
+        from app import app
+        from models import db
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def create_data(self):
+        pass
+
+    def login(self, username, password):
+        self.client.post('/login', data={'username': username, 'password': password})
+
+
+def generate_attendance(employees=3, days=3, departments=None, positions=None,
+                        check_in=time(9, 0), hours=8, prefix='EMP', end=None, user=None):
+    """Create employees with one closed session a day and their daily summaries.
+
+    Employee n (from 1) gets pluri_id {prefix}{n}, is named Test{n}
+    Employee{n} and works from check_in for hours on each of the days
+    ending at end (today by default). departments and positions are cycled
+    through; user, if given, is linked to the first employee. Returns the
+    employees.
+    """
+    from app import config
+    from models import db, Employee, Attendance, DailyAttendanceSummary
+    end = end or date.today()
+    departments = departments or ['Administration et Direction']
+    positions = positions or ['Comptable']
+
+    created = []
+    for n in range(1, employees + 1):
+        employee = Employee(
+            pluri_id=f'{prefix}{n}',
+            first_name=f'Test{n}',
+            last_name=f'Employee{n}',
+            email=f'{prefix.lower()}{n}@test.com',
+            phone=f'+123456789{n % 10}',
+            department=departments[(n - 1) % len(departments)],
+            position=positions[(n - 1) % len(positions)],
+            hire_date=date(2020, 1, 1),
+            dob=date(1990, 1, 1),
+            user_id=user.id if user is not None and n == 1 else None
+        )
+        db.session.add(employee)
+        db.session.flush()
+        for days_ago in range(days):
+            start = datetime.combine(end - timedelta(days=days_ago), check_in)
+            attendance = Attendance(employee_id=employee.id, check_in=start,
+                                    check_out=start + timedelta(hours=hours), total_hours=hours)
+            db.session.add(attendance)
+            DailyAttendanceSummary.record_check_in(attendance, config.in_time)
+            DailyAttendanceSummary.record_check_out(attendance)
+            db.session.flush()
+        created.append(employee)
+    db.session.commit()
+    return created
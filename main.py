@@ -1,8 +1,11 @@
-from app import app
+from app import app, job_scheduler
 
 # This is what Gunicorn will import
 application = app
 app = application  # This ensures both 'app' and 'application' are available
 
+# Every worker competes for the scheduler lock; one of them runs the jobs
+job_scheduler.start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
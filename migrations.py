@@ -0,0 +1,71 @@
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.schema import CreateColumn
+from models import db
+import os
+import sys
+
+
+def can_add_column(column):
+    """Whether ALTER TABLE ADD COLUMN can add column to a table with rows"""
+    return column.nullable or column.server_default is not None
+
+
+def upgrade_schema(engine):
+    """Bring an existing database up to the current models.
+
+    db.create_all() only creates missing tables, so columns and indexes
+    added to tables that already exist (e.g. an older instance/attendance.db)
+    are created here. Only nullable columns or columns with a server default
+    can be added this way. Safe to run repeatedly.
+    """
+    db.metadata.create_all(engine)
+
+    created = []
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and can_add_column(column):
+                with engine.begin() as connection:
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {engine.dialect.identifier_preparer.format_table(table)} '
+                        f'ADD COLUMN {CreateColumn(column).compile(dialect=engine.dialect)}'
+                    )
+                created.append(f'{table.name}.{column.name}')
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                created.append(index.name)
+    return created
+
+
+def check_schema(engine, required_tables=('user', 'employee', 'attendance')):
+    """List the ways a database is incompatible with the current models.
+
+    Tables missing entirely are fine except for required_tables (upgrade_schema
+    creates the others); existing tables must have every column of their model
+    that upgrade_schema cannot add.
+    """
+    problems = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            if table.name in required_tables:
+                problems.append(f'missing table {table.name}')
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and not can_add_column(column):
+                problems.append(f'missing column {table.name}.{column.name}')
+    return problems
+
+
+if __name__ == '__main__':
+    # Usage: python migrations.py [path/to/database.db]
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'attendance.db')
+    db_path = sys.argv[1] if len(sys.argv) > 1 else default_path
+    created = upgrade_schema(create_engine(f'sqlite:///{db_path}'))
+    print(f"Created: {', '.join(created)}" if created else "Schema already up to date")
@@ -1,9 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-import os
-import qrcode
+from datetime import datetime, date
+from database import date_of, time_of_day, seconds_between, at_time
 import random
 import string
 
@@ -12,7 +11,7 @@ db = SQLAlchemy()
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     is_admin = db.Column(db.Boolean, default=False)
     employee = db.relationship('Employee', backref='user', uselist=False)
 
@@ -46,33 +45,241 @@ class Employee(db.Model):
     @staticmethod
     def generate_pluri_id():
         # Generate a random 6-character ID
-        chars = string.ascii_uppercase + string.digits
         while True:
-            pluri_id = ''.join(random.choices(chars, k=6))
+            pluri_id = new_pluri_id()
             if not Employee.query.filter_by(pluri_id=pluri_id).first():
                 return pluri_id
 
     def generate_qr_code(self):
+        """Assign the scanned code; its image is rendered on demand by /qr/<pluri_id>.png"""
         if not self.qr_data:
-            self.qr_data = f"EMP_{self.pluri_id}_{random.randint(1000, 9999)}"
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(self.qr_data)
-        qr.make(fit=True)
+            self.qr_data = new_qr_data(self.pluri_id)
+        return self.qr_data
+
+
+def new_pluri_id(taken=()):
+    """Random 6-character PluriId that is not in taken"""
+    chars = string.ascii_uppercase + string.digits
+    while True:
+        pluri_id = ''.join(random.choices(chars, k=6))
+        if pluri_id not in taken:
+            return pluri_id
+
 
-        img = qr.make_image(fill_color="black", back_color="white")
-        qr_path = f"uploads/qrcodes/qr_{self.pluri_id}.png"
-        img.save(os.path.join('static', qr_path))
-        return qr_path
+def new_qr_data(pluri_id):
+    return f"EMP_{pluri_id}_{random.randint(1000, 9999)}"
 
 class Attendance(db.Model):
+    __table_args__ = (
+        # (employee_id, check_in) serves the per-employee "today" and history lookups,
+        # check_in alone serves the date-range scans of the dashboard and reports
+        db.Index('ix_attendance_employee_check_in', 'employee_id', 'check_in'),
+        db.Index('ix_attendance_check_in', 'check_in'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
     check_in = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     check_out = db.Column(db.DateTime)
-    total_hours = db.Column(db.Float)
\ No newline at end of file
+    total_hours = db.Column(db.Float)
+    # Closed by the nightly job at the scheduled out time, not by a scan
+    auto_closed = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    @staticmethod
+    def auto_close(in_time, out_time, department_out_times=None, before=None):
+        """Close every session opened before `before` (today 00:00 by default)
+        that was never checked out, in one UPDATE.
+
+        Each session ends at its department's time in department_out_times
+        ({department: time}), else at out_time, on the day it started; one
+        opened after that time is closed where it started, with no hours.
+        Already closed sessions are left alone, so reruns change nothing.
+        The daily summaries of the affected days are then rebuilt, with
+        in_time deciding lateness as usual.
+        Returns the number of sessions closed.
+        """
+        before = before or datetime.combine(date.today(), datetime.min.time())
+        is_open = db.and_(Attendance.check_out.is_(None), Attendance.check_in < before)
+        first_check_in = db.session.query(db.func.min(Attendance.check_in)).filter(is_open).scalar()
+        if first_check_in is None:
+            return 0
+
+        closing_time = db.literal(out_time.strftime('%H:%M:%S'))
+        if department_out_times:
+            department = db.select(Employee.department).where(
+                Employee.id == Attendance.employee_id
+            ).scalar_subquery()
+            closing_time = db.case(
+                {name: value.strftime('%H:%M:%S') for name, value in department_out_times.items()},
+                value=department, else_=closing_time
+            )
+        close_at = at_time(Attendance.check_in, closing_time)
+        check_out = db.case((close_at > Attendance.check_in, close_at), else_=Attendance.check_in)
+
+        result = db.session.execute(
+            db.update(Attendance).where(is_open).values(
+                check_out=check_out,
+                total_hours=seconds_between(Attendance.check_in, check_out) / 3600.0,
+                auto_closed=True
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        DailyAttendanceSummary.rebuild(in_time=in_time, since=first_check_in.date())
+        return result.rowcount
+
+class DailyAttendanceSummary(db.Model):
+    __tablename__ = 'daily_attendance_summary'
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'date', name='uq_daily_summary_employee_date'),
+        db.Index('ix_daily_summary_date_employee', 'date', 'employee_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    first_check_in = db.Column(db.DateTime, nullable=False)
+    last_check_out = db.Column(db.DateTime)
+    worked_seconds = db.Column(db.Float, nullable=False, default=0)
+    is_late = db.Column(db.Boolean, nullable=False, default=False)
+    employee = db.relationship('Employee', backref=db.backref('daily_summaries', lazy=True))
+
+    @staticmethod
+    def for_day(employee_id, day):
+        summary = DailyAttendanceSummary.query.filter_by(employee_id=employee_id, date=day).first()
+        if not summary:
+            summary = DailyAttendanceSummary(employee_id=employee_id, date=day, worked_seconds=0, is_late=False)
+            db.session.add(summary)
+        return summary
+
+    @staticmethod
+    def record_check_in(attendance, in_time=None):
+        """Fold a new check-in into its day's summary (caller commits)"""
+        summary = DailyAttendanceSummary.for_day(attendance.employee_id, attendance.check_in.date())
+        if summary.first_check_in is None or attendance.check_in < summary.first_check_in:
+            summary.first_check_in = attendance.check_in
+            summary.is_late = in_time is not None and attendance.check_in.time() > in_time
+        return summary
+
+    @staticmethod
+    def record_check_out(attendance):
+        """Fold a completed session into its day's summary (caller commits)"""
+        summary = DailyAttendanceSummary.for_day(attendance.employee_id, attendance.check_in.date())
+        if summary.first_check_in is None:
+            summary.first_check_in = attendance.check_in
+        if summary.last_check_out is None or attendance.check_out > summary.last_check_out:
+            summary.last_check_out = attendance.check_out
+        summary.worked_seconds = (summary.worked_seconds or 0) + (attendance.check_out - attendance.check_in).total_seconds()
+        return summary
+
+    @staticmethod
+    def rebuild(in_time=None, employee_id=None, since=None):
+        """Recompute summaries from the raw Attendance table in one INSERT ... SELECT.
+
+        employee_id and since (a date) limit the rebuild to one employee and
+        to the days from since onwards.
+        """
+        delete = DailyAttendanceSummary.query
+        if employee_id is not None:
+            delete = delete.filter_by(employee_id=employee_id)
+        if since is not None:
+            delete = delete.filter(DailyAttendanceSummary.date >= since)
+        delete.delete(synchronize_session=False)
+
+        day = date_of(Attendance.check_in)
+        first_check_in = db.func.min(Attendance.check_in)
+        # SQLite derives durations from float day counts, so round away sub-millisecond noise
+        worked_seconds = db.func.round(db.cast(db.func.sum(db.func.coalesce(
+            seconds_between(Attendance.check_in, Attendance.check_out), 0
+        )), db.Numeric), 3)
+        if in_time is not None:
+            is_late = time_of_day(first_check_in) > in_time
+        else:
+            is_late = db.false()
+
+        select = db.select(
+            Attendance.employee_id,
+            day,
+            first_check_in,
+            db.func.max(Attendance.check_out),
+            worked_seconds,
+            is_late
+        ).group_by(Attendance.employee_id, day)
+        if employee_id is not None:
+            select = select.where(Attendance.employee_id == employee_id)
+        if since is not None:
+            select = select.where(Attendance.check_in >= datetime.combine(since, datetime.min.time()))
+
+        result = db.session.execute(
+            db.insert(DailyAttendanceSummary).from_select(
+                ['employee_id', 'date', 'first_check_in', 'last_check_out', 'worked_seconds', 'is_late'],
+                select
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+class ScanEvent(db.Model):
+    """Scans replayed by door terminals, kept so batches can be retried idempotently"""
+    __tablename__ = 'scan_event'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(100), unique=True, nullable=False)
+    device_id = db.Column(db.String(100))
+    qr_data = db.Column(db.String(200))
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'))
+    scanned_at = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    status = db.Column(db.String(20), nullable=False)
+    type = db.Column(db.String(20))
+    message = db.Column(db.String(200))
+
+
+class Setting(db.Model):
+    """Admin-editable key/value settings shared by every worker (backup schedule, retention...)"""
+    __tablename__ = 'settings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(50), unique=True, nullable=False)
+    value = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    @staticmethod
+    def get(key, default=None):
+        setting = Setting.query.filter_by(key=key).first()
+        return setting.value if setting else default
+
+    @staticmethod
+    def set(key, value):
+        """Insert or update a setting (caller commits)"""
+        setting = Setting.query.filter_by(key=key).first()
+        if setting is None:
+            setting = Setting(key=key)
+            db.session.add(setting)
+        setting.value = str(value)
+        return setting
+
+
+class AttendanceChange(db.Model):
+    """Check-ins and check-outs; the id is the live feed's event id, committed in increasing order (see record_change)"""
+    __tablename__ = 'attendance_change'
+
+    id = db.Column(db.Integer, primary_key=True)
+    attendance_id = db.Column(db.Integer, db.ForeignKey('attendance.id'), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False, index=True)
+    type = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True)
+
+    attendance = db.relationship('Attendance')
+
+
+class FaceEncoding(db.Model):
+    """128-d face_recognition encoding of an employee's profile photo; empty when it has no usable face"""
+    __tablename__ = 'face_encoding'
+
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), unique=True, nullable=False)
+    encoding = db.Column(db.LargeBinary, nullable=False)
+    photo = db.Column(db.String(150))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
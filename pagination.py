@@ -0,0 +1,83 @@
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Numbered report pages
+REPORT_PAGE_SIZE = 100
+MAX_REPORT_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Opaque URL-safe token for the sort key of the last row of a page"""
+    plain = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(plain).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Sort key values from a cursor, typed after the columns they belong to"""
+    try:
+        plain = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(plain, list) or len(plain) != len(columns):
+            raise InvalidCursor('Curseur invalide')
+        values = []
+        for value, column in zip(plain, columns):
+            python_type = column.type.python_type
+            if python_type in (datetime, date):
+                value = python_type.fromisoformat(value)
+            else:
+                value = python_type(value)
+            values.append(value)
+        return values
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Curseur invalide') from e
+
+
+def _after(columns, values):
+    """Rows strictly after values in descending (columns) order"""
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column < value
+    return or_(column < value, and_(column == value, _after(columns[1:], values[1:])))
+
+
+def keyset_query(query, columns, values=None, limit=DEFAULT_PAGE_SIZE):
+    """query ordered by columns descending, starting right after the values sort key"""
+    if values is not None:
+        # The redundant bound on the leading column gives the planner an index range
+        query = query.filter(columns[0] <= values[0], _after(columns, values))
+    return query.order_by(*[column.desc() for column in columns]).limit(limit)
+
+
+def keyset_page(query, columns, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of query in descending order of columns, newest first.
+
+    columns must identify a row uniquely (end with the primary key). Instead
+    of an OFFSET the page starts right after the cursor's sort key, so every
+    page costs the same however deep the user scrolls. Returns (rows,
+    next_cursor); next_cursor is None on the last page.
+    """
+    values = decode_cursor(cursor, columns) if cursor else None
+    rows = keyset_query(query, columns, values, limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+
+def offset_page(query, page, per_page=DEFAULT_PAGE_SIZE):
+    """Rows of a 1-based page plus the total row count, for bounded result sets
+    such as reports where users jump between numbered pages"""
+    if page < 1:
+        raise ValueError('page doit être supérieur ou égal à 1')
+    total = query.order_by(None).count()
+    rows = query.limit(per_page).offset((page - 1) * per_page).all()
+    return rows, total
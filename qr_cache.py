@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from models import Employee
+from cache_stamp import ChangeStamp
+import threading
+
+
+class QRCache:
+    """In-process map of qr_data -> (employee id, pluri_id) with optional LRU bound.
+
+    Each gunicorn worker holds its own copy. Invalidations also touch a stamp
+    file, and every lookup compares its mtime so that the other workers drop
+    their copy on their next scan without querying the database.
+    """
+
+    def __init__(self, maxsize=None, stamp_path=None):
+        self.maxsize = maxsize
+        self.stamp = ChangeStamp(stamp_path)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, qr_data, entry):
+        self._entries[qr_data] = entry
+        self._entries.move_to_end(qr_data)
+        if self.maxsize is not None and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def warm(self):
+        """Load every employee's QR code (requires an app context)"""
+        rows = Employee.query.with_entities(Employee.qr_data, Employee.id, Employee.pluri_id).filter(
+            Employee.qr_data.isnot(None)
+        ).all()
+        with self._lock:
+            self._entries.clear()
+            self.stamp.changed()
+            for qr_data, employee_id, pluri_id in rows:
+                self._store(qr_data, (employee_id, pluri_id))
+        return len(rows)
+
+    def get(self, qr_data):
+        """Return (employee id, pluri_id) for a QR code, or None if unknown"""
+        with self._lock:
+            if self.stamp.changed():
+                self._entries.clear()
+            entry = self._entries.get(qr_data)
+            if entry is not None:
+                self._entries.move_to_end(qr_data)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        row = Employee.query.with_entities(Employee.id, Employee.pluri_id).filter_by(qr_data=qr_data).first()
+        if row is None:
+            return None
+        entry = (row.id, row.pluri_id)
+        with self._lock:
+            self._store(qr_data, entry)
+        return entry
+
+    def invalidate(self, qr_data=None):
+        """Drop one code (or everything) here and signal the other workers"""
+        with self._lock:
+            if qr_data is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(qr_data, None)
+            self.stamp.touch()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
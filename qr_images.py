@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from io import BytesIO
+import hashlib
+import os
+import tempfile
+import threading
+import qrcode
+from qrcode.image.svg import SvgPathImage
+
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+# Bump when the rendering below changes, so cached images are not reused
+QR_RENDER_VERSION = 1
+
+
+def _make_qr(qr_data, image_factory=None):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+        image_factory=image_factory,
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    return qr
+
+
+def render_qr(qr_data, fmt='png'):
+    """QR code image for qr_data as PNG or SVG bytes"""
+    if fmt == 'svg':
+        return _make_qr(qr_data, SvgPathImage).make_image().to_string()
+    output = BytesIO()
+    _make_qr(qr_data).make_image(fill_color="black", back_color="white").save(output, format='PNG')
+    return output.getvalue()
+
+
+def qr_matrix(qr_data):
+    """Rows of dark (True) modules, quiet zone included, for drawing the code elsewhere"""
+    return _make_qr(qr_data).get_matrix()
+
+
+def qr_digest(qr_data, fmt='png'):
+    """Content hash naming the rendered image; also its ETag and URL version"""
+    return hashlib.sha256(f'{QR_RENDER_VERSION}:{fmt}:{qr_data}'.encode()).hexdigest()
+
+
+class QRImageCache:
+    """QR code images rendered on first request, then kept in memory and on disk.
+
+    Images are addressed by qr_digest(), so a changed qr_data is simply a
+    new entry and nothing needs invalidating across workers. Each worker
+    keeps the last `maxsize` images in memory; the directory is shared by
+    all workers and survives restarts.
+    """
+
+    def __init__(self, cache_dir, maxsize=256):
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, digest, fmt):
+        return os.path.join(self.cache_dir, f'{digest}.{fmt}')
+
+    def get(self, qr_data, fmt='png'):
+        """(image bytes, digest) for qr_data, rendering it at most once"""
+        digest = qr_digest(qr_data, fmt)
+        with self._lock:
+            image = self._images.get(digest)
+            if image is not None:
+                self._images.move_to_end(digest)
+                self.hits += 1
+                return image, digest
+            self.misses += 1
+
+        path = self._path(digest, fmt)
+        try:
+            with open(path, 'rb') as f:
+                image = f.read()
+        except FileNotFoundError:
+            image = render_qr(qr_data, fmt)
+            self.renders += 1
+            # Write then rename, so other workers never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._images[digest] = image
+            if len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+        return image, digest
+
+    def discard(self, qr_data):
+        """Remove the images of a deleted employee's code"""
+        for fmt in QR_FORMATS:
+            digest = qr_digest(qr_data, fmt)
+            with self._lock:
+                self._images.pop(digest, None)
+            try:
+                os.remove(self._path(digest, fmt))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._images),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'renders': self.renders,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,12 @@
+from app import app, db, config
+from models import DailyAttendanceSummary
+import sys
+
+def rebuild_summary(employee_id=None):
+    with app.app_context():
+        db.create_all()
+        rows = DailyAttendanceSummary.rebuild(in_time=config.in_time, employee_id=employee_id)
+        print(f"Rebuilt {rows} daily attendance summaries")
+
+if __name__ == '__main__':
+    rebuild_summary(int(sys.argv[1]) if len(sys.argv) > 1 else None)
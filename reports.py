@@ -0,0 +1,372 @@
+"""Attendance report queries, shared by /api/report_data and the file exports"""
+from datetime import date, datetime
+from io import StringIO
+from models import db, Employee, DailyAttendanceSummary
+from database import date_bucket
+from itertools import chain
+from xml.sax.saxutils import escape
+import csv
+import re
+import zipfile
+# Parquet exports are optional
+try:
+    import pyarrow
+    import pyarrow.parquet
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Rows fetched from the database cursor at a time while exporting
+EXPORT_BATCH_SIZE = 1000
+# Rows per Parquet row group (each group is written out as soon as it is full)
+PARQUET_ROW_GROUP_SIZE = 50000
+
+TOTAL_COLUMNS = [
+    ('pluri_id', 'PluriId', 'string'),
+    ('full_name', 'Nom complet', 'string'),
+    ('department', 'Départment', 'string'),
+    ('function', 'Fonction', 'string'),
+    ('total_hours', 'Total Heures travaillées', 'float'),
+]
+
+DETAIL_COLUMNS = TOTAL_COLUMNS[:4] + [
+    ('date', 'Date', 'date'),
+    ('check_in', 'Arrivée', 'string'),
+    ('check_out', 'Départ', 'string'),
+    ('total_hours', 'Heures travaillées', 'float'),
+]
+
+
+def apply_report_filters(query, args):
+    """Apply the report page filters (employee_name, pluri_id, department,
+    function, date_from, date_to) to a query joining Employee and
+    DailyAttendanceSummary. Raises ValueError on malformed dates.
+    """
+    employee_name = args.get('employee_name', '')
+    pluri_id = args.get('pluri_id', '')
+    department = args.get('department', '')
+    function = args.get('function', '')
+    date_from = args.get('date_from', '')
+    date_to = args.get('date_to', '')
+
+    if employee_name:
+        query = query.filter(
+            db.or_(
+                Employee.first_name.ilike(f'%{employee_name}%'),
+                Employee.last_name.ilike(f'%{employee_name}%')
+            )
+        )
+    if pluri_id:
+        query = query.filter(Employee.pluri_id == pluri_id)
+    if department:
+        query = query.filter(Employee.department == department)
+    if function:
+        query = query.filter(Employee.position == function)
+    if date_from:
+        query = query.filter(DailyAttendanceSummary.date >= datetime.strptime(date_from, '%Y-%m-%d').date())
+    if date_to:
+        query = query.filter(DailyAttendanceSummary.date <= datetime.strptime(date_to, '%Y-%m-%d').date())
+    return query
+
+
+def totals_query(args):
+    """One row per employee with the total worked seconds in the filtered range"""
+    query = db.session.query(
+        Employee.pluri_id,
+        Employee.first_name,
+        Employee.last_name,
+        Employee.department,
+        Employee.position,
+        db.func.sum(DailyAttendanceSummary.worked_seconds).label('total_seconds')
+    ).join(DailyAttendanceSummary, Employee.id == DailyAttendanceSummary.employee_id).group_by(Employee.id)
+    return apply_report_filters(query, args)
+
+
+def detail_query(args):
+    """One row per employee and day"""
+    query = db.session.query(
+        Employee.pluri_id,
+        Employee.first_name,
+        Employee.last_name,
+        Employee.department,
+        Employee.position,
+        DailyAttendanceSummary.date,
+        DailyAttendanceSummary.first_check_in,
+        DailyAttendanceSummary.last_check_out,
+        DailyAttendanceSummary.worked_seconds.label('total_seconds')
+    ).join(DailyAttendanceSummary, Employee.id == DailyAttendanceSummary.employee_id)
+    # (employee_id, date) order follows the unique index, so nothing is sorted up front
+    return apply_report_filters(query, args).order_by(DailyAttendanceSummary.employee_id, DailyAttendanceSummary.date)
+
+
+REPORT_GROUPINGS = ('employee', 'day', 'week', 'month')
+
+
+def report_query(args, group_by='employee', detail=False):
+    """Report rows for /api/report_data, aggregated or per day.
+
+    group_by=employee gives one row per employee; day, week and month give
+    one row per employee and period (keyed by the period's first day or
+    YYYY-MM), along with the employee's total over the whole range. With
+    detail=True every row is one day of one employee, carrying the total of
+    its period and a running total. All of it is computed by the database,
+    the totals with window functions over the filtered rows.
+    """
+    if group_by not in REPORT_GROUPINGS:
+        raise ValueError(f'Regroupement inconnu: {group_by}')
+    summary = DailyAttendanceSummary
+    period = date_bucket(summary.date, group_by).label('period') if group_by != 'employee' else None
+    employee_columns = [Employee.pluri_id, Employee.first_name, Employee.last_name,
+                        Employee.department, Employee.position]
+
+    if detail:
+        partition = [summary.employee_id] + ([period.element] if period is not None else [])
+        columns = employee_columns + [
+            summary.date,
+            summary.first_check_in,
+            summary.last_check_out,
+            summary.is_late,
+            summary.worked_seconds.label('total_seconds'),
+            db.func.sum(summary.worked_seconds).over(partition_by=partition).label('period_seconds'),
+            db.func.sum(summary.worked_seconds).over(
+                partition_by=summary.employee_id, order_by=summary.date, rows=(None, 0)
+            ).label('cumulative_seconds'),
+        ]
+        if period is not None:
+            columns.append(period)
+        query = db.session.query(*columns).join(summary, Employee.id == summary.employee_id)
+        return apply_report_filters(query, args).order_by(Employee.pluri_id, summary.date)
+
+    total = db.func.sum(summary.worked_seconds)
+    columns = employee_columns + [
+        total.label('total_seconds'),
+        db.func.count(summary.id).label('days_present'),
+        db.func.sum(db.case((summary.is_late, 1), else_=0)).label('late_days'),
+    ]
+    group = [Employee.id]
+    order = [Employee.pluri_id]
+    if period is not None:
+        columns += [period, db.func.sum(total).over(partition_by=Employee.id).label('employee_seconds')]
+        group.append(period.element)
+        order.append(period.element)
+    query = db.session.query(*columns).join(summary, Employee.id == summary.employee_id)
+    return apply_report_filters(query, args).group_by(*group).order_by(*order)
+
+
+def _hours(seconds):
+    return round((seconds or 0) / 3600, 2)
+
+
+def serialize_report_row(record, group_by='employee', detail=False):
+    row = {
+        'pluri_id': record.pluri_id,
+        'full_name': f'{record.first_name} {record.last_name}',
+        'department': record.department,
+        'function': record.position,
+        'total_hours': _hours(record.total_seconds),
+    }
+    if group_by != 'employee':
+        row['period'] = str(record.period)
+    if detail:
+        row.update({
+            'date': record.date.strftime('%Y-%m-%d'),
+            'check_in': record.first_check_in.strftime('%I:%M %p') if record.first_check_in else None,
+            'check_out': record.last_check_out.strftime('%I:%M %p') if record.last_check_out else None,
+            'late': bool(record.is_late),
+            'period_total_hours': _hours(record.period_seconds),
+            'cumulative_hours': _hours(record.cumulative_seconds),
+        })
+    else:
+        row['days_present'] = record.days_present
+        row['late_days'] = int(record.late_days or 0)
+        if group_by != 'employee':
+            row['employee_total_hours'] = _hours(record.employee_seconds)
+    return row
+
+
+def export_rows(args, detail=False):
+    """Columns and a generator of row tuples, streamed from a server-side cursor"""
+    if detail:
+        query = detail_query(args)
+        columns = DETAIL_COLUMNS
+    else:
+        query = totals_query(args).order_by(Employee.pluri_id)
+        columns = TOTAL_COLUMNS
+
+    def rows():
+        for record in query.yield_per(EXPORT_BATCH_SIZE):
+            row = [
+                record.pluri_id,
+                f'{record.first_name} {record.last_name}',
+                record.department,
+                record.position,
+            ]
+            if detail:
+                row += [
+                    record.date,
+                    record.first_check_in.strftime('%H:%M') if record.first_check_in else None,
+                    record.last_check_out.strftime('%H:%M') if record.last_check_out else None,
+                ]
+            row.append(round((record.total_seconds or 0) / 3600, 2))
+            yield row
+
+    return columns, rows()
+
+
+def csv_chunks(columns, rows):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([label for _, label, _ in columns])
+    for count, row in enumerate(rows, 1):
+        writer.writerow(['' if value is None else value for value in row])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """File-like object collecting written bytes until the caller takes them"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        f'<workbook xmlns="{XLSX_MAIN_NS}" xmlns:r="{XLSX_REL_NS}">'
+        '<sheets><sheet name="Rapport" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        f'<Relationship Id="rId1" Type="{XLSX_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{XLSX_REL_NS}/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Style 1 is the built-in short date format, for date cells
+    'xl/styles.xml': (
+        f'<styleSheet xmlns="{XLSX_MAIN_NS}">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+# Characters XML 1.0 does not allow, even escaped
+XML_ILLEGAL_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+EXCEL_EPOCH = date(1899, 12, 30)
+
+
+def _xlsx_cell(reference, value):
+    if value is None:
+        return ''
+    if isinstance(value, date):
+        return f'<c r="{reference}" s="1"><v>{(value - EXCEL_EPOCH).days}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    text = escape(XML_ILLEGAL_CHARACTERS.sub('', str(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_chunks(columns, rows):
+    """Stream an XLSX workbook, written as the rows come in.
+
+    The package is a zip written straight to the response: the worksheet
+    is compressed as it is produced and each member's sizes go in a data
+    descriptor after it, so nothing is buffered beyond one batch of rows.
+    """
+    letters = [chr(ord('A') + index) for index in range(len(columns))]
+    sink = _ChunkSink()
+    # _ChunkSink cannot seek, so zipfile writes data descriptors instead of going back
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as package:
+        for name, xml in XLSX_PARTS.items():
+            package.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + xml)
+        with package.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        f'<worksheet xmlns="{XLSX_MAIN_NS}"><sheetData>'.encode())
+            header = [label for _, label, _ in columns]
+            for number, row in enumerate(chain([header], rows), 1):
+                cells = ''.join(_xlsx_cell(f'{letter}{number}', value) for letter, value in zip(letters, row))
+                sheet.write(f'<row r="{number}">{cells}</row>'.encode())
+                if number % EXPORT_BATCH_SIZE == 0:
+                    yield sink.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.take()
+
+
+def parquet_chunks(columns, rows):
+    types = {'string': pyarrow.string(), 'float': pyarrow.float64(), 'date': pyarrow.date32()}
+    schema = pyarrow.schema([(name, types[kind]) for name, _, kind in columns])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema)
+
+    def flush(batch):
+        writer.write_table(pyarrow.Table.from_pylist(
+            [dict(zip(schema.names, row)) for row in batch], schema=schema
+        ))
+        return sink.take()
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == PARQUET_ROW_GROUP_SIZE:
+            yield flush(batch)
+            batch = []
+    if batch:
+        yield flush(batch)
+    writer.close()
+    yield sink.take()
+
+
+# format -> (mimetype, extension, writer, available)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', csv_chunks, True),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx', xlsx_chunks, True),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', parquet_chunks, PARQUET_AVAILABLE),
+}
@@ -0,0 +1,134 @@
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+import os
+import threading
+# File locks are POSIX only; elsewhere the single process is always the leader
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class LeaderLock:
+    """Non-blocking exclusive lock on a file, held until the process exits.
+
+    The kernel releases it when the holder dies, however it dies, so a
+    waiting process can take over without any lease to expire.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, 'a')
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            if fcntl:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class JobScheduler:
+    """Periodic jobs run by exactly one process among the gunicorn workers.
+
+    Every worker calls start(); the one holding the lock file runs an
+    APScheduler whose jobs are persisted in the database, so next run times
+    survive restarts and a missed backup runs once when the app comes back.
+    The other workers retry the lock every retry_interval seconds and take
+    over if the leader exits.
+
+    The wanted jobs come from desired_jobs(), a callable returning
+    {job_id: (func, trigger)} built from the Setting table. The leader
+    reconciles the job store with it every sync_interval seconds, so a
+    schedule saved through any worker is applied without a restart. func
+    must be a module-level function (the job store keeps its import path).
+    """
+
+    def __init__(self, app, engine_factory, desired_jobs, lock_path,
+                 sync_interval=30, retry_interval=30, misfire_grace_time=3600):
+        self.app = app
+        self.engine_factory = engine_factory
+        self.desired_jobs = desired_jobs
+        self.lock = LeaderLock(lock_path)
+        self.sync_interval = sync_interval
+        self.retry_interval = retry_interval
+        self.misfire_grace_time = misfire_grace_time
+        self.scheduler = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def is_leader(self):
+        return self.scheduler is not None
+
+    def start(self):
+        """Become the leader now, or keep trying in the background"""
+        if not self._try_lead():
+            threading.Thread(target=self._wait_for_lead, name='scheduler-election', daemon=True).start()
+        return self.is_leader
+
+    def _wait_for_lead(self):
+        while not self._stopped.wait(self.retry_interval):
+            if self._try_lead():
+                return
+
+    def _try_lead(self):
+        with self._lock:
+            if self.scheduler is not None:
+                return True
+            if not self.lock.acquire():
+                return False
+            with self.app.app_context():
+                engine = self.engine_factory()
+            scheduler = BackgroundScheduler(
+                jobstores={'default': SQLAlchemyJobStore(engine=engine), 'local': MemoryJobStore()},
+                job_defaults={'coalesce': True, 'max_instances': 1,
+                              'misfire_grace_time': self.misfire_grace_time}
+            )
+            scheduler.start()
+            scheduler.add_job(self.sync, 'interval', seconds=self.sync_interval,
+                              id='sync_schedule', jobstore='local')
+            self.scheduler = scheduler
+            print(f"Scheduler leader: process {os.getpid()}")
+        self.sync()
+        return True
+
+    def sync(self):
+        """Make the stored jobs match desired_jobs(); unchanged jobs keep their next run"""
+        if self.scheduler is None:
+            return
+        with self.app.app_context():
+            desired = self.desired_jobs()
+        stored = {job.id: job for job in self.scheduler.get_jobs(jobstore='default')}
+        for job_id, (func, trigger) in desired.items():
+            job = stored.get(job_id)
+            if job is None or str(job.trigger) != str(trigger) or job.func is not func:
+                self.scheduler.add_job(func, trigger, id=job_id, replace_existing=True)
+        for job_id in stored.keys() - desired.keys():
+            self.scheduler.remove_job(job_id)
+
+    def shutdown(self):
+        self._stopped.set()
+        with self._lock:
+            if self.scheduler is not None:
+                self.scheduler.shutdown(wait=False)
+                self.scheduler = None
+            self.lock.release()
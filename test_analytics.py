@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime
+from fixtures import use_test_database, AppTestCase, generate_attendance
+use_test_database()
+from app import app
+from analytics import attendance_histogram
+from models import db, Attendance
+
+
+class TestActivityData(AppTestCase):
+    def create_data(self):
+        self.employee_id = generate_attendance(employees=1, days=0)[0].id
+
+    def check_in(self, *moments):
+        with app.app_context():
+            for moment in moments:
+                db.session.add(Attendance(employee_id=self.employee_id, check_in=moment))
+            db.session.commit()
+
+    def activity(self, **params):
+        response = self.client.get('/activity-data', query_string=params)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        data = response.get_json()
+        return list(zip(data['labels'], data['data']))
+
+    def test_empty_buckets_are_zero(self):
+        self.check_in(datetime(2024, 3, 4, 9, 0), datetime(2024, 3, 6, 9, 0), datetime(2024, 3, 6, 14, 0))
+        self.assertEqual(self.activity(start='2024-03-04', end='2024-03-07', granularity='day'),
+                         [('04 Mar', 1), ('05 Mar', 0), ('06 Mar', 2), ('07 Mar', 0)])
+        # Nothing at all in the range still lists every bucket
+        self.assertEqual(self.activity(start='2023-03-04', end='2023-03-06', granularity='day'),
+                         [('04 Mar', 0), ('05 Mar', 0), ('06 Mar', 0)])
+
+    def test_week_buckets_across_year_end(self):
+        self.check_in(datetime(2024, 12, 31, 9, 0), datetime(2025, 1, 2, 9, 0), datetime(2025, 1, 8, 9, 0))
+        # Weeks start on Monday, even before the requested start
+        self.assertEqual(self.activity(start='2024-12-25', end='2025-01-12', granularity='week'),
+                         [('23 Dec', 0), ('30 Dec', 2), ('06 Jan', 1)])
+        self.assertEqual(self.activity(start='2024-11-15', end='2025-02-10', granularity='month'),
+                         [('Nov 2024', 0), ('Dec 2024', 1), ('Jan 2025', 2), ('Feb 2025', 0)])
+
+    def test_week_bucket_across_month_end(self):
+        self.check_in(datetime(2024, 2, 29, 9, 0), datetime(2024, 3, 1, 9, 0))
+        with app.app_context():
+            histogram = attendance_histogram(datetime(2024, 2, 26), datetime(2024, 3, 11), 'week')
+        self.assertEqual(histogram, [(datetime(2024, 2, 26), 2), (datetime(2024, 3, 4), 0)])
+
+    def test_invalid_parameters(self):
+        for params in ({'period': 'decade'}, {'granularity': 'fortnight'}, {'start': '04/03/2024'},
+                       {'start': '2024-03-07', 'end': '2024-03-04'},
+                       {'start': '0001-01-01', 'granularity': 'hour'}, {'period': 'year', 'granularity': 'hour'}):
+            with self.subTest(**params):
+                response = self.client.get('/activity-data', query_string=params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.get_json()['status'], 'error')
+
+    def test_bucket_limit(self):
+        # 1000 days is the most one request may zero-fill
+        self.assertEqual(len(self.activity(start='2022-01-01', end='2024-09-26', granularity='day')), 1000)
+        response = self.client.get('/activity-data?start=2022-01-01&end=2024-09-27&granularity=day')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1000', response.get_json()['message'])
+
+    def test_requires_login(self):
+        self.client.get('/logout')
+        self.assertEqual(self.client.get('/activity-data').status_code, 302)
+
+
+if __name__ == '__main__':
+    unittest.main()
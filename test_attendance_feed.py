@@ -0,0 +1,89 @@
+import json
+import threading
+import unittest
+from fixtures import use_test_database, AppTestCase, generate_attendance
+use_test_database()
+from app import app, attendance_feed, handle_attendance
+
+
+def read_events(response, count):
+    """Parse the next count SSE events (skipping comments and retry lines)"""
+    events = []
+    for chunk in response.response:
+        text = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if not text.startswith('id:'):
+            continue
+        fields = dict(line.split(': ', 1) for line in text.strip().split('\n'))
+        events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        if len(events) == count:
+            break
+    return events
+
+
+class TestAttendanceFeed(AppTestCase):
+    def create_data(self):
+        self.employee_id = generate_attendance(employees=1, days=0)[0].id
+        attendance_feed.reset()
+        attendance_feed.poll_interval = 0.05
+
+    def scan(self):
+        with app.app_context():
+            return handle_attendance(self.employee_id)
+
+    def test_replays_from_event_id(self):
+        self.scan()
+        self.scan()
+        response = self.client.get('/stream/attendance?last_event_id=0', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = read_events(response, 2)
+        response.close()
+        self.assertEqual([event_type for _, event_type, _ in events], ['attendance', 'attendance'])
+        check_in, check_out = [data for _, _, data in events]
+        self.assertEqual((check_in['type'], check_in['pluri_id']), ('check_in', 'EMP1'))
+        self.assertEqual(check_out['type'], 'check_out')
+        self.assertIsNotNone(check_out['check_out'])
+
+        # A reconnecting browser sends the last id it saw
+        response = self.client.get('/stream/attendance', headers={'Last-Event-ID': str(events[0][0])},
+                                   buffered=False)
+        resumed = read_events(response, 1)
+        response.close()
+        self.assertEqual(resumed[0][0], events[1][0])
+
+    def test_pushes_new_scans(self):
+        initial = self.client.get('/today_attendance')
+        self.assertEqual(initial.get_json(), [])
+        last_event_id = initial.headers['X-Last-Event-Id']
+
+        response = self.client.get(f'/stream/attendance?last_event_id={last_event_id}', buffered=False)
+        threading.Timer(0.2, self.scan).start()
+        events = read_events(response, 1)
+        response.close()
+        self.assertEqual(events[0][2]['type'], 'check_in')
+        self.assertEqual(self.client.get('/today_attendance').get_json()[0]['pluri_id'], 'EMP1')
+
+    def test_caps_open_streams(self):
+        attendance_feed.max_subscribers = 1
+        try:
+            first = self.client.get('/stream/attendance', buffered=False)
+            self.assertEqual(first.status_code, 200)
+            refused = self.client.get('/stream/attendance')
+            self.assertEqual(refused.status_code, 503)
+            self.assertEqual(refused.headers['Retry-After'], '30')
+
+            # Closing a stream frees its slot
+            first.close()
+            second = self.client.get('/stream/attendance', buffered=False)
+            self.assertEqual(second.status_code, 200)
+            second.close()
+        finally:
+            attendance_feed.max_subscribers = app.config['ATTENDANCE_FEED_MAX_STREAMS']
+
+    def test_requires_login(self):
+        self.client.get('/logout')
+        response = self.client.get('/stream/attendance')
+        self.assertEqual(response.status_code, 302)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from backup_engine import BackupEngine, BackupError, MANIFEST_SUFFIX, _compressed_reader, _compressed_writer
+from migrations import check_schema
+
+ROWS = 2000
+
+
+def rows_of(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT id, name FROM item ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+class TestBackupEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, 'attendance.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.executemany('INSERT INTO item (id, name) VALUES (?, ?)',
+                         [(n, f'item {n} ' + 'x' * 100) for n in range(ROWS)])
+        conn.commit()
+        conn.close()
+        self.engine = BackupEngine(self.db_path, os.path.join(self.tmp, 'backup'), step_sleep=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def execute(self, *statements):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def backdate(self, backup_id, days):
+        path = os.path.join(self.engine.backup_dir, backup_id + MANIFEST_SUFFIX)
+        with open(path) as f:
+            manifest = json.load(f)
+        manifest['created'] = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+        with open(path, 'w') as f:
+            json.dump(manifest, f)
+
+    def test_full_and_incremental_round_trip(self):
+        original = rows_of(self.db_path)
+        full = self.engine.create('full')
+        self.execute("UPDATE item SET name = 'changed' WHERE id = 7",
+                     "INSERT INTO item (id, name) VALUES (5000, 'new')")
+        changed = rows_of(self.db_path)
+        incremental = self.engine.create('incremental')
+
+        self.assertEqual(incremental['type'], 'incremental')
+        self.assertEqual(incremental['base'], full['id'])
+        self.assertLess(incremental['changed_pages'], incremental['page_count'] // 4)
+
+        for backup, expected in ((full, original), (incremental, changed)):
+            path = os.path.join(self.tmp, f"{backup['type']}.db")
+            self.engine.restore_to(backup['id'], path)
+            self.assertEqual(rows_of(path), expected)
+        self.assertTrue(self.engine.verify(incremental['id']))
+
+    def test_tampered_pages_rejected(self):
+        self.engine.create('full')
+        self.execute("UPDATE item SET name = 'changed' WHERE id = 7")
+        incremental = self.engine.create('incremental')
+
+        # Rewrite the page data with one byte flipped, keeping it well formed
+        data_path = os.path.join(self.engine.backup_dir, incremental['data_file'])
+        with _compressed_reader(data_path, incremental['codec']) as f:
+            data = bytearray(f.read())
+        data[8 + incremental['page_size'] // 2] ^= 0xFF
+        with _compressed_writer(data_path, incremental['codec']) as f:
+            f.write(bytes(data))
+
+        with self.assertRaisesRegex(BackupError, 'Checksum mismatch'):
+            self.engine.verify(incremental['id'])
+        with self.assertRaises(BackupError):
+            self.engine.restore_live(incremental['id'])
+        self.assertEqual(rows_of(self.db_path)[7][1], 'changed')
+
+    def test_cleanup_keeps_base_of_retained_incremental(self):
+        old = self.engine.create('full')
+        self.backdate(old['id'], 50)
+        base = self.engine.create('full')
+        incremental = self.engine.create('incremental')
+        self.assertEqual(incremental['base'], base['id'])
+        self.backdate(base['id'], 40)
+        self.backdate(incremental['id'], 1)
+
+        self.assertEqual(self.engine.cleanup(30), [old['id']])
+        self.assertEqual({b['id'] for b in self.engine.list()}, {base['id'], incremental['id']})
+        self.assertTrue(self.engine.verify(incremental['id']))
+
+        # Once the incremental expires too, the chain goes
+        self.backdate(incremental['id'], 40)
+        self.assertEqual(sorted(self.engine.cleanup(30)), sorted([base['id'], incremental['id']]))
+        self.assertEqual(self.engine.list(), [])
+
+    def test_restore_live_with_open_reader(self):
+        backup = self.engine.create('full')
+        self.execute('DELETE FROM item WHERE id >= 10')
+
+        reader = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(reader.execute('SELECT COUNT(*) FROM item').fetchone()[0], 10)
+            # A read transaction in progress keeps its snapshot until it ends
+            reader.execute('BEGIN')
+            self.assertEqual(reader.execute('SELECT COUNT(*) FROM item').fetchone()[0], 10)
+
+            self.engine.restore_live(backup['id'])
+
+            self.assertEqual(reader.execute('SELECT COUNT(*) FROM item').fetchone()[0], 10)
+            reader.execute('COMMIT')
+            self.assertEqual(reader.execute('SELECT COUNT(*) FROM item').fetchone()[0], ROWS)
+        finally:
+            reader.close()
+        self.assertEqual(len(rows_of(self.db_path)), ROWS)
+
+    def test_incompatible_schema_refused(self):
+        # item is the only table: the required employee tables are missing
+        backup = self.engine.create('full')
+        self.execute('CREATE TABLE user (id INTEGER PRIMARY KEY)')
+        swapped = []
+
+        def prepare(path):
+            engine = create_engine(f'sqlite:///{path}')
+            try:
+                problems = check_schema(engine)
+            finally:
+                engine.dispose()
+            if problems:
+                raise BackupError('Schéma incompatible: ' + ', '.join(problems))
+
+        with self.assertRaisesRegex(BackupError, 'missing table employee'):
+            self.engine.restore_live(backup['id'], prepare=prepare, before_swap=lambda: swapped.append(True))
+        self.assertEqual(swapped, [])
+        # The live database is untouched and no temporary copy is left behind
+        conn = sqlite3.connect(self.db_path)
+        try:
+            tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+        self.assertEqual(tables, {'item', 'user'})
+        self.assertEqual([name for name in os.listdir(self.tmp) if name.startswith('.restore-')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import re
+import shutil
+import tempfile
+import unittest
+import zlib
+from PIL import Image
+from fixtures import use_test_database, AppTestCase, generate_attendance
+use_test_database()
+from app import app
+import badge_sheet
+from badge_sheet import badge_sheet_pdf, BADGES_PER_PAGE
+from models import db, User
+
+
+def check_pdf(data):
+    """Page count of a PDF, after checking its cross-reference table points at its objects"""
+    xref_position = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data).group(1))
+    entries = re.findall(rb'(\d{10}) 00000 n ', data[xref_position:])
+    for number, offset in enumerate(entries, start=1):
+        assert data[int(offset):].startswith(b'%d 0 obj' % number), number
+    return int(re.search(rb'/Type /Pages /Kids \[[^\]]*\] /Count (\d+)', data).group(1))
+
+
+def page_text(data):
+    return b''.join(zlib.decompress(stream) for stream in
+                    re.findall(rb'/FlateDecode /Length \d+ >>\nstream\n(.*?)\nendstream', data, re.S))
+
+
+class TestBadgeSheet(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_pages_and_cache(self):
+        photo = f'{self.cache_dir}/photo.jpg'
+        Image.new('RGB', (1200, 900), 'navy').save(photo)
+        badges = [(f'ID{n}', f'Employé {n} (test)', 'Informatique', f'EMP_ID{n}_1234', photo if n % 2 else None)
+                  for n in range(BADGES_PER_PAGE * 2 + 1)]
+        chunks = list(badge_sheet_pdf(badges, cache_dir=self.cache_dir, workers=1))
+        data = b''.join(chunks)
+        self.assertTrue(data.startswith(b'%PDF-1.4'))
+        self.assertEqual(check_pdf(data), 3)
+        # Header, one chunk per page, then the page tree and xref
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(data.count(b'/Subtype /Image'), len(badges) // 2)
+
+        # Photos and QR codes come from the cache the second time, prepared by the same pool
+        pool = badge_sheet._pool
+        self.assertIsNotNone(pool)
+        self.assertEqual(b''.join(badge_sheet_pdf(badges, cache_dir=self.cache_dir, workers=1)), data)
+        self.assertIs(badge_sheet._pool, pool)
+
+        # A single page is prepared inline
+        self.assertEqual(check_pdf(b''.join(badge_sheet_pdf(badges[:3], workers=1))), 1)
+
+
+class TestBadgeRoute(AppTestCase):
+    def create_data(self):
+        app.config['BADGE_WORKERS'] = 1
+        for employee in generate_attendance(employees=3, days=0, departments=['Informatique', 'Finance']):
+            employee.generate_qr_code()
+        db.session.commit()
+
+    def test_department_sheet(self):
+        response = self.client.get('/employees/badges.pdf?department=Informatique')
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertIn('badges_Informatique.pdf', response.headers['Content-Disposition'])
+        data = response.get_data()
+        self.assertEqual(check_pdf(data), 1)
+        text = page_text(data)
+        self.assertIn(b'(EMP1)', text)
+        self.assertIn(b'(EMP3)', text)
+        self.assertNotIn(b'(EMP2)', text)
+
+        response = self.client.get('/employees/badges.pdf?department=Comptabilit\u00e9')
+        self.assertEqual(response.status_code, 302)
+
+    def test_admin_only(self):
+        with app.app_context():
+            staff = User(username='staff', is_admin=False)
+            staff.set_password('staff123')
+            db.session.add(staff)
+            db.session.commit()
+        self.client.get('/logout')
+        self.assertEqual(self.client.get('/employees/badges.pdf').status_code, 302)
+        self.login('staff', 'staff123')
+        self.assertEqual(self.client.get('/employees/badges.pdf').status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import time
+from unittest import mock
+import config_service
+from config_service import ConfigService
+
+CONFIG = {'inTime': '09:00:00', 'outTime': '16:00:00', 'departments': ['Administration et Direction']}
+
+
+class TestConfigService(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'config.json')
+        with open(self.path, 'w') as f:
+            json.dump(CONFIG, f)
+        os.chmod(self.path, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_parsed_once_until_file_changes(self):
+        config = ConfigService(self.path)
+        with mock.patch.object(config_service.json, 'load', wraps=json.load) as load:
+            self.assertEqual(config.in_time, time(9, 0))
+            self.assertEqual(config.get('departments'), ['Administration et Direction'])
+            self.assertEqual(config.out_time, time(16, 0))
+            self.assertEqual(load.call_count, 1)
+
+            # Edited in place by hand: same inode and size, only the mtime moves
+            mtime_ns = os.stat(self.path).st_mtime_ns
+            with open(self.path, 'w') as f:
+                json.dump({**CONFIG, 'inTime': '08:00:00'}, f)
+            os.utime(self.path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+            self.assertEqual(config.in_time, time(8, 0))
+            self.assertEqual(load.call_count, 2)
+
+    def test_reloads_after_another_worker_saves(self):
+        worker, other_worker = ConfigService(self.path), ConfigService(self.path)
+        self.assertEqual(worker.in_time, time(9, 0))
+        other_worker.update({'inTime': '08:30:00'})
+        self.assertEqual(worker.in_time, time(8, 30))
+
+        # A stale writer re-reads before merging, so neither change is lost
+        worker.update({'outTime': '17:00:00'})
+        self.assertEqual(other_worker.get(), {**CONFIG, 'inTime': '08:30:00', 'outTime': '17:00:00'})
+
+    def test_update_replaces_file_atomically(self):
+        config = ConfigService(self.path)
+        inode = os.stat(self.path).st_ino
+        with open(self.path) as reader:
+            config.update({'inTime': '10:00:00'})
+            # An open reader still sees the whole previous file
+            self.assertEqual(json.load(reader), CONFIG)
+
+        stat = os.stat(self.path)
+        self.assertNotEqual(stat.st_ino, inode)
+        self.assertEqual(stat.st_mode & 0o777, 0o640)
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {**CONFIG, 'inTime': '10:00:00'})
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['config.json', 'config.json.lock'])
+
+    def test_failed_write_keeps_previous_file(self):
+        config = ConfigService(self.path)
+        with mock.patch.object(config_service.json, 'dump', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                config.update({'inTime': '10:00:00'})
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), CONFIG)
+        self.assertEqual(config.in_time, time(9, 0))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['config.json', 'config.json.lock'])
+
+
+if __name__ == '__main__':
+    unittest.main()
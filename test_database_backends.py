@@ -0,0 +1,274 @@
+import os
+import tempfile
+import threading
+import unittest
+from flask import Flask
+from sqlalchemy import create_engine, select, func
+from models import db, Employee, Attendance, AttendanceChange, DailyAttendanceSummary
+from analytics import attendance_histogram
+from database import date_of, time_of_day, seconds_between
+from migrate_to_postgres import copy_database
+from attendance_feed import record_change
+from datetime import datetime, date, time
+
+# PostgreSQL runs when TEST_POSTGRES_URL points at a server (e.g. a local
+# container), or through an embedded server when pgserver is installed.
+try:
+    import pgserver
+except ImportError:
+    pgserver = None
+
+_embedded_postgres = None
+
+
+def postgres_url():
+    global _embedded_postgres
+    if os.environ.get('TEST_POSTGRES_URL'):
+        return os.environ['TEST_POSTGRES_URL']
+    if pgserver is None:
+        return None
+    if _embedded_postgres is None:
+        _embedded_postgres = pgserver.get_server(tempfile.mkdtemp(), cleanup_mode='stop')
+    return _embedded_postgres.get_uri()
+
+
+class BackendTests:
+    """Portable date arithmetic, run once per backend"""
+    database_url = None
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = self.database_url
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+
+        self.employee = Employee(pluri_id='PLURI001', first_name='Ada', last_name='Lovelace',
+                                 email='ada@example.com', hire_date=date(2020, 1, 1), dob=date(1990, 1, 1))
+        db.session.add(self.employee)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_session(self, check_in, check_out=None, in_time=time(9, 0)):
+        attendance = Attendance(employee_id=self.employee.id, check_in=check_in, check_out=check_out)
+        db.session.add(attendance)
+        DailyAttendanceSummary.record_check_in(attendance, in_time)
+        if check_out:
+            DailyAttendanceSummary.record_check_out(attendance)
+        db.session.commit()
+        return attendance
+
+    def test_expressions(self):
+        self.add_session(datetime(2024, 3, 4, 9, 15, 30), datetime(2024, 3, 4, 17, 45, 0))
+        row = db.session.execute(select(
+            date_of(Attendance.check_in),
+            time_of_day(Attendance.check_in) > time(9, 0),
+            time_of_day(Attendance.check_in).between(time(9, 0), time(10, 0)),
+            seconds_between(Attendance.check_in, Attendance.check_out)
+        )).one()
+        self.assertEqual(str(row[0]), '2024-03-04')
+        self.assertTrue(row[1])
+        self.assertTrue(row[2])
+        self.assertAlmostEqual(float(row[3]), 8 * 3600 + 29 * 60 + 30, places=3)
+
+    def test_open_session_has_no_duration(self):
+        self.add_session(datetime(2024, 3, 4, 9, 0))
+        self.assertIsNone(db.session.execute(
+            select(seconds_between(Attendance.check_in, Attendance.check_out))
+        ).scalar())
+
+    def test_rebuild_matches_incremental_summary(self):
+        self.add_session(datetime(2024, 3, 4, 8, 30), datetime(2024, 3, 4, 12, 0, 0, 250000))
+        self.add_session(datetime(2024, 3, 5, 9, 45), datetime(2024, 3, 5, 16, 10))
+        self.add_session(datetime(2024, 3, 6, 10, 0))
+
+        def snapshot():
+            return sorted(
+                (str(s.date), s.first_check_in, s.last_check_out, round(s.worked_seconds, 3), bool(s.is_late))
+                for s in DailyAttendanceSummary.query.all()
+            )
+
+        incremental = snapshot()
+        self.assertEqual(DailyAttendanceSummary.rebuild(in_time=time(9, 0)), 3)
+        self.assertEqual(snapshot(), incremental)
+
+    def test_scan_flow_summary_matches_rebuild(self):
+        # Check-ins and check-outs committed separately, as handle_attendance does
+        other = Employee(pluri_id='PLURI003', first_name='Grace', last_name='Hopper',
+                         email='grace@example.com', hire_date=date(2020, 1, 1), dob=date(1990, 1, 1))
+        db.session.add(other)
+        db.session.commit()
+        sessions = [
+            (self.employee.id, datetime(2024, 3, 4, 9, 0), datetime(2024, 3, 4, 12, 0)),  # on time, at in_time
+            (self.employee.id, datetime(2024, 3, 4, 13, 0), datetime(2024, 3, 4, 17, 30, 15, 500000)),
+            (self.employee.id, datetime(2024, 3, 5, 9, 0, 1), None),  # late, never checked out
+            (self.employee.id, datetime(2024, 3, 6, 8, 0), datetime(2024, 3, 6, 12, 0)),
+            (self.employee.id, datetime(2024, 3, 6, 14, 0), None),  # still open after a closed one
+            (other.id, datetime(2024, 3, 4, 10, 0), datetime(2024, 3, 4, 18, 0)),
+        ]
+        for employee_id, check_in, check_out in sessions:
+            attendance = Attendance(employee_id=employee_id, check_in=check_in)
+            db.session.add(attendance)
+            DailyAttendanceSummary.record_check_in(attendance, time(9, 0))
+            db.session.commit()
+            if check_out:
+                attendance.check_out = check_out
+                DailyAttendanceSummary.record_check_out(attendance)
+                db.session.commit()
+
+        def snapshot():
+            return {
+                (s.employee_id, str(s.date)): (s.first_check_in, s.last_check_out, round(s.worked_seconds, 3),
+                                               bool(s.is_late))
+                for s in DailyAttendanceSummary.query.all()
+            }
+
+        incremental = snapshot()
+        mine = self.employee.id
+        self.assertEqual(incremental[mine, '2024-03-04'][2:], (3 * 3600 + 4.5 * 3600 + 15.5, False))
+        self.assertEqual(incremental[mine, '2024-03-05'][1:], (None, 0, True))
+        self.assertEqual(incremental[mine, '2024-03-06'][1:], (datetime(2024, 3, 6, 12, 0), 4 * 3600, False))
+        self.assertTrue(incremental[other.id, '2024-03-04'][3])
+
+        self.assertEqual(DailyAttendanceSummary.rebuild(in_time=time(9, 0)), 4)
+        self.assertEqual(snapshot(), incremental)
+
+    def test_histogram_buckets(self):
+        # Monday 4 March 2024 to Sunday 17 March: two weeks
+        for day in (4, 5, 5, 10, 11, 17):
+            self.add_session(datetime(2024, 3, day, 9, 30))
+        start, end = datetime(2024, 3, 4), datetime(2024, 3, 18)
+
+        weekly = attendance_histogram(start, end, 'week')
+        self.assertEqual([(bucket.date(), count) for bucket, count in weekly],
+                         [(date(2024, 3, 4), 4), (date(2024, 3, 11), 2)])
+        daily = dict(attendance_histogram(start, end, 'day'))
+        self.assertEqual(daily[datetime(2024, 3, 5)], 2)
+        self.assertEqual(sum(daily.values()), 6)
+        hourly = dict(attendance_histogram(datetime(2024, 3, 5), datetime(2024, 3, 6), 'hour'))
+        self.assertEqual(hourly[datetime(2024, 3, 5, 9)], 2)
+        monthly = attendance_histogram(datetime(2024, 3, 1), datetime(2024, 4, 1), 'month')
+        self.assertEqual(monthly, [(datetime(2024, 3, 1), 6)])
+
+
+    def test_auto_close(self):
+        nurse = Employee(pluri_id='PLURI002', first_name='Florence', last_name='Nightingale',
+                         email='florence@example.com', department='Personnel Médical',
+                         hire_date=date(2020, 1, 1), dob=date(1990, 1, 1))
+        db.session.add(nurse)
+        db.session.commit()
+        self.add_session(datetime(2024, 3, 4, 9, 0))
+        self.add_session(datetime(2024, 3, 5, 17, 30))  # opened after the out time
+        self.add_session(datetime(2024, 3, 6, 9, 0), datetime(2024, 3, 6, 12, 0))
+        self.add_session(datetime(2024, 3, 7, 9, 0))  # still "today"
+        db.session.add(Attendance(employee_id=nurse.id, check_in=datetime(2024, 3, 4, 8, 0)))
+        db.session.commit()
+
+        closed = Attendance.auto_close(time(9, 0), time(16, 0), {'Personnel Médical': time(20, 0)},
+                                       before=datetime(2024, 3, 7))
+        self.assertEqual(closed, 3)
+        rows = {(a.employee_id, a.check_in.day): a for a in Attendance.query.all()}
+        mine = self.employee.id
+        self.assertEqual(rows[mine, 4].check_out, datetime(2024, 3, 4, 16, 0))
+        self.assertAlmostEqual(rows[mine, 4].total_hours, 7.0)
+        self.assertTrue(rows[mine, 4].auto_closed)
+        self.assertEqual(rows[mine, 5].check_out, datetime(2024, 3, 5, 17, 30))
+        self.assertAlmostEqual(rows[mine, 5].total_hours, 0.0)
+        self.assertFalse(rows[mine, 6].auto_closed)
+        self.assertIsNone(rows[mine, 7].check_out)
+        self.assertEqual(rows[nurse.id, 4].check_out, datetime(2024, 3, 4, 20, 0))
+
+        summary = DailyAttendanceSummary.query.filter_by(employee_id=mine, date=date(2024, 3, 4)).one()
+        self.assertEqual(summary.last_check_out, datetime(2024, 3, 4, 16, 0))
+        self.assertAlmostEqual(summary.worked_seconds, 7 * 3600)
+
+        # Nothing left to close
+        self.assertEqual(Attendance.auto_close(time(9, 0), time(16, 0), before=datetime(2024, 3, 7)), 0)
+
+
+class TestSQLiteBackend(BackendTests, unittest.TestCase):
+    database_url = 'sqlite://'
+
+
+class TestPostgresBackend(BackendTests, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.database_url = postgres_url()
+        if cls.database_url is None:
+            raise unittest.SkipTest('Set TEST_POSTGRES_URL or install pgserver to test PostgreSQL')
+        try:
+            import psycopg2  # noqa: F401
+        except ImportError:
+            raise unittest.SkipTest('psycopg2 is not installed')
+
+    def test_change_ids_commit_in_order(self):
+        # The live feed skips an id that commits after a greater one was read
+        first = Attendance(employee_id=self.employee.id, check_in=datetime(2024, 3, 4, 9, 0))
+        db.session.add(first)
+        record_change(first, 'check_in')
+        db.session.flush()
+        committed = []
+
+        def concurrent_scan():
+            with self.app.app_context():
+                second = Attendance(employee_id=self.employee.id, check_in=datetime(2024, 3, 4, 9, 5))
+                db.session.add(second)
+                record_change(second, 'check_in')
+                db.session.commit()
+                committed.append(second.id)
+                db.session.remove()
+
+        writer = threading.Thread(target=concurrent_scan)
+        writer.start()
+        writer.join(0.5)
+        # Waits for the first transaction, though it would draw the next id right away
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(committed, [])
+        db.session.commit()
+        writer.join(5)
+        self.assertEqual(len(committed), 1)
+        self.assertEqual(sorted(change.id for change in AttendanceChange.query), [1, 2])
+
+    def test_copy_from_sqlite(self):
+        self.add_session(datetime(2024, 3, 4, 8, 30), datetime(2024, 3, 4, 17, 0))
+        self.add_session(datetime(2024, 3, 5, 9, 30))
+        employee_id = self.employee.id
+
+        # Build a SQLite source from the same rows, then copy it into the emptied target
+        with tempfile.TemporaryDirectory() as tmp:
+            source = create_engine(f"sqlite:///{os.path.join(tmp, 'attendance.db')}")
+            db.metadata.create_all(source)
+            with source.begin() as connection:
+                for table in db.metadata.sorted_tables:
+                    rows = [dict(row._mapping) for row in db.session.execute(select(table))]
+                    if rows:
+                        connection.execute(table.insert(), rows)
+            db.session.remove()
+            db.drop_all()
+
+            counts = copy_database(source, db.engine, batch_size=1)
+            source.dispose()
+
+        self.assertEqual(counts['employee'], 1)
+        self.assertEqual(counts['attendance'], 2)
+        self.assertEqual(counts['daily_attendance_summary'], 2)
+        summary = DailyAttendanceSummary.query.order_by(DailyAttendanceSummary.date).first()
+        self.assertEqual(summary.date, date(2024, 3, 4))
+        self.assertFalse(summary.is_late)
+
+        # Sequences continue after the copied ids
+        attendance = Attendance(employee_id=employee_id, check_in=datetime(2024, 3, 6, 9, 0))
+        db.session.add(attendance)
+        db.session.commit()
+        self.assertEqual(attendance.id, 3)
+        self.assertEqual(db.session.execute(select(func.count()).select_from(Attendance)).scalar(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
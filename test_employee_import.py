@@ -0,0 +1,130 @@
+import io
+import unittest
+from fixtures import use_test_database, AppTestCase
+use_test_database()
+from app import app
+from employee_import import read_rows, XLSX_AVAILABLE
+from models import db, Employee, User
+
+HEADER = 'full_name;email;phone;gender;dob;department;role;hire_date\n'
+
+
+def spreadsheet(*lines):
+    return (io.BytesIO((HEADER + ''.join(line + '\n' for line in lines)).encode()), 'employees.csv')
+
+
+class TestEmployeeImport(AppTestCase):
+    def create_data(self):
+        app.config['IMPORT_WORKERS'] = 2
+
+    def upload(self, *lines, **form):
+        return self.client.post('/employees/import', data={'file': spreadsheet(*lines), **form},
+                                content_type='multipart/form-data')
+
+    def test_dry_run_reports_each_row(self):
+        response = self.upload(
+            'Jean Dupont;jean@test.com;+50912345678;male;1990-05-01;Informatique;Développeur;2021-01-04',
+            'Marie Paul;jean@test.com;;female;15/03/1992;Informatique;Comptable;04/01/2021',
+            ';pas-un-email;;autre;1990-13-01;;;',
+            dry_run='1'
+        )
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual((report['total'], report['valid'], report['invalid'], report['created']), (3, 1, 2, 0))
+        ok, duplicate, invalid = report['rows']
+        self.assertEqual((ok['row'], ok['status'], ok['name']), (2, 'ok', 'Jean Dupont'))
+        self.assertEqual(duplicate['errors'], ['email en double avec la ligne 2'])
+        self.assertIn('nom manquant', invalid['errors'])
+        self.assertIn('email invalide: pas-un-email', invalid['errors'])
+        self.assertIn('genre invalide: autre', invalid['errors'])
+        self.assertIn('dob invalide: 1990-13-01', invalid['errors'])
+        with app.app_context():
+            self.assertEqual(Employee.query.count(), 0)
+
+        # Without skip_invalid, one bad row blocks the whole file
+        response = self.upload(
+            'Jean Dupont;jean@test.com;;male;1990-05-01;Informatique;Développeur;2021-01-04',
+            'Marie Paul;pas-un-email;;;1992-03-15;;;2021-01-04'
+        )
+        self.assertEqual(response.status_code, 400)
+        with app.app_context():
+            self.assertEqual(Employee.query.count(), 0)
+
+    def test_import_creates_employees_and_users(self):
+        lines = [f'Test {n};emp{n}@test.com;;;1990-01-01;Informatique;Développeur;2021-01-04'
+                 for n in range(1, 8)]
+        response = self.upload(*lines, 'Bad Row;emp1@test.com;;;1990-01-01;;;2021-01-04', skip_invalid='on')
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual((report['created'], report['invalid']), (7, 1))
+        pluri_ids = [row['pluri_id'] for row in report['rows'] if row['status'] == 'ok']
+
+        with app.app_context():
+            employees = Employee.query.order_by(Employee.email).all()
+            self.assertEqual(len(employees), 7)
+            self.assertEqual(len(set(pluri_ids)), 7)
+            employee = employees[0]
+            self.assertEqual((employee.first_name, employee.last_name, employee.email),
+                             ('Test', '1', 'emp1@test.com'))
+            self.assertTrue(employee.qr_data.startswith(f'EMP_{employee.pluri_id}_'))
+            # Every employee can log in with their PluriId, as for the form
+            user = db.session.get(User, employee.user_id)
+            self.assertEqual(user.username, f'user_{employee.pluri_id}')
+            self.assertTrue(user.check_password(employee.pluri_id))
+        self.assertEqual(self.client.get(f'/qr/{pluri_ids[0]}.png').status_code, 200)
+
+        # The same emails again are now taken
+        response = self.upload(lines[0])
+        self.assertEqual(response.get_json()['rows'][0]['errors'], ['email déjà utilisé: emp1@test.com'])
+
+    def test_concurrent_import_conflict(self):
+        import employee_import
+        from datetime import date
+        from unittest import mock
+        validate_rows = employee_import.validate_rows
+
+        def validate_then_race(rows, existing_emails):
+            results = validate_rows(rows, existing_emails)
+            # Another import commits the same email once this one has checked it
+            with db.engine.begin() as connection:
+                connection.execute(Employee.__table__.insert().values(
+                    pluri_id='OTHER1', first_name='Autre', last_name='Import', email='emp2@test.com',
+                    hire_date=date(2021, 1, 4), dob=date(1990, 1, 1)))
+            return results
+
+        with mock.patch.object(employee_import, 'validate_rows', validate_then_race):
+            response = self.upload(*[f'Test {n};emp{n}@test.com;;;1990-01-01;Informatique;Développeur;2021-01-04'
+                                     for n in range(1, 4)])
+        self.assertEqual(response.status_code, 400)
+        report = response.get_json()
+        self.assertEqual((report['created'], report['valid'], report['invalid']), (0, 2, 1))
+        self.assertEqual(report['rows'][1], {'row': 3, 'status': 'error', 'errors': ['email déjà utilisé: emp2@test.com']})
+        with app.app_context():
+            self.assertEqual(Employee.query.count(), 1)
+            self.assertEqual(User.query.filter(User.username.like('user_%')).count(), 0)
+
+    @unittest.skipUnless(XLSX_AVAILABLE, 'openpyxl is not installed')
+    def test_reads_xlsx(self):
+        from datetime import datetime
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.active.append(['First name', 'Last name', 'Email', 'DOB', 'Position', 'Hire date'])
+        workbook.active.append(['Jean', 'Dupont', 'jean@test.com', datetime(1990, 5, 1), 'Comptable', '04/01/2021'])
+        workbook.active.append([None] * 6)
+        stream = io.BytesIO()
+        workbook.save(stream)
+        stream.seek(0)
+        rows = read_rows(stream, 'Employees.XLSX')
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['first_name'], rows[0]['role'], rows[0]['dob']),
+                         ('Jean', 'Comptable', datetime(1990, 5, 1)))
+
+    def test_rejects_unknown_format(self):
+        response = self.client.post('/employees/import', data={'file': (io.BytesIO(b'x'), 'employees.txt')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('CSV ou XLSX', response.get_json()['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
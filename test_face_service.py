@@ -0,0 +1,160 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+import numpy as np
+from fixtures import use_test_database, is_test_database, reset_database, AppTestCase
+use_test_database()
+import face_service
+from app import app, face_cache, face_pool
+from face_pool import JobTimeout, PoolSaturated
+from face_service import FaceEncodingCache, compute_encoding, encode_image
+from models import db, Employee, FaceEncoding
+
+
+class FakeRunner:
+    """Stands in for FaceWorkerPool.run: records the jobs and returns one encoding per photo, or None for faceless ones"""
+
+    def __init__(self):
+        self.jobs = []
+        self.faceless = set()
+
+    def __call__(self, fn, *args):
+        self.jobs.append((fn, args[0]))
+        if os.path.basename(args[0]) in self.faceless:
+            return None
+        return np.full(128, len(self.jobs), dtype=np.float64)
+
+
+class TestComputeEncoding(unittest.TestCase):
+    def test_small_face_found_at_full_size(self):
+        image = np.zeros((1200, 1600, 3), dtype=np.uint8)
+        recognition = mock.Mock()
+        # Too small for the reduced detection pass, found by the full-size one
+        recognition.face_locations.return_value = []
+        recognition.face_encodings.return_value = [np.ones(128)]
+        with mock.patch.object(face_service, 'face_recognition', recognition, create=True):
+            np.testing.assert_array_equal(compute_encoding(image), np.ones(128))
+        recognition.face_encodings.assert_called_once_with(image, known_face_locations=None)
+
+        recognition.face_encodings.return_value = []
+        with mock.patch.object(face_service, 'face_recognition', recognition, create=True):
+            self.assertIsNone(compute_encoding(image))
+
+
+@mock.patch.object(face_service, 'FACE_RECOGNITION_ENABLED', True)
+class TestFaceEncodingCache(unittest.TestCase):
+    def setUp(self):
+        if not is_test_database(app):
+            self.skipTest('app was already imported with another database')
+        self.tmp = tempfile.mkdtemp()
+        self.stamp_path = os.path.join(self.tmp, 'face_cache.stamp')
+        self.runner = FakeRunner()
+        self.cache = FaceEncodingCache(self.tmp, stamp_path=self.stamp_path, runner=self.runner)
+        self.ctx = app.app_context()
+        self.ctx.push()
+        reset_database()
+        self.employees = []
+        for n in (1, 2):
+            with open(os.path.join(self.tmp, f'photo{n}.jpg'), 'wb') as f:
+                f.write(b'jpeg')
+            employee = Employee(pluri_id=f'FACE{n}', first_name='Test', last_name=str(n), email=f'face{n}@test.com',
+                                photo=f'photo{n}.jpg', hire_date=date(2020, 1, 1), dob=date(1990, 1, 1))
+            db.session.add(employee)
+            self.employees.append(employee)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        shutil.rmtree(self.tmp)
+
+    def test_lazy_enrollment_reaches_other_workers(self):
+        other_worker = FaceEncodingCache(self.tmp, stamp_path=self.stamp_path, runner=self.runner)
+        self.assertEqual(len(other_worker.index()), 0)
+
+        encoding = self.cache.get(self.employees[0])
+        self.assertEqual(self.runner.jobs, [(encode_image, os.path.join(self.tmp, 'photo1.jpg'))])
+        self.assertEqual(FaceEncoding.query.count(), 1)
+        self.assertEqual(other_worker.index().employee_ids.tolist(), [self.employees[0].id])
+
+        # Stored now: neither cache encodes it again
+        np.testing.assert_array_equal(other_worker.get(self.employees[0]), encoding)
+        np.testing.assert_array_equal(self.cache.get(self.employees[0]), encoding)
+        self.assertEqual(len(self.runner.jobs), 1)
+
+    def test_photo_without_face_encoded_once(self):
+        self.runner.faceless.add('photo2.jpg')
+        other_worker = FaceEncodingCache(self.tmp, stamp_path=self.stamp_path, runner=self.runner)
+        other_worker.index()
+        for _ in range(3):
+            self.assertIsNone(self.cache.get(self.employees[1]))
+            self.assertIsNone(other_worker.get(self.employees[1]))
+        self.assertEqual(len(self.runner.jobs), 1)
+        # Nothing entered the index, so no worker had to rebuild it
+        self.assertFalse(os.path.exists(self.stamp_path))
+        self.assertEqual(len(self.cache.index()), 0)
+
+        # A new photo with a face is encoded and published
+        shutil.copy(os.path.join(self.tmp, 'photo2.jpg'), os.path.join(self.tmp, 'photo3.jpg'))
+        self.employees[1].photo = 'photo3.jpg'
+        db.session.commit()
+        self.assertIsNotNone(self.cache.get(self.employees[1]))
+        self.assertEqual(other_worker.index().employee_ids.tolist(), [self.employees[1].id])
+
+    def test_backfill_enrolls_missing_photos(self):
+        self.cache.enroll(self.employees[0])
+        db.session.commit()
+        # A photo replaced outside the form, and an employee without one
+        shutil.copy(os.path.join(self.tmp, 'photo1.jpg'), os.path.join(self.tmp, 'photo3.jpg'))
+        self.employees[0].photo = 'photo3.jpg'
+        db.session.add(Employee(pluri_id='FACE3', first_name='No', last_name='Photo', email='face3@test.com',
+                                hire_date=date(2020, 1, 1), dob=date(1990, 1, 1)))
+        db.session.commit()
+        self.runner.jobs.clear()
+
+        self.assertEqual(self.cache.backfill(), (2, 0))
+        self.assertEqual(sorted(path for _, path in self.runner.jobs),
+                         [os.path.join(self.tmp, 'photo2.jpg'), os.path.join(self.tmp, 'photo3.jpg')])
+        self.assertEqual(len(self.cache.index()), 2)
+        self.assertEqual(self.cache.backfill(), (0, 0))
+
+
+@mock.patch.object(face_service, 'FACE_RECOGNITION_ENABLED', True)
+class TestEnrollThroughPool(AppTestCase):
+    def create_data(self):
+        self.profiles = os.path.join(app.config['UPLOAD_FOLDER'], 'uploads', 'profiles')
+        os.makedirs(self.profiles, exist_ok=True)
+
+    def test_full_pool_refuses_new_employee(self):
+        before = set(os.listdir(self.profiles))
+
+        def saturated(fn, *args):
+            raise PoolSaturated(7)
+
+        with mock.patch.object(face_cache, 'runner', saturated):
+            response = self.client.post('/employees', data={
+                'full_name': 'Ada Lovelace', 'email': 'ada@test.com', 'hire_date': '2020-01-01',
+                'dob': '1990-01-01', 'role': 'Comptable',
+                'profile_picture': (io.BytesIO(b'jpeg'), 'ada.jpg'),
+            }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '7')
+        with app.app_context():
+            self.assertEqual(Employee.query.count(), 0)
+        self.assertEqual(set(os.listdir(self.profiles)), before)
+
+    @mock.patch('app.FACE_RECOGNITION_ENABLED', True)
+    def test_identify_pool_errors(self):
+        for error, status in ((PoolSaturated(7), 503), (JobTimeout('slow'), 504)):
+            with self.subTest(status=status), mock.patch.object(face_pool, 'run', side_effect=error):
+                response = self.client.post('/api/face/identify', json={'image_data': 'aW1hZ2U='})
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.headers.get('Retry-After'), '7' if status == 503 else None)
+
+
+if __name__ == '__main__':
+    unittest.main()
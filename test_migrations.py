@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine, inspect
+from fixtures import use_test_database, AppTestCase, generate_attendance
+use_test_database()
+from app import app, backup_engine
+from backup_engine import BackupEngine
+from migrations import upgrade_schema, check_schema
+from models import db, Employee, DailyAttendanceSummary
+
+
+def create_old_database(path, *statements):
+    """The current schema at path, taken back by statements"""
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+    return engine
+
+
+class TestUpgradeSchema(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.engine = create_old_database(
+            os.path.join(self.tmp, 'attendance.db'),
+            'DROP INDEX ix_attendance_check_in',
+            'ALTER TABLE attendance DROP COLUMN auto_closed',
+            'DROP TABLE attendance_change',
+        )
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmp)
+
+    def test_upgrade_is_idempotent(self):
+        self.assertEqual(check_schema(self.engine), [])
+        created = upgrade_schema(self.engine)
+        self.assertIn('attendance.auto_closed', created)
+        self.assertIn('ix_attendance_check_in', created)
+
+        inspector = inspect(self.engine)
+        self.assertIn('attendance_change', inspector.get_table_names())
+        self.assertIn('auto_closed', {column['name'] for column in inspector.get_columns('attendance')})
+        # Nothing left to do the second time
+        self.assertEqual(upgrade_schema(self.engine), [])
+
+    def test_missing_required_column_reported(self):
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql('ALTER TABLE employee DROP COLUMN hire_date')
+        self.assertEqual(check_schema(self.engine), ['missing column employee.hire_date'])
+
+
+class TestRestoreSchemaCheck(AppTestCase):
+    def create_data(self):
+        generate_attendance(employees=2, days=1)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        patcher = mock.patch.object(backup_engine, 'backup_dir', self.tmp)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mismatched_schema_refused(self):
+        # A backup of a database whose employee table lacks a required column
+        old_path = os.path.join(self.tmp, 'old.db')
+        create_old_database(old_path, 'ALTER TABLE employee DROP COLUMN hire_date').dispose()
+        backup = BackupEngine(old_path, self.tmp, step_sleep=0).create('full')
+
+        response = self.client.post(f"/backup/restore/{backup['id']}")
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].endswith('/backup'))
+        with self.client.session_transaction() as session:
+            flashes = session['_flashes']
+        self.assertEqual(flashes[-1:], [('error', 'Restauration impossible: Schéma incompatible: '
+                                                 'missing column employee.hire_date')])
+
+        # Neither swapped nor snapshotted
+        with app.app_context():
+            self.assertEqual(Employee.query.count(), 2)
+        self.assertEqual([b['id'] for b in backup_engine.list()], [backup['id']])
+
+    def test_restore_rebuilds_missing_rollup(self):
+        # A backup taken before the daily rollup existed
+        with app.app_context():
+            DailyAttendanceSummary.query.delete()
+            db.session.commit()
+            backup = backup_engine.create('full')
+            DailyAttendanceSummary.rebuild()
+
+        response = self.client.post(f"/backup/restore/{backup['id']}")
+        self.assertEqual(response.status_code, 302)
+        with app.app_context():
+            self.assertEqual(DailyAttendanceSummary.query.count(), 2)
+        rows = self.client.get('/api/report_data?group_by=employee').get_json()['data']
+        self.assertEqual([(row['pluri_id'], row['days_present']) for row in rows], [('EMP1', 1), ('EMP2', 1)])
+        self.assertAlmostEqual(rows[0]['total_hours'], 8.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
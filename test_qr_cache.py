@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+from fixtures import use_test_database, AppTestCase, generate_attendance
+use_test_database()
+from app import app
+from models import db, Employee, new_qr_data
+from qr_cache import QRCache
+
+
+class TestQRCache(AppTestCase):
+    def create_data(self):
+        self.codes = {employee.pluri_id: employee.generate_qr_code()
+                      for employee in generate_attendance(employees=3, days=0)}
+        db.session.commit()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.stamp_path = os.path.join(self.tmp, 'qr_cache.stamp')
+
+    def setUp(self):
+        super().setUp()
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+        super().tearDown()
+
+    def test_lru_eviction_and_stats(self):
+        cache = QRCache(maxsize=2, stamp_path=self.stamp_path)
+        a, b, c = (self.codes[f'EMP{n}'] for n in (1, 2, 3))
+        self.assertEqual(cache.get(a)[1], 'EMP1')
+        cache.get(b)
+        cache.get(a)  # hit: now the most recently used
+        cache.get(c)  # evicts b
+        self.assertEqual(cache.get(a)[1], 'EMP1')
+        self.assertEqual(cache.get(b)[1], 'EMP2')  # loaded again, evicting c
+        self.assertIsNone(cache.get('unknown'))
+        self.assertEqual(cache.stats(), {'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 5, 'hit_rate': 0.2857})
+
+        cache.warm()
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_changed_code_invalidated_in_every_worker(self):
+        worker, other_worker = QRCache(stamp_path=self.stamp_path), QRCache(stamp_path=self.stamp_path)
+        self.assertEqual(worker.warm(), 3)
+        self.assertEqual(other_worker.warm(), 3)
+        old_code = self.codes['EMP1']
+        self.assertEqual(other_worker.get(old_code)[1], 'EMP1')
+
+        employee = Employee.query.filter_by(pluri_id='EMP1').one()
+        employee.qr_data = new_qr_data('EMP1')
+        db.session.commit()
+        worker.invalidate(old_code)
+
+        # The other worker sees the stamp and drops its copy on its next lookup
+        self.assertIsNone(worker.get(old_code))
+        self.assertIsNone(other_worker.get(old_code))
+        self.assertEqual(other_worker.get(employee.qr_data), (employee.id, 'EMP1'))
+        self.assertEqual(other_worker.stats()['size'], 1)
+
+    def test_stats_endpoint(self):
+        stats = self.client.get('/api/qr_cache/stats').get_json()
+        self.assertEqual(set(stats), {'size', 'maxsize', 'hits', 'misses', 'hit_rate'})
+
+
+if __name__ == '__main__':
+    unittest.main()
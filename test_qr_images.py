@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+from fixtures import use_test_database, AppTestCase, generate_attendance
+use_test_database()
+from app import qr_images
+from models import db, User
+from qr_images import QRImageCache, qr_digest
+
+
+class TestQRImageCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_renders_once_per_content(self):
+        cache = QRImageCache(self.cache_dir, maxsize=1)
+        png, digest = cache.get('EMP_ABC123_1234')
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(digest, qr_digest('EMP_ABC123_1234'))
+        svg, _ = cache.get('EMP_ABC123_1234', 'svg')
+        self.assertIn(b'<svg', svg)
+        self.assertEqual(cache.renders, 2)
+
+        # The PNG fell out of memory but is read back from disk; another worker shares the files
+        self.assertEqual(cache.get('EMP_ABC123_1234')[0], png)
+        other_worker = QRImageCache(self.cache_dir)
+        self.assertEqual(other_worker.get('EMP_ABC123_1234', 'svg')[0], svg)
+        self.assertEqual((cache.renders, other_worker.renders), (2, 0))
+
+        cache.discard('EMP_ABC123_1234')
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class TestQRRoute(AppTestCase):
+    admin_logged_in = False
+
+    def create_data(self):
+        staff = User(username='user_EMP1', is_admin=False)
+        staff.set_password('EMP1')
+        db.session.add(staff)
+        db.session.commit()
+        employees = generate_attendance(employees=2, days=0, user=staff)
+        self.qr_data = [employee.generate_qr_code() for employee in employees][0]
+        db.session.commit()
+
+    def tearDown(self):
+        qr_images.discard(self.qr_data)
+        super().tearDown()
+
+    def test_versioned_urls_are_immutable(self):
+        self.login('admin', 'admin123')
+        page = self.client.get('/employees').get_data(as_text=True)
+        version = qr_digest(self.qr_data)[:16]
+        self.assertIn(f'/qr/EMP1.png?v={version}', page)
+
+        response = self.client.get(f'/qr/EMP1.png?v={version}')
+        self.assertEqual((response.status_code, response.mimetype), (200, 'image/png'))
+        self.assertEqual(response.headers['ETag'], f'"{qr_digest(self.qr_data)}"')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+        # Unversioned or stale links revalidate, and get a 304 without rendering
+        response = self.client.get('/qr/EMP1.svg')
+        self.assertEqual(response.mimetype, 'image/svg+xml')
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+        renders = qr_images.renders
+        response = self.client.get('/qr/EMP1.svg', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(qr_images.renders, renders)
+
+        self.assertEqual(self.client.get('/qr/NOPE.png').status_code, 404)
+        self.assertEqual(self.client.get('/qr/EMP1.gif').status_code, 404)
+
+    def test_employees_only_see_their_own_code(self):
+        self.assertEqual(self.client.get('/qr/EMP1.png').status_code, 302)
+        self.login('user_EMP1', 'EMP1')
+        self.assertEqual(self.client.get('/qr/EMP1.png').status_code, 200)
+        self.assertEqual(self.client.get('/qr/EMP2.png').status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
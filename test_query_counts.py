@@ -0,0 +1,112 @@
+import unittest
+from contextlib import contextmanager
+from datetime import time
+from sqlalchemy import event
+from fixtures import use_test_database, is_test_database, reset_database, create_admin, generate_attendance
+
+# The app binds its database at import time; give it a throwaway file
+use_test_database()
+
+from app import app, config, dashboard_metrics, handle_attendance
+from models import db, Attendance, DailyAttendanceSummary
+
+EMPLOYEES = 30
+
+# Upper bound of SQL statements per request, whatever the number of rows.
+# Every request also loads the logged-in user once.
+QUERY_BUDGETS = {
+    '/dashboard': 5,
+    '/employees': 2,
+    '/today_attendance': 3,
+    '/general': 1,
+    '/api/attendance?limit=50': 2,
+    '/api/report_data': 2,
+    '/activity-data?period=week': 2,
+    '/profile': 4,
+}
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect every statement sent to the database inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+class TestQueryCounts(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The fixtures wipe the tables, so never run against a real database
+        if not is_test_database(app):
+            raise unittest.SkipTest('app was already imported with another database')
+        app.config['TESTING'] = True
+        with app.app_context():
+            reset_database()
+            admin = create_admin('query-count-admin', 'password')
+            # The admin is also an employee so that /profile has data
+            generate_attendance(employees=EMPLOYEES, days=3, departments=['Dept 0', 'Dept 1', 'Dept 2'],
+                                check_in=time(8, 0), prefix='QC', user=admin)
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.client.post('/login', data={'username': 'query-count-admin', 'password': 'password'})
+        # Budgets are for a cold dashboard snapshot
+        dashboard_metrics.invalidate()
+
+    def test_endpoints_within_budget(self):
+        with app.app_context():
+            engine = db.engine
+        for url, budget in QUERY_BUDGETS.items():
+            with self.subTest(url=url):
+                with count_queries(engine) as statements:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                self.assertLessEqual(
+                    len(statements), budget,
+                    f'{url} ran {len(statements)} statements:\n' + '\n'.join(statements)
+                )
+
+    def test_dashboard_snapshot(self):
+        with app.app_context():
+            engine = db.engine
+        self.client.get('/dashboard')
+        with count_queries(engine) as statements:
+            response = self.client.get('/dashboard')
+        self.assertEqual(response.status_code, 200)
+        # Only the logged-in user is loaded while the snapshot is fresh
+        self.assertEqual(len(statements), 1, statements)
+
+        # A check-in refreshes it right away
+        with app.app_context():
+            employee = generate_attendance(employees=1, days=0, prefix='QCNEW')[0]
+            handle_attendance(employee.id)
+            snapshot = dashboard_metrics.get(config)
+            self.assertEqual(snapshot['total_employees'], EMPLOYEES + 1)
+            self.assertEqual(snapshot['present_employees'], EMPLOYEES + 1)
+            self.assertIn('QCNEW1', [row.pluri_id for row in snapshot['today_attendance']])
+
+            Attendance.query.filter_by(employee_id=employee.id).delete()
+            DailyAttendanceSummary.query.filter_by(employee_id=employee.id).delete()
+            db.session.delete(employee)
+            db.session.commit()
+
+    def test_rows_do_not_add_queries(self):
+        # Today's attendance lists one row per employee, so an N+1 would show here
+        with app.app_context():
+            engine = db.engine
+        with count_queries(engine) as statements:
+            response = self.client.get('/today_attendance')
+        self.assertEqual(len(response.get_json()), EMPLOYEES)
+        self.assertLess(len(statements), EMPLOYEES)
+
+
+if __name__ == '__main__':
+    unittest.main()
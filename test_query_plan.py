@@ -0,0 +1,116 @@
+import unittest
+from flask import Flask
+from models import db, Employee, Attendance, DailyAttendanceSummary
+from analytics import bucket_expression
+from pagination import keyset_query
+from reports import totals_query, detail_query
+from sqlalchemy import func
+from datetime import datetime, timedelta
+
+# Tables that grow with history; a full SCAN of any of them is a regression.
+# Employee is bounded by headcount, so report aggregations may walk it.
+LARGE_TABLES = ('attendance', 'daily_attendance_summary')
+
+
+class TestQueryPlans(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.now = datetime.now()
+        self.today_start = self.now.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.today_end = self.now.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def query_plan(self, query):
+        statement = getattr(query, 'statement', query)
+        compiled = statement.compile(dialect=db.engine.dialect)
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).fetchall()
+        return [row[3] for row in rows]
+
+    def assertNoScan(self, query):
+        plan = self.query_plan(query)
+        for detail in plan:
+            for table in LARGE_TABLES:
+                self.assertFalse(
+                    detail.startswith(f'SCAN {table}'),
+                    f'Full scan of {table}:\n' + '\n'.join(plan)
+                )
+        return plan
+
+    def test_handle_attendance_lookup(self):
+        plan = self.assertNoScan(Attendance.query.filter(
+            Attendance.employee_id == 1,
+            Attendance.check_in >= self.today_start,
+            Attendance.check_in <= self.today_end
+        ).limit(1))
+        self.assertTrue(any('ix_attendance_employee_check_in' in detail for detail in plan), plan)
+
+    def test_profile_history(self):
+        plan = self.assertNoScan(Attendance.query.filter(
+            Attendance.employee_id == 1,
+            Attendance.check_in < self.today_start
+        ).order_by(Attendance.check_in.desc()))
+        self.assertTrue(any('ix_attendance_employee_check_in' in detail for detail in plan), plan)
+
+    def test_today_attendance(self):
+        self.assertNoScan(Attendance.query.filter(
+            Attendance.check_in >= self.today_start,
+            Attendance.check_in <= self.today_end
+        ).order_by(Attendance.check_in.desc()))
+
+    def test_attendance_keyset_pages(self):
+        columns = [Attendance.check_in, Attendance.id]
+        query = Attendance.query.options(db.joinedload(Attendance.employee))
+        # The first unfiltered page walks the index in order and stops at the LIMIT
+        plan = self.query_plan(keyset_query(query, columns, limit=51))
+        self.assertIn('SCAN attendance USING INDEX ix_attendance_check_in', plan)
+        self.assertFalse(any('TEMP B-TREE' in detail for detail in plan), plan)
+        plan = self.assertNoScan(keyset_query(query.filter(
+            Attendance.check_in >= self.today_start - timedelta(days=30),
+            Attendance.check_out.is_(None)
+        ), columns, values=[self.now, 1000], limit=51))
+        self.assertFalse(any('TEMP B-TREE' in detail for detail in plan), plan)
+
+    def test_dashboard_today(self):
+        self.assertNoScan(Attendance.query.filter(Attendance.check_in >= self.today_start))
+        self.assertNoScan(DailyAttendanceSummary.query.filter(
+            DailyAttendanceSummary.date == self.now.date(),
+            DailyAttendanceSummary.is_late.is_(True)
+        ))
+
+    def test_activity_histogram(self):
+        bucket = bucket_expression(Attendance.check_in, 'day')
+        self.assertNoScan(db.session.query(bucket, func.count(Attendance.id)).filter(
+            Attendance.check_in >= self.today_start - timedelta(days=6),
+            Attendance.check_in < self.today_start + timedelta(days=1)
+        ).group_by(bucket))
+
+    def test_report_data_date_range(self):
+        date_range = {
+            'date_from': (self.now - timedelta(days=30)).strftime('%Y-%m-%d'),
+            'date_to': self.now.strftime('%Y-%m-%d'),
+        }
+        self.assertNoScan(totals_query(date_range))
+        self.assertNoScan(detail_query(date_range))
+
+    def test_report_export_walks_index_in_order(self):
+        plan = self.query_plan(detail_query({}))
+        self.assertFalse(any('TEMP B-TREE' in detail for detail in plan), plan)
+
+    def test_scan_qr_lookup(self):
+        plan = self.query_plan(Employee.query.filter_by(qr_data='EMP_TEST_1234').limit(1))
+        self.assertFalse(any(detail.startswith('SCAN employee') for detail in plan), plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,76 +1,31 @@
+import io
 import unittest
+from fixtures import use_test_database, is_test_database, reset_database, create_admin, generate_attendance
+use_test_database()
 from app import app, db
-from models import User, Employee, Attendance
-from datetime import datetime, timedelta
+from datetime import datetime, date
 import json
-import os
 
 class TestReportSystem(unittest.TestCase):
     def setUp(self):
+        if not is_test_database(app):
+            self.skipTest('app was already imported with another database')
         app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test_attendance.db'
         self.client = app.test_client()
-        
-        # Remove test database if it exists
-        if os.path.exists('test_attendance.db'):
-            os.remove('test_attendance.db')
-        
+
         with app.app_context():
-            db.create_all()
-            
-            # Create test admin user
-            admin = User.query.filter_by(username='admin').first()
-            if not admin:
-                admin = User(username='admin', is_admin=True)
-                admin.set_password('admin123')
-                db.session.add(admin)
-            
-            # Create test employees
+            reset_database()
+            create_admin('admin', 'admin123')
+
+            # 3 employees, each working 9 AM to 5 PM on the last 3 days
             departments = ['Administration et Direction', 'Personnel Médical', 'Personnel Paramédical']
             positions = ['Comptable', 'Médecin généraliste', 'Infirmier(ère) [soins généraux]']
-            
-            for i in range(3):
-                emp = Employee(
-                    pluri_id=f'EMP{i+1}',
-                    first_name=f'Test{i+1}',
-                    last_name=f'Employee{i+1}',
-                    email=f'emp{i+1}@test.com',
-                    phone=f'+123456789{i}',
-                    department=departments[i],
-                    position=positions[i],
-                    hire_date=datetime.now().date()
-                )
-                db.session.add(emp)
-            
-            db.session.commit()
-            
-            # Create test attendance records
-            employees = Employee.query.all()
-            today = datetime.now()
-            
-            for emp in employees:
-                for days_ago in range(3):
-                    date = today - timedelta(days=days_ago)
-                    check_in = date.replace(hour=9, minute=0, second=0)
-                    check_out = date.replace(hour=17, minute=0, second=0)
-                    
-                    attendance = Attendance(
-                        employee_id=emp.id,
-                        date=date.date(),
-                        check_in=check_in,
-                        check_out=check_out
-                    )
-                    db.session.add(attendance)
-            
-            db.session.commit()
+            generate_attendance(employees=3, days=3, departments=departments, positions=positions)
 
     def tearDown(self):
         with app.app_context():
             db.session.remove()
             db.drop_all()
-        # Remove test database
-        if os.path.exists('test_attendance.db'):
-            os.remove('test_attendance.db')
 
     def login(self):
         return self.client.post('/login', data={
@@ -132,5 +87,82 @@ class TestReportSystem(unittest.TestCase):
         # Verify total hours calculation
         self.assertAlmostEqual(record['total_hours'], 8.0, places=1)  # 9 AM to 5 PM = 8 hours
 
+    def test_report_totals(self):
+        self.login()
+        # As requested by the report page
+        response = self.client.get('/api/report_data?group_by=employee')
+        data = json.loads(response.data)['data']
+        self.assertEqual(len(data), 3)  # one row per employee
+        self.assertEqual(data[0]['pluri_id'], 'EMP1')
+        self.assertAlmostEqual(data[0]['total_hours'], 24.0)
+        self.assertEqual(data[0]['days_present'], 3)
+        self.assertNotIn('date', data[0])
+
+        response = self.client.get('/api/report_data?group_by=employee&department=Personnel+M%C3%A9dical')
+        data = json.loads(response.data)['data']
+        self.assertEqual([row['pluri_id'] for row in data], ['EMP2'])
+        self.assertAlmostEqual(data[0]['total_hours'], 24.0)
+
+    def test_report_group_by_period(self):
+        with app.app_context():
+            reset_database()
+            create_admin('admin', 'admin123')
+            # Monday 2024-01-01 to Sunday 2024-02-04: 5 weeks, 2 months
+            generate_attendance(employees=2, days=35, end=date(2024, 2, 4))
+        self.login()
+
+        data = json.loads(self.client.get('/api/report_data?group_by=week').data)['data']
+        self.assertEqual(len(data), 10)
+        self.assertEqual(data[0]['period'], '2024-01-01')
+        self.assertEqual(data[1]['period'], '2024-01-08')
+        self.assertAlmostEqual(data[0]['total_hours'], 56.0)
+        self.assertAlmostEqual(data[0]['employee_total_hours'], 280.0)
+
+        data = json.loads(self.client.get('/api/report_data?group_by=month&pluri_id=EMP2').data)['data']
+        self.assertEqual([(row['period'], row['days_present']) for row in data], [('2024-01', 31), ('2024-02', 4)])
+        self.assertAlmostEqual(data[1]['total_hours'], 32.0)
+
+        data = json.loads(self.client.get('/api/report_data?group_by=day&pluri_id=EMP1').data)['data']
+        self.assertEqual(len(data), 35)
+        self.assertEqual(data[0]['period'], '2024-01-01')
+
+    def test_report_detail_running_totals(self):
+        self.login()
+        response = self.client.get('/api/report_data?detail=true&group_by=week&pluri_id=EMP1')
+        data = json.loads(response.data)['data']
+        self.assertEqual([row['cumulative_hours'] for row in data], [8.0, 16.0, 24.0])
+        for row in data:
+            same_week = [other for other in data if other['period'] == row['period']]
+            self.assertAlmostEqual(row['period_total_hours'], 8.0 * len(same_week))
+
+    def test_report_pagination(self):
+        self.login()
+        response = self.client.get('/api/report_data?detail=true&page=2&per_page=4')
+        data = json.loads(response.data)
+        self.assertEqual((data['page'], data['per_page'], data['total']), (2, 4, 9))
+        self.assertEqual(len(data['data']), 4)
+
+        response = self.client.get('/api/report_data?detail=true&page=3&per_page=4')
+        self.assertEqual(len(json.loads(response.data)['data']), 1)
+
+    def test_report_bad_parameters(self):
+        self.login()
+        for query in ('group_by=year', 'page=0', 'page=abc', 'date_from=2024-13-01'):
+            response = self.client.get(f'/api/report_data?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_export_xlsx_streams(self):
+        from openpyxl import load_workbook
+        self.login()
+        response = self.client.get('/api/report_data/export?format=xlsx&detail=true', buffered=False)
+        self.assertEqual(response.mimetype, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        workbook = load_workbook(io.BytesIO(b''.join(response.response)), read_only=True)
+        rows = list(workbook['Rapport'].iter_rows(values_only=True))
+        self.assertEqual(rows[0][:2], ('PluriId', 'Nom complet'))
+        self.assertEqual(len(rows), 10)  # header + 3 employees * 3 days
+        self.assertEqual(rows[1][0], 'EMP1')
+        self.assertIsInstance(rows[1][4], datetime)
+        self.assertAlmostEqual(rows[1][7], 8.0)
+
 if __name__ == '__main__':
     unittest.main()
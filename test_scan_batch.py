@@ -0,0 +1,82 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from fixtures import use_test_database, AppTestCase, generate_attendance
+use_test_database()
+from app import app, qr_cache
+from models import db, Attendance, ScanEvent
+
+
+class TestScanBatch(AppTestCase):
+    def create_data(self):
+        employee = generate_attendance(employees=1, days=0)[0]
+        employee.generate_qr_code()
+        db.session.commit()
+        self.qr_data = employee.qr_data
+        qr_cache.invalidate()
+        self.check_in_at = datetime.now().replace(microsecond=0) - timedelta(minutes=2)
+
+    def event(self, event_id, minutes=0, **fields):
+        timestamp = self.check_in_at + timedelta(minutes=minutes)
+        return {'event_id': event_id, 'qr_data': self.qr_data, 'timestamp': timestamp.isoformat(),
+                'device_id': 'door-1', **fields}
+
+    def send(self, *events):
+        response = self.client.post('/api/scans/batch', json={'events': list(events)})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['results']
+
+    def attendance(self):
+        with app.app_context():
+            return [(row.check_in, row.check_out) for row in Attendance.query.all()]
+
+    def test_applies_in_timestamp_order(self):
+        # The terminal queued the check-out first
+        results = self.send(self.event('out', minutes=1), self.event('in'))
+        self.assertEqual([(result['status'], result['type']) for result in results],
+                         [('success', 'check_out'), ('success', 'check_in')])
+        self.assertEqual(self.attendance(), [(self.check_in_at, self.check_in_at + timedelta(minutes=1))])
+
+    def test_duplicates_and_replay(self):
+        results = self.send(self.event('in'), self.event('in'))
+        self.assertEqual([result['status'] for result in results], ['success', 'duplicate'])
+
+        # Retrying the whole batch reports the original results and changes nothing
+        results = self.send(self.event('in'), self.event('out', minutes=1))
+        self.assertEqual(results[0], {'event_id': 'in', 'status': 'duplicate', 'result': 'success',
+                                      'type': 'check_in', 'message': results[0]['message']})
+        self.assertEqual(results[1]['type'], 'check_out')
+        self.assertEqual(self.send(self.event('in'), self.event('out', minutes=1))[1]['status'], 'duplicate')
+        self.assertEqual(len(self.attendance()), 1)
+
+        # Without event_id, device, code and timestamp identify the event
+        anonymous = self.event(None, minutes=3)
+        self.assertEqual(self.send(anonymous)[0]['type'], 'check_out')
+        self.assertEqual(self.send(anonymous)[0]['status'], 'duplicate')
+
+    def test_rejects_oversized_ids(self):
+        results = self.send(self.event('x' * 101), self.event('in', device_id='d' * 101), self.event('ok'))
+        self.assertEqual([result['status'] for result in results], ['error', 'error', 'success'])
+        self.assertIn('event_id', results[0]['message'])
+        self.assertIn('device_id', results[1]['message'])
+
+    def test_concurrent_retry_is_a_duplicate(self):
+        get = qr_cache.get
+
+        def race(qr_data):
+            # Another request replaying the same batch records the event after our check
+            with db.engine.begin() as connection:
+                connection.execute(ScanEvent.__table__.insert().values(
+                    event_id='in', device_id='door-1', qr_data=qr_data, scanned_at=self.check_in_at,
+                    received_at=datetime.now(), status='success', type='check_in'))
+            return get(qr_data)
+
+        with mock.patch.object(qr_cache, 'get', side_effect=race):
+            results = self.send(self.event('in'))
+        self.assertEqual(results[0]['status'], 'duplicate')
+        # The savepoint undid this request's check-in
+        self.assertEqual(self.attendance(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import time
+import unittest
+from fixtures import use_test_database, is_test_database, reset_database
+use_test_database()
+from app import app, scheduled_jobs
+from models import db, Setting
+from scheduler_service import JobScheduler
+
+
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        if not is_test_database(app):
+            self.skipTest('app was already imported with another database')
+        with app.app_context():
+            reset_database()
+        self.lock_path = os.path.join(tempfile.mkdtemp(), 'scheduler.lock')
+        self.schedulers = []
+
+    def tearDown(self):
+        for scheduler in self.schedulers:
+            scheduler.shutdown()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def worker(self):
+        # One per gunicorn worker in production
+        scheduler = JobScheduler(app, lambda: db.engine, scheduled_jobs, self.lock_path, retry_interval=0.05)
+        self.schedulers.append(scheduler)
+        return scheduler
+
+    def stored_jobs(self, scheduler):
+        return {job.id: job for job in scheduler.scheduler.get_jobs(jobstore='default')}
+
+    def test_single_leader(self):
+        first, second = self.worker(), self.worker()
+        self.assertTrue(first.start())
+        self.assertFalse(second.start())
+        self.assertEqual(set(self.stored_jobs(first)), {'auto_close', 'backup', 'cleanup', 'rollup'})
+
+        # The standby takes over once the leader is gone, with the stored jobs
+        first.shutdown()
+        deadline = time.monotonic() + 5
+        while not second.is_leader and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(second.is_leader)
+        self.assertEqual(set(self.stored_jobs(second)), {'auto_close', 'backup', 'cleanup', 'rollup'})
+
+    def test_settings_change_schedule(self):
+        leader = self.worker()
+        leader.start()
+        backup = self.stored_jobs(leader)['backup']
+        self.assertEqual(str(backup.trigger), 'interval[1 day, 0:00:00]')
+
+        # Unchanged settings keep the next run time
+        leader.sync()
+        self.assertEqual(self.stored_jobs(leader)['backup'].next_run_time, backup.next_run_time)
+
+        # As saved by whichever worker served /backup/settings
+        with app.app_context():
+            Setting.set('backup_frequency', 'weekly')
+            db.session.commit()
+        leader.sync()
+        self.assertEqual(str(self.stored_jobs(leader)['backup'].trigger), 'interval[7 days, 0:00:00]')
+
+        with app.app_context():
+            Setting.set('backup_frequency', 'none')
+            db.session.commit()
+        leader.sync()
+        self.assertNotIn('backup', self.stored_jobs(leader))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
-from app import app
+from app import app, job_scheduler
+
+job_scheduler.start()
 
 if __name__ == "__main__":
     app.run()